@@ -1,5 +1,5 @@
 import { getConfig, setApiBase, setArcgisKey } from "./config.js";
-import { apiFetch, json, isAuthed, logout } from "./api.js";
+import { apiFetch, apiStream, json, isAuthed, logout } from "./api.js";
 import { el, toast, mdToHtml, showImageModal, fmtTime } from "./ui.js";
 
 const ICONS = {
@@ -446,23 +446,83 @@ async function ensureMe() {
   return state.me;
 }
 
+const CHAT_PAGE = 50;
+let chatCursor = null; // next_cursor of the last chats page, null when there are no more
+
 async function loadChats() {
   if (state.chats.length) return state.chats;
-  const r = await apiFetch("/chats");
+  const r = await apiFetch(`/chats?limit=${CHAT_PAGE}`);
   const j = await json(r);
   if (!r.ok) { toast("No se pudieron cargar los chats."); return []; }
-  state.chats = j || [];
+  state.chats = j?.items || [];
+  chatCursor = j?.next_cursor ?? null;
   if (!state.currentChatId && state.chats[0]) state.currentChatId = state.chats[0].id;
   return state.chats;
 }
 
+async function loadMoreChats() {
+  if (!chatCursor) return;
+  const r = await apiFetch(`/chats?limit=${CHAT_PAGE}&cursor=${encodeURIComponent(chatCursor)}`);
+  const j = await json(r);
+  if (!r.ok) { toast("No se pudieron cargar los chats."); return; }
+  const seen = new Set(state.chats.map(c => c.id));
+  state.chats = [...state.chats, ...(j.items || []).filter(c => !seen.has(c.id))];
+  chatCursor = j.next_cursor ?? null;
+}
+
+const MSG_PAGE = 50;
+const msgCursors = new Map(); // chatId -> id to pass as ?before= for older messages
+
 async function loadMessages(chatId) {
   if (state.messages.has(chatId)) return state.messages.get(chatId);
-  const r = await apiFetch(`/chats/${chatId}/messages`);
+  const r = await apiFetch(`/chats/${chatId}/messages?limit=${MSG_PAGE}`);
   const j = await json(r);
   if (!r.ok) { toast("No se pudieron cargar mensajes."); return []; }
-  state.messages.set(chatId, j || []);
-  return j || [];
+  const items = j?.items || [];
+  state.messages.set(chatId, items);
+  msgCursors.set(chatId, j?.next_cursor ?? null);
+  return items;
+}
+
+async function loadOlderMessages(chatId) {
+  const before = msgCursors.get(chatId);
+  if (!before) return;
+  const r = await apiFetch(`/chats/${chatId}/messages?limit=${MSG_PAGE}&before=${before}`);
+  const j = await json(r);
+  if (!r.ok) { toast("No se pudieron cargar mensajes."); return; }
+  state.messages.set(chatId, [...(j.items || []), ...(state.messages.get(chatId) || [])]);
+  msgCursors.set(chatId, j.next_cursor ?? null);
+}
+
+// Sends a message over /chats/{id}/messages/stream, showing the user's bubble and the reply
+// as its tokens arrive. Resolves true once the server sent "done"; on "done" or "error" the
+// caller reloads the stored messages, which replace these temporary bubbles.
+async function streamReply(box, chatId, fd, text) {
+  const userRow = el("div", { class: "bubbleRow user" }, [
+    el("div", { class: "bubble user" }, [el("div", { class: "md", html: mdToHtml(text || "📷") })])
+  ]);
+  const md = el("div", { class: "md", html: mdToHtml("…") });
+  box.appendChild(userRow);
+  box.appendChild(el("div", { class: "bubbleRow assistant" }, [el("div", { class: "bubble assistant" }, [md])]));
+  box.scrollTop = box.scrollHeight;
+
+  let reply = "", ok = false;
+  try {
+    await apiStream(`/chats/${chatId}/messages/stream`, { body: fd }, (event, data) => {
+      if (event === "token") {
+        reply += data.delta || "";
+        md.innerHTML = mdToHtml(reply);
+        box.scrollTop = box.scrollHeight;
+      } else if (event === "done") {
+        ok = !!data?.ok;
+      } else if (event === "error") {
+        toast(data.detail || "No se pudo generar la respuesta.");
+      }
+    });
+  } catch (e) {
+    toast(e.message || "No se pudo enviar.");
+  }
+  return ok;
 }
 
 /* -------------------- CHAT PAGE -------------------- */
@@ -573,15 +633,14 @@ function ChatPage() {
       state._lastLat = null; state._lastLon = null;
     }
 
-    const r = await apiFetch(`/chats/${chatId}/messages`, { method: "POST", body: fd });
-    const j = await json(r);
+    const ok = await streamReply(page.querySelector("#chatMsgs"), chatId, fd, text);
     btn.disabled = false; btn.textContent = "Enviar";
-    if (!r.ok || !j.ok) { toast(j.detail || "No se pudo enviar."); return; }
-
-    page.querySelector("#chatText").value = "";
-    page.querySelector("#chatFile").value = "";
-    const l = page.querySelector("#fileLabel");
-    if (l) { l.classList.remove("active"); l.textContent = "📷 Foto"; }
+    if (ok) {
+      page.querySelector("#chatText").value = "";
+      page.querySelector("#chatFile").value = "";
+      const l = page.querySelector("#fileLabel");
+      if (l) { l.classList.remove("active"); l.textContent = "📷 Foto"; }
+    }
 
     // Refresh messages cache for this chat
     state.messages.delete(chatId);
@@ -608,6 +667,16 @@ function ChatPage() {
       ]);
       wrap.appendChild(a);
     });
+    if (chatCursor) {
+      wrap.appendChild(el("div", { style: "text-align:center;margin:6px 0;" }, [
+        el("button", {
+          class: "btn secondary small", onclick: async () => {
+            await loadMoreChats();
+            drawChatList();
+          }
+        }, "Cargar más")
+      ]));
+    }
   }
 
   const GREETINGS = [
@@ -636,6 +705,19 @@ function ChatPage() {
       return;
     }
 
+    if (msgCursors.get(chatId)) {
+      box.appendChild(el("div", { style: "text-align:center;margin:6px 0;" }, [
+        el("button", {
+          class: "btn secondary small", onclick: async () => {
+            const prevHeight = box.scrollHeight;
+            await loadOlderMessages(chatId);
+            await drawMessages();
+            box.scrollTop = box.scrollHeight - prevHeight;
+          }
+        }, "Cargar anteriores")
+      ]));
+    }
+
     for (const m of msgs) {
       const isUser = m.role === "user";
       const row = el("div", { class: "bubbleRow " + (isUser ? "user" : "assistant") });
@@ -729,16 +811,15 @@ function RecognitionPage() {
     fd.append("text", q || "¿Qué es esto y cómo debo desecharlo o reciclarlo en Guayaquil?");
     fd.append("image", file);
 
-    const r = await apiFetch(`/chats/${state.recChatId}/messages`, { method: "POST", body: fd });
-    const j = await json(r);
+    const ok = await streamReply(page.querySelector("#recMsgs"), state.recChatId, fd, q);
     btn.disabled = false; btn.textContent = "Analizar";
-    if (!r.ok || !j.ok) { toast(j.detail || "No se pudo analizar."); return; }
-
-    page.querySelector("#recFile").value = "";
-    const l = page.querySelector("#recLabel");
-    if (l) { l.classList.remove("active"); l.innerHTML = "📷 Foto"; }
+    if (ok) {
+      page.querySelector("#recFile").value = "";
+      const l = page.querySelector("#recLabel");
+      if (l) { l.classList.remove("active"); l.innerHTML = "📷 Foto"; }
+      page.querySelector("#recQ").value = "";
+    }
 
-    page.querySelector("#recQ").value = "";
     state.messages.delete(state.recChatId);
     await renderRecHistory();
   }
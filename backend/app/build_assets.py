@@ -0,0 +1,60 @@
+"""Write .gz (and .br, when the brotli package is installed) next to each text brand asset.
+
+    python -m app.build_assets [--force]
+
+Run at deploy time after the brand files change; /brand serves a variant only while it is at
+least as new as its source. Variants that would not be smaller are skipped.
+"""
+import gzip
+import os
+import sys
+
+from .settings import get_settings
+from .utils.encoding import brotli
+
+COMPRESSIBLE = (".svg", ".css", ".js", ".json", ".txt", ".html")
+
+def _write(path: str, data: bytes) -> None:
+    tmp = path + ".part"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def build(directory: str, force: bool = False) -> list[dict]:
+    report = []
+    for name in sorted(os.listdir(directory)):
+        src = os.path.join(directory, name)
+        if not name.lower().endswith(COMPRESSIBLE) or not os.path.isfile(src):
+            continue
+        st = os.stat(src)
+        with open(src, "rb") as f:
+            body = f.read()
+        row = {"file": name, "bytes": st.st_size}
+        encoders = [("gz", lambda b: gzip.compress(b, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.append(("br", lambda b: brotli.compress(b, quality=11)))
+        for suffix, encode in encoders:
+            dest = f"{src}.{suffix}"
+            if not force and os.path.exists(dest) and os.stat(dest).st_mtime >= st.st_mtime:
+                row[suffix] = os.path.getsize(dest)
+                continue
+            out = encode(body)
+            if len(out) >= len(body):
+                continue
+            _write(dest, out)
+            row[suffix] = len(out)
+        report.append(row)
+    return report
+
+def main() -> int:
+    s = get_settings()
+    report = build(s.brand_dir, force="--force" in sys.argv[1:])
+    for row in report:
+        sizes = "  ".join(f"{k}={row[k]:>9,}" for k in ("bytes", "gz", "br") if k in row)
+        print(f"{row['file']:<24} {sizes}")
+    if brotli is None:
+        print("brotli no está instalado: solo se generaron variantes .gz")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,75 +1,16 @@
 import sqlite3
-from .settings import Settings
-
-SCHEMA = """
-PRAGMA journal_mode=WAL;
-
-CREATE TABLE IF NOT EXISTS users (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  email TEXT UNIQUE NOT NULL,
-  username TEXT UNIQUE NOT NULL,
-  password_hash TEXT NOT NULL,
-  bio TEXT DEFAULT '',
-  avatar_path TEXT,
-  is_verified INTEGER NOT NULL DEFAULT 0,
-  created_at TEXT NOT NULL,
-  updated_at TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS email_otps (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  email TEXT NOT NULL,
-  purpose TEXT NOT NULL, -- verify_email | reset_password
-  code_hash TEXT NOT NULL,
-  expires_at TEXT NOT NULL,
-  attempts INTEGER NOT NULL DEFAULT 0,
-  created_at TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS refresh_tokens (
-  token_hash TEXT PRIMARY KEY,
-  user_id INTEGER NOT NULL,
-  expires_at TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS chats (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  user_id INTEGER NOT NULL,
-  title TEXT NOT NULL,
-  created_at TEXT NOT NULL,
-  updated_at TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS messages (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  chat_id INTEGER NOT NULL,
-  role TEXT NOT NULL,
-  content TEXT NOT NULL,
-  image_path TEXT,
-  created_at TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS points (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  name TEXT NOT NULL,
-  address TEXT NOT NULL,
-  lat REAL,
-  lon REAL,
-  category TEXT NOT NULL,
-  notes TEXT DEFAULT '',
-  source_url TEXT DEFAULT '',
-  updated_at TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS contacts (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  email TEXT,
-  message TEXT NOT NULL,
-  created_at TEXT NOT NULL
-);
-"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+import anyio
+
+from .settings import Settings, get_settings
+from .migrations import migrate
 
 def get_conn(s: Settings) -> sqlite3.Connection:
+    """Open a raw connection. Request handlers should use the pool (get_db / db_session) instead."""
     conn = sqlite3.connect(s.db_path, check_same_thread=False, timeout=30)
     conn.row_factory = sqlite3.Row
     try:
@@ -81,6 +22,153 @@ def get_conn(s: Settings) -> sqlite3.Connection:
 
 def init_db(s: Settings) -> None:
     conn = get_conn(s)
-    conn.executescript(SCHEMA)
-    conn.commit()
+    # Only takes effect on a brand-new file; existing databases need `python -m app.services.sweeper --full-vacuum` once.
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+    conn.execute("PRAGMA journal_mode=WAL;")
+    migrate(conn)
     conn.close()
+
+# ---- Connection pool ----
+
+class PoolTimeout(RuntimeError):
+    pass
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections. PRAGMAs run once, when a connection is opened."""
+
+    def __init__(self, s: Settings, size: int, timeout: float):
+        self._settings = s
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle: list[sqlite3.Connection] = []
+        self._cond = threading.Condition()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+
+    def _take(self) -> sqlite3.Connection:
+        if self._idle:
+            conn = self._idle.pop()
+        else:
+            conn = get_conn(self._settings)
+            self._created += 1
+        self._in_use += 1
+        self._checkouts += 1
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        waited_since = None
+        with self._cond:
+            while not self._idle and self._created >= self.size:
+                if waited_since is None:
+                    waited_since = time.monotonic()
+                    self._waits += 1
+                remaining = self.timeout - (time.monotonic() - waited_since)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._created >= self.size:
+                        self._timeouts += 1
+                        self._wait_time += time.monotonic() - waited_since
+                        raise PoolTimeout("database connection pool exhausted")
+            if waited_since is not None:
+                waited = time.monotonic() - waited_since
+                self._wait_time += waited
+                self._max_wait = max(self._max_wait, waited)
+            return self._take()
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            broken = False
+        except sqlite3.Error:
+            broken = True
+        with self._cond:
+            self._in_use -= 1
+            if broken:
+                self._created -= 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check out a connection; commit on success, roll back on error, always return it."""
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_s": round(self._wait_time, 6),
+                "max_wait_s": round(self._max_wait, 6),
+                "timeouts": self._timeouts,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            for conn in self._idle:
+                conn.close()
+            self._created -= len(self._idle)
+            self._idle.clear()
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(s: Settings) -> ConnectionPool:
+    pool = _pools.get(s.db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(s.db_path)
+            if pool is None:
+                pool = ConnectionPool(s, s.db_pool_size, s.db_pool_timeout)
+                _pools[s.db_path] = pool
+    return pool
+
+def close_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+def db_session(s: Settings | None = None):
+    """Short-lived pooled connection for code that is not a request-scoped dependency."""
+    return get_pool(s or get_settings()).connection()
+
+T = TypeVar("T")
+
+async def run_in_db(fn: Callable[[sqlite3.Connection], T], s: Settings | None = None) -> T:
+    """db_session for async handlers and tasks: run ``fn(conn)`` in a worker thread and return its
+    result. Both the wait for a free connection and every statement (which may sit in
+    busy_timeout) stay off the event loop. Exceptions from fn roll back and propagate."""
+    settings = s or get_settings()
+
+    def work() -> T:
+        with db_session(settings) as conn:
+            return fn(conn)
+
+    return await anyio.to_thread.run_sync(work)
+
+# ---- FastAPI dependency ----
+
+def get_db() -> Iterator[sqlite3.Connection]:
+    """Per-request pooled connection, committed when the handler returns."""
+    with db_session() as conn:
+        yield conn
@@ -0,0 +1,305 @@
+"""Versioned schema migrations.
+
+The applied version lives in ``PRAGMA user_version``. Each migration runs in its own
+transaction, so a failed step leaves the database at the previous version.
+Append new migrations to ``MIGRATIONS``; never edit one that has shipped.
+"""
+import sqlite3
+import sys
+
+_V1_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  email TEXT UNIQUE NOT NULL,
+  username TEXT UNIQUE NOT NULL,
+  password_hash TEXT NOT NULL,
+  bio TEXT DEFAULT '',
+  avatar_path TEXT,
+  is_verified INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS email_otps (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  email TEXT NOT NULL,
+  purpose TEXT NOT NULL, -- verify_email | reset_password
+  code_hash TEXT NOT NULL,
+  expires_at TEXT NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+  token_hash TEXT PRIMARY KEY,
+  user_id INTEGER NOT NULL,
+  expires_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS chats (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  title TEXT NOT NULL,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  chat_id INTEGER NOT NULL,
+  role TEXT NOT NULL,
+  content TEXT NOT NULL,
+  image_path TEXT,
+  created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS points (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name TEXT NOT NULL,
+  address TEXT NOT NULL,
+  lat REAL,
+  lon REAL,
+  category TEXT NOT NULL,
+  notes TEXT DEFAULT '',
+  source_url TEXT DEFAULT '',
+  updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS contacts (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  email TEXT,
+  message TEXT NOT NULL,
+  created_at TEXT NOT NULL
+);
+"""
+
+_V2_HOT_QUERY_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages(chat_id, id);
+CREATE INDEX IF NOT EXISTS idx_chats_user_updated ON chats(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_email_otps_email_purpose ON email_otps(email, purpose);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user ON refresh_tokens(user_id);
+CREATE INDEX IF NOT EXISTS idx_users_email_lower ON users(lower(email));
+CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users(lower(username));
+"""
+
+_V3_VISION_CACHE = """
+CREATE TABLE IF NOT EXISTS vision_cache (
+  key TEXT PRIMARY KEY,        -- sha256(image bytes | model | prompt)
+  variant TEXT NOT NULL,       -- sha256(model | prompt), scopes near-duplicate matches
+  phash INTEGER,               -- 64-bit dHash (signed), NULL when Pillow is unavailable
+  result TEXT NOT NULL,
+  hits INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT NOT NULL,
+  last_used_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_vision_cache_last_used ON vision_cache(last_used_at);
+CREATE INDEX IF NOT EXISTS idx_vision_cache_variant ON vision_cache(variant, phash);
+"""
+
+_V4_ANSWER_CACHE = """
+CREATE TABLE IF NOT EXISTS answer_cache (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  variant TEXT NOT NULL,       -- sha256(model | system prompt)
+  question TEXT NOT NULL,
+  normalized TEXT NOT NULL,
+  answer TEXT NOT NULL,
+  hits INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_answer_cache_created ON answer_cache(created_at);
+"""
+
+_V5_CHAT_SUMMARIES = """
+CREATE TABLE IF NOT EXISTS chat_summaries (
+  chat_id INTEGER PRIMARY KEY,
+  summary TEXT NOT NULL,
+  upto_message_id INTEGER NOT NULL,  -- last message folded into the summary
+  updated_at TEXT NOT NULL
+);
+"""
+
+_V6_TOKEN_EPOCH = """
+-- Bumped by logout-everywhere; access tokens carrying an older epoch are rejected.
+ALTER TABLE users ADD COLUMN token_epoch INTEGER NOT NULL DEFAULT 0;
+"""
+
+_V7_EXPIRY_INDEXES = """
+-- Let the background sweeper find expired rows without scanning.
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires ON refresh_tokens(expires_at);
+CREATE INDEX IF NOT EXISTS idx_email_otps_expires ON email_otps(expires_at);
+"""
+
+_V8_CATALOGUE_VERSION = """
+-- Bumped by triggers on every write to points, including ones made outside the app (python -m app.seed).
+CREATE TABLE IF NOT EXISTS catalogue_version (
+  name TEXT PRIMARY KEY,
+  version INTEGER NOT NULL,
+  changed_at TEXT NOT NULL
+);
+INSERT OR IGNORE INTO catalogue_version(name,version,changed_at) VALUES('points',1,strftime('%Y-%m-%dT%H:%M:%SZ','now'));
+CREATE TRIGGER IF NOT EXISTS trg_points_insert AFTER INSERT ON points BEGIN
+  UPDATE catalogue_version SET version=version+1, changed_at=strftime('%Y-%m-%dT%H:%M:%SZ','now') WHERE name='points';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_points_update AFTER UPDATE ON points BEGIN
+  UPDATE catalogue_version SET version=version+1, changed_at=strftime('%Y-%m-%dT%H:%M:%SZ','now') WHERE name='points';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_points_delete AFTER DELETE ON points BEGIN
+  UPDATE catalogue_version SET version=version+1, changed_at=strftime('%Y-%m-%dT%H:%M:%SZ','now') WHERE name='points';
+END;
+"""
+
+_V9_GEOCODE_CACHE = """
+-- Address -> coordinates, so geocode-missing never asks ArcGIS twice for the same address.
+CREATE TABLE IF NOT EXISTS geocode_cache (
+  query TEXT PRIMARY KEY,   -- normalized single-line address
+  lat REAL,                 -- NULL when the geocoder found no candidate
+  lon REAL,
+  created_at TEXT NOT NULL
+);
+"""
+
+_V10_EMAIL_OUTBOX = """
+-- Written in the same transaction as the OTP / contact row; drained by services.outbox.
+CREATE TABLE IF NOT EXISTS email_outbox (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  idempotency_key TEXT NOT NULL UNIQUE,
+  to_email TEXT NOT NULL,
+  subject TEXT NOT NULL,
+  html TEXT NOT NULL,            -- cleared once sent (it may contain an OTP)
+  status TEXT NOT NULL DEFAULT 'pending',  -- pending | sending | sent | skipped | dead
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at TEXT NOT NULL,  -- also the lease deadline while 'sending'
+  last_error TEXT,
+  created_at TEXT NOT NULL,
+  sent_at TEXT,
+  purge_after TEXT               -- set on sent/skipped/dead; the sweeper deletes the row after it
+);
+CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_email_outbox_purge ON email_outbox(purge_after);
+"""
+
+_V11_UPLOADS = """
+-- Content-addressed upload store (services.blobs). refcount follows messages.image_path and
+-- users.avatar_path through triggers; rows at 0 past the grace period are collected by the sweeper.
+CREATE TABLE IF NOT EXISTS uploads (
+  hash TEXT PRIMARY KEY,        -- sha256 of the bytes
+  path TEXT NOT NULL UNIQUE,    -- relative to upload_dir: blobs/ab/cd/<hash>.<ext>
+  size INTEGER NOT NULL,
+  mime TEXT,
+  refcount INTEGER NOT NULL DEFAULT 0,
+  variants INTEGER NOT NULL DEFAULT 0,  -- bit 1: thumbnail, bit 2: webp
+  created_at TEXT NOT NULL,
+  touched_at TEXT NOT NULL      -- last upload or release; the sweeper's grace period starts here
+);
+CREATE INDEX IF NOT EXISTS idx_uploads_unreferenced ON uploads(touched_at) WHERE refcount<=0;
+CREATE TRIGGER IF NOT EXISTS trg_messages_upload_ref AFTER INSERT ON messages WHEN NEW.image_path IS NOT NULL BEGIN
+  UPDATE uploads SET refcount=refcount+1 WHERE path=NEW.image_path;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_messages_upload_unref AFTER DELETE ON messages WHEN OLD.image_path IS NOT NULL BEGIN
+  UPDATE uploads SET refcount=refcount-1, touched_at=strftime('%Y-%m-%dT%H:%M:%f+00:00','now') WHERE path=OLD.image_path;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_messages_upload_swap AFTER UPDATE OF image_path ON messages WHEN OLD.image_path IS NOT NEW.image_path BEGIN
+  UPDATE uploads SET refcount=refcount-1, touched_at=strftime('%Y-%m-%dT%H:%M:%f+00:00','now') WHERE path=OLD.image_path;
+  UPDATE uploads SET refcount=refcount+1 WHERE path=NEW.image_path;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_users_avatar_ref AFTER INSERT ON users WHEN NEW.avatar_path IS NOT NULL BEGIN
+  UPDATE uploads SET refcount=refcount+1 WHERE path=NEW.avatar_path;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_users_avatar_unref AFTER DELETE ON users WHEN OLD.avatar_path IS NOT NULL BEGIN
+  UPDATE uploads SET refcount=refcount-1, touched_at=strftime('%Y-%m-%dT%H:%M:%f+00:00','now') WHERE path=OLD.avatar_path;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_users_avatar_swap AFTER UPDATE OF avatar_path ON users WHEN OLD.avatar_path IS NOT NEW.avatar_path BEGIN
+  UPDATE uploads SET refcount=refcount-1, touched_at=strftime('%Y-%m-%dT%H:%M:%f+00:00','now') WHERE path=OLD.avatar_path;
+  UPDATE uploads SET refcount=refcount+1 WHERE path=NEW.avatar_path;
+END;
+"""
+
+_V12_APP_META = """
+-- Per-database values. install_id prefixes provider idempotency keys, so outbox keys that
+-- restart from 1 after a database reset (or on another install sharing the Resend account)
+-- are not taken for repeats of earlier emails.
+CREATE TABLE IF NOT EXISTS app_meta (
+  key TEXT PRIMARY KEY,
+  value TEXT NOT NULL
+);
+INSERT OR IGNORE INTO app_meta(key,value) VALUES('install_id', lower(hex(randomblob(16))));
+"""
+
+MIGRATIONS: list[tuple[int, str, str]] = [
+    (1, "initial schema", _V1_SCHEMA),
+    (2, "indexes for hot queries", _V2_HOT_QUERY_INDEXES),
+    (3, "vision analysis cache", _V3_VISION_CACHE),
+    (4, "semantic answer cache", _V4_ANSWER_CACHE),
+    (5, "rolling chat summaries", _V5_CHAT_SUMMARIES),
+    (6, "per-user token epoch", _V6_TOKEN_EPOCH),
+    (7, "expiry indexes for the sweeper", _V7_EXPIRY_INDEXES),
+    (8, "points catalogue version", _V8_CATALOGUE_VERSION),
+    (9, "geocode cache", _V9_GEOCODE_CACHE),
+    (10, "email outbox", _V10_EMAIL_OUTBOX),
+    (11, "content-addressed uploads", _V11_UPLOADS),
+    (12, "install id", _V12_APP_META),
+]
+
+# Queries on the request path that must be served from an index, with sample params.
+HOT_QUERIES: list[tuple[str, str, tuple]] = [
+    ("messages by chat", "SELECT m.id,m.role,m.content,m.image_path,m.created_at,u.variants FROM messages m LEFT JOIN uploads u ON u.path=m.image_path WHERE m.chat_id=? ORDER BY m.id ASC", (1,)),
+    ("messages page (before)", "SELECT m.id,m.role,m.content,m.image_path,m.created_at,u.variants FROM messages m LEFT JOIN uploads u ON u.path=m.image_path WHERE m.chat_id=? AND m.id<? ORDER BY m.id DESC LIMIT ?", (1, 100, 51)),
+    ("messages page (after)", "SELECT m.id,m.role,m.content,m.image_path,m.created_at,u.variants FROM messages m LEFT JOIN uploads u ON u.path=m.image_path WHERE m.chat_id=? AND m.id>? ORDER BY m.id ASC LIMIT ?", (1, 0, 51)),
+    ("last message id", "SELECT MAX(id) AS m FROM messages WHERE chat_id=?", (1,)),
+    ("chats by user", "SELECT id,title FROM chats WHERE user_id=? ORDER BY updated_at DESC", (1,)),
+    ("chats page", "SELECT id,title,updated_at FROM chats WHERE user_id=? ORDER BY updated_at DESC, id DESC LIMIT ?", (1, 51)),
+    ("chats page (cursor)", "SELECT id,title,updated_at FROM chats WHERE user_id=? AND (updated_at<? OR (updated_at=? AND id<?)) ORDER BY updated_at DESC, id DESC LIMIT ?", (1, "z", "z", 1, 51)),
+    ("otp by email+purpose", "SELECT id,code_hash,expires_at,attempts FROM email_otps WHERE email=? AND purpose=? ORDER BY id DESC LIMIT 1", ("a@b.c", "verify_email")),
+    ("refresh tokens by user", "SELECT token_hash FROM refresh_tokens WHERE user_id=?", (1,)),
+    ("login lookup", "SELECT id,email,username,password_hash,is_verified FROM users WHERE lower(email)=? OR lower(username)=?", ("a", "a")),
+]
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("PRAGMA user_version").fetchone()[0])
+
+def migrate(conn: sqlite3.Connection) -> list[int]:
+    """Apply pending migrations in order. Returns the versions that were applied."""
+    applied = []
+    version = current_version(conn)
+    for v, _name, sql in MIGRATIONS:
+        if v <= version:
+            continue
+        try:
+            # executescript commits any open transaction first, so BEGIN/COMMIT here is atomic.
+            conn.executescript(f"BEGIN;\n{sql}\nPRAGMA user_version={v};\nCOMMIT;")
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        applied.append(v)
+    return applied
+
+def explain_hot_queries(conn: sqlite3.Connection) -> list[dict]:
+    """EXPLAIN QUERY PLAN for each hot query; ``full_scan`` is True if any step is a SCAN,
+    including ``SCAN t USING INDEX`` (a walk over the whole index, not a search)."""
+    out = []
+    for name, sql, params in HOT_QUERIES:
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+        full_scan = any(step.startswith("SCAN ") for step in plan)
+        out.append({"name": name, "plan": plan, "full_scan": full_scan})
+    return out
+
+def main() -> int:
+    # python -m app.migrations          -> migrate and print the plan of every hot query
+    # exits non-zero if any hot query scans a table or a whole index
+    from .settings import get_settings
+    from .db import init_db, get_conn
+    s = get_settings()
+    init_db(s)
+    conn = get_conn(s)
+    print(f"schema version {current_version(conn)}")
+    failed = 0
+    for q in explain_hot_queries(conn):
+        status = "FULL SCAN" if q["full_scan"] else "ok"
+        failed += q["full_scan"]
+        print(f"[{status}] {q['name']}: {' | '.join(q['plan'])}")
+    conn.close()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
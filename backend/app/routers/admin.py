@@ -0,0 +1,84 @@
+from fastapi import APIRouter, HTTPException, Query
+
+from ..settings import get_settings, reload_settings, restart_pending
+from ..db import get_pool
+from ..services import groq, vision_cache, images, blobs
+from ..services.answer_cache import answer_cache
+from ..services.sweeper import sweeper
+from ..services.outbox import outbox
+from ..utils.passwords import hasher
+from ..utils.tokens import token_cache_stats
+
+router = APIRouter()
+
+def _check_admin(admin_key: str) -> None:
+    if admin_key != get_settings().admin_api_key:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@router.post("/reload-settings")
+def reload(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    s = reload_settings()
+    return {"ok": True, "chat_model": s.chat_model, "vision_model": s.vision_model, "restart_required": restart_pending()}
+
+@router.get("/db-pool")
+def db_pool(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    return get_pool(get_settings()).stats()
+
+@router.get("/llm-bulkheads")
+def llm_bulkheads(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    return {"chat": groq.chat_bulkhead.stats(), "vision": groq.vision_bulkhead.stats()}
+
+@router.get("/vision-cache")
+def vision_cache_stats(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    return vision_cache.stats()
+
+@router.get("/images")
+def image_stats(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    return {**images.stats(), "store": blobs.stats(get_settings())}
+
+@router.get("/answer-cache")
+def answer_cache_stats(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    return answer_cache.stats()
+
+@router.delete("/answer-cache")
+def answer_cache_purge(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    return {"ok": True, "purged": answer_cache.purge(get_settings())}
+
+@router.get("/password-hashing")
+def password_hashing(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    return hasher.stats()
+
+@router.get("/token-cache")
+def token_cache(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    return token_cache_stats()
+
+@router.get("/sweeper")
+def sweeper_stats(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    return sweeper.stats()
+
+@router.post("/sweeper/run")
+async def sweeper_run(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    return await sweeper.run_once()
+
+@router.get("/email-outbox")
+def email_outbox(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    return outbox.stats(get_settings())
+
+@router.post("/email-outbox/{outbox_id}/retry")
+def email_outbox_retry(outbox_id: int, admin_key: str = Query(..., description="ADMIN_API_KEY")):
+    _check_admin(admin_key)
+    if not outbox.retry(get_settings(), outbox_id):
+        raise HTTPException(status_code=404, detail="No hay un correo descartado con ese id.")
+    return {"ok": True}
@@ -1,13 +1,18 @@
+import sqlite3
 from datetime import datetime, timezone, timedelta
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, EmailStr, Field
 
-from ..settings import Settings
-from ..db import get_conn
-from ..utils.passwords import hash_password, verify_password
+from ..settings import get_settings
+from ..db import get_db, run_in_db
+from ..utils.passwords import hasher
 from ..utils.otp import generate_code, code_hash, expires_in
-from ..utils.tokens import make_access_token, make_refresh_token, store_refresh, revoke_refresh, verify_refresh
-from ..services.mailer import send_otp_email
+from ..utils.tokens import (
+    make_access_token, make_refresh_token, store_refresh, revoke_refresh, verify_refresh,
+    get_current_user_id, bump_user_epoch,
+)
+from ..services.mailer import render_otp_email
+from ..services.outbox import enqueue, outbox
 
 router = APIRouter()
 
@@ -26,15 +31,12 @@ class ResendVerifyIn(BaseModel):
     email: EmailStr
 
 @router.post("/resend-verification")
-def resend_verification(body: ResendVerifyIn):
-    s = Settings.load()
-    conn = get_conn(s)
+def resend_verification(body: ResendVerifyIn, conn: sqlite3.Connection = Depends(get_db)):
+    s = get_settings()
     user = conn.execute("SELECT is_verified FROM users WHERE email=?", (body.email.lower(),)).fetchone()
     if not user:
-        conn.close()
         return {"ok": True}
     if int(user["is_verified"]) == 1:
-        conn.close()
         return {"ok": True, "message": "Tu correo ya está verificado."}
 
     code = generate_code()
@@ -43,25 +45,13 @@ def resend_verification(body: ResendVerifyIn):
     now = _utcnow().isoformat()
 
     conn.execute("DELETE FROM email_otps WHERE email=? AND purpose=?", (body.email.lower(), "verify_email"))
-    conn.execute(
+    cur = conn.execute(
         "INSERT INTO email_otps(email,purpose,code_hash,expires_at,attempts,created_at) VALUES(?,?,?,?,?,?)",
         (body.email.lower(), "verify_email", ch, exp, 0, now),
     )
+    _queue_otp(s, conn, cur.lastrowid, body.email, "verify_email", code)
     conn.commit()
-    conn.close()
-
-    send_otp_email(
-        public_base_url=s.public_base_url,
-        resend_api_key=s.resend_api_key,
-        resend_from=s.resend_from,
-        to_email=body.email,
-        purpose="verify_email",
-        code=code,
-        contact_email=s.contact_email,
-        whatsapp_link=s.whatsapp_link,
-        terms_url=s.terms_url,
-        privacy_url=s.privacy_url,
-    )
+    outbox.wake()
     return {"ok": True}
 
 class LoginIn(BaseModel):
@@ -82,75 +72,70 @@ class ResetIn(BaseModel):
 def _utcnow():
     return datetime.now(timezone.utc)
 
+def _queue_otp(s, conn, otp_id: int, to_email: str, purpose: str, code: str) -> None:
+    # Same transaction as the OTP row; the outbox sender delivers it after commit.
+    subject, html = render_otp_email(
+        s.public_base_url, purpose, code, s.contact_email, s.whatsapp_link, s.terms_url, s.privacy_url,
+    )
+    enqueue(conn, f"otp-{purpose}-{otp_id}", to_email, subject, html)
+
 @router.post("/register")
-def register(body: RegisterIn):
-    s = Settings.load()
-    conn = get_conn(s)
+async def register(body: RegisterIn):
+    s = get_settings()
     # Enforce uniqueness
-    if conn.execute("SELECT 1 FROM users WHERE email=?", (body.email.lower(),)).fetchone():
-        conn.close()
-        raise HTTPException(status_code=400, detail="El correo ya está registrado.")
-    if conn.execute("SELECT 1 FROM users WHERE username=?", (body.username,)).fetchone():
-        conn.close()
-        raise HTTPException(status_code=400, detail="El username ya está en uso.")
-
+    def check_unique(conn):
+        if conn.execute("SELECT 1 FROM users WHERE email=?", (body.email.lower(),)).fetchone():
+            raise HTTPException(status_code=400, detail="El correo ya está registrado.")
+        if conn.execute("SELECT 1 FROM users WHERE username=?", (body.username,)).fetchone():
+            raise HTTPException(status_code=400, detail="El username ya está en uso.")
+    await run_in_db(check_unique, s)
+
+    # Hash without holding a pooled connection
+    pw_hash = await hasher.hash(body.password, s.password_pepper)
     now = _utcnow().isoformat()
-    pw_hash = hash_password(body.password, s.password_pepper)
-    conn.execute(
-        "INSERT INTO users(email,username,password_hash,bio,avatar_path,is_verified,created_at,updated_at) VALUES(?,?,?,?,?,?,?,?)",
-        (body.email.lower(), body.username, pw_hash, body.bio or "", None, 0, now, now),
-    )
-    conn.commit()
-
-    # Create verification OTP
     code = generate_code()
     ch = code_hash(body.email, "verify_email", code, s.password_pepper)
     exp = expires_in(10)
-    conn.execute("DELETE FROM email_otps WHERE email=? AND purpose=?", (body.email.lower(), "verify_email"))
-    conn.execute(
-        "INSERT INTO email_otps(email,purpose,code_hash,expires_at,attempts,created_at) VALUES(?,?,?,?,?,?)",
-        (body.email.lower(), "verify_email", ch, exp, 0, now),
-    )
-    conn.commit()
-    conn.close()
-
-    send_otp_email(
-        public_base_url=s.public_base_url,
-        resend_api_key=s.resend_api_key,
-        resend_from=s.resend_from,
-        to_email=body.email,
-        purpose="verify_email",
-        code=code,
-        contact_email=s.contact_email,
-        whatsapp_link=s.whatsapp_link,
-        terms_url=s.terms_url,
-        privacy_url=s.privacy_url,
-    )
+
+    def create(conn):
+        try:
+            conn.execute(
+                "INSERT INTO users(email,username,password_hash,bio,avatar_path,is_verified,created_at,updated_at) VALUES(?,?,?,?,?,?,?,?)",
+                (body.email.lower(), body.username, pw_hash, body.bio or "", None, 0, now, now),
+            )
+        except sqlite3.IntegrityError:
+            # Lost a race with a concurrent registration while hashing
+            raise HTTPException(status_code=400, detail="El correo o username ya está en uso.")
+
+        # Create verification OTP
+        conn.execute("DELETE FROM email_otps WHERE email=? AND purpose=?", (body.email.lower(), "verify_email"))
+        cur = conn.execute(
+            "INSERT INTO email_otps(email,purpose,code_hash,expires_at,attempts,created_at) VALUES(?,?,?,?,?,?)",
+            (body.email.lower(), "verify_email", ch, exp, 0, now),
+        )
+        _queue_otp(s, conn, cur.lastrowid, body.email, "verify_email", code)
+    await run_in_db(create, s)
+    outbox.wake()
     return {"ok": True, "message": "Te enviamos un código para verificar tu correo."}
 
 @router.post("/verify-email")
-def verify_email(body: VerifyEmailIn):
-    s = Settings.load()
-    conn = get_conn(s)
+def verify_email(body: VerifyEmailIn, conn: sqlite3.Connection = Depends(get_db)):
+    s = get_settings()
     row = conn.execute(
         "SELECT id,code_hash,expires_at,attempts FROM email_otps WHERE email=? AND purpose=? ORDER BY id DESC LIMIT 1",
         (body.email.lower(), "verify_email"),
     ).fetchone()
     if not row:
-        conn.close()
         raise HTTPException(status_code=400, detail="Código inválido.")
     if datetime.fromisoformat(row["expires_at"]) < _utcnow():
-        conn.close()
         raise HTTPException(status_code=400, detail="Código expirado.")
     if int(row["attempts"]) >= 8:
-        conn.close()
         raise HTTPException(status_code=429, detail="Demasiados intentos. Solicita un nuevo código.")
 
     expected = code_hash(body.email, "verify_email", body.code, s.password_pepper)
     if expected != row["code_hash"]:
         conn.execute("UPDATE email_otps SET attempts=attempts+1 WHERE id=?", (row["id"],))
         conn.commit()
-        conn.close()
         raise HTTPException(status_code=400, detail="Código inválido.")
 
     # mark verified
@@ -159,62 +144,74 @@ def verify_email(body: VerifyEmailIn):
     # issue tokens
     user = conn.execute("SELECT id FROM users WHERE email=?", (body.email.lower(),)).fetchone()
     user_id = int(user["id"])
-    access = make_access_token(s, user_id)
+    access = make_access_token(s, user_id, conn=conn)
     refresh = make_refresh_token(s, user_id)
     exp = (_utcnow() + timedelta(days=s.refresh_token_days)).isoformat()
     store_refresh(s, refresh, user_id, exp, conn=conn)
     conn.commit()
-    conn.close()
     return {"ok": True, "access_token": access, "refresh_token": refresh}
 
 @router.post("/login")
-def login(body: LoginIn):
-    s = Settings.load()
-    conn = get_conn(s)
+async def login(body: LoginIn):
+    s = get_settings()
     ident = body.identifier.strip().lower()
-    user = conn.execute(
+    user = await run_in_db(lambda conn: conn.execute(
         "SELECT id,email,username,password_hash,is_verified FROM users WHERE lower(email)=? OR lower(username)=?",
         (ident, ident),
-    ).fetchone()
+    ).fetchone(), s)
 
     if not user:
-        conn.close()
         raise HTTPException(status_code=401, detail="Credenciales inválidas.")
     if int(user["is_verified"]) != 1:
-        conn.close()
         raise HTTPException(status_code=403, detail="Tu correo aún no está verificado.")
-    if not verify_password(body.password, s.password_pepper, user["password_hash"]):
-        conn.close()
+    ok, new_hash = await hasher.verify(body.password, s.password_pepper, user["password_hash"])
+    if not ok:
         raise HTTPException(status_code=401, detail="Credenciales inválidas.")
 
     user_id = int(user["id"])
-    access = make_access_token(s, user_id)
     refresh = make_refresh_token(s, user_id)
     exp = (_utcnow() + timedelta(days=s.refresh_token_days)).isoformat()
-    store_refresh(s, refresh, user_id, exp, conn=conn)
-    conn.close()
+
+    def issue(conn) -> str:
+        if new_hash:
+            # BCRYPT_ROUNDS changed since this hash was made; upgrade it transparently.
+            conn.execute(
+                "UPDATE users SET password_hash=? WHERE id=? AND password_hash=?",
+                (new_hash, user_id, user["password_hash"]),
+            )
+        store_refresh(s, refresh, user_id, exp, conn=conn)
+        return make_access_token(s, user_id, conn=conn)
+    access = await run_in_db(issue, s)
     return {"ok": True, "access_token": access, "refresh_token": refresh}
 
 @router.post("/refresh")
-def refresh(body: RefreshIn):
-    s = Settings.load()
-    user_id = verify_refresh(s, body.refresh_token)
-    revoke_refresh(s, body.refresh_token)
-    access = make_access_token(s, user_id)
+def refresh(body: RefreshIn, conn: sqlite3.Connection = Depends(get_db)):
+    s = get_settings()
+    user_id = verify_refresh(s, body.refresh_token, conn=conn)
+    revoke_refresh(s, body.refresh_token, conn=conn)
+    access = make_access_token(s, user_id, conn=conn)
     refresh_token = make_refresh_token(s, user_id)
     exp = (_utcnow() + timedelta(days=s.refresh_token_days)).isoformat()
-    store_refresh(s, refresh_token, user_id, exp)
+    store_refresh(s, refresh_token, user_id, exp, conn=conn)
     return {"ok": True, "access_token": access, "refresh_token": refresh_token}
 
+@router.post("/logout-all")
+def logout_all(user_id: int = Depends(get_current_user_id), conn: sqlite3.Connection = Depends(get_db)):
+    s = get_settings()
+    # Refresh tokens go away immediately; access tokens only if TOKEN_REVOCATION is on,
+    # otherwise they lapse on their own within ACCESS_TOKEN_MINUTES.
+    conn.execute("DELETE FROM refresh_tokens WHERE user_id=?", (user_id,))
+    bump_user_epoch(s, user_id, conn)
+    conn.commit()
+    return {"ok": True}
+
 @router.post("/forgot-password")
-def forgot(body: ForgotIn):
-    s = Settings.load()
-    conn = get_conn(s)
+def forgot(body: ForgotIn, conn: sqlite3.Connection = Depends(get_db)):
+    s = get_settings()
     user = conn.execute("SELECT id FROM users WHERE email=?", (body.email.lower(),)).fetchone()
 
     # Always return ok to prevent enumeration
     if not user:
-        conn.close()
         return {"ok": True}
 
     code = generate_code()
@@ -223,55 +220,45 @@ def forgot(body: ForgotIn):
     now = _utcnow().isoformat()
 
     conn.execute("DELETE FROM email_otps WHERE email=? AND purpose=?", (body.email.lower(), "reset_password"))
-    conn.execute(
+    cur = conn.execute(
         "INSERT INTO email_otps(email,purpose,code_hash,expires_at,attempts,created_at) VALUES(?,?,?,?,?,?)",
         (body.email.lower(), "reset_password", ch, exp, 0, now),
     )
+    _queue_otp(s, conn, cur.lastrowid, body.email, "reset_password", code)
     conn.commit()
-    conn.close()
-
-    send_otp_email(
-        public_base_url=s.public_base_url,
-        resend_api_key=s.resend_api_key,
-        resend_from=s.resend_from,
-        to_email=body.email,
-        purpose="reset_password",
-        code=code,
-        contact_email=s.contact_email,
-        whatsapp_link=s.whatsapp_link,
-        terms_url=s.terms_url,
-        privacy_url=s.privacy_url,
-    )
+    outbox.wake()
     return {"ok": True}
 
 @router.post("/reset-password")
-def reset(body: ResetIn):
-    s = Settings.load()
-    conn = get_conn(s)
-    row = conn.execute(
-        "SELECT id,code_hash,expires_at,attempts FROM email_otps WHERE email=? AND purpose=? ORDER BY id DESC LIMIT 1",
-        (body.email.lower(), "reset_password"),
-    ).fetchone()
-    if not row:
-        conn.close()
-        raise HTTPException(status_code=400, detail="Código inválido.")
-    if datetime.fromisoformat(row["expires_at"]) < _utcnow():
-        conn.close()
-        raise HTTPException(status_code=400, detail="Código expirado.")
-    if int(row["attempts"]) >= 8:
-        conn.close()
-        raise HTTPException(status_code=429, detail="Demasiados intentos.")
-
-    expected = code_hash(body.email, "reset_password", body.code, s.password_pepper)
-    if expected != row["code_hash"]:
-        conn.execute("UPDATE email_otps SET attempts=attempts+1 WHERE id=?", (row["id"],))
-        conn.commit()
-        conn.close()
-        raise HTTPException(status_code=400, detail="Código inválido.")
-
-    new_hash = hash_password(body.new_password, s.password_pepper)
-    conn.execute("UPDATE users SET password_hash=?, updated_at=? WHERE email=?", (new_hash, _utcnow().isoformat(), body.email.lower()))
-    conn.execute("DELETE FROM email_otps WHERE id=?", (row["id"],))
-    conn.commit()
-    conn.close()
+async def reset(body: ResetIn):
+    s = get_settings()
+
+    def check_code(conn):
+        row = conn.execute(
+            "SELECT id,code_hash,expires_at,attempts FROM email_otps WHERE email=? AND purpose=? ORDER BY id DESC LIMIT 1",
+            (body.email.lower(), "reset_password"),
+        ).fetchone()
+        if not row:
+            raise HTTPException(status_code=400, detail="Código inválido.")
+        if datetime.fromisoformat(row["expires_at"]) < _utcnow():
+            raise HTTPException(status_code=400, detail="Código expirado.")
+        if int(row["attempts"]) >= 8:
+            raise HTTPException(status_code=429, detail="Demasiados intentos.")
+
+        expected = code_hash(body.email, "reset_password", body.code, s.password_pepper)
+        if expected != row["code_hash"]:
+            conn.execute("UPDATE email_otps SET attempts=attempts+1 WHERE id=?", (row["id"],))
+            conn.commit()
+            raise HTTPException(status_code=400, detail="Código inválido.")
+        return int(row["id"])
+    otp_id = await run_in_db(check_code, s)
+
+    new_hash = await hasher.hash(body.new_password, s.password_pepper)
+
+    def apply(conn):
+        # The OTP row is consumed here; if another reset got there first, don't apply this one.
+        if conn.execute("DELETE FROM email_otps WHERE id=?", (otp_id,)).rowcount != 1:
+            raise HTTPException(status_code=400, detail="Código inválido.")
+        conn.execute("UPDATE users SET password_hash=?, updated_at=? WHERE email=?", (new_hash, _utcnow().isoformat(), body.email.lower()))
+    await run_in_db(apply, s)
     return {"ok": True}
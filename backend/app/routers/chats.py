@@ -1,15 +1,24 @@
-import os
+import base64
+import json
+import sqlite3
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Optional, Union
 
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from ..settings import Settings
-from ..db import get_conn
+from ..settings import get_settings
+from ..db import get_db, run_in_db
 from ..utils.tokens import get_current_user_id
-from ..utils.files import unique_filename
-from ..services.groq import groq_chat, groq_vision
+from ..utils.files import UploadTooLarge
+from ..utils.fast_json import FastJSONResponse
+from ..services.groq import groq_chat, groq_chat_stream, groq_vision
+from ..services.bulkhead import Overloaded
+from ..services import vision_cache, images, blobs
+from ..services.answer_cache import answer_cache
+from ..services.context import build_history
 
 router = APIRouter()
 
@@ -36,6 +45,8 @@ class MessageOut(BaseModel):
     role: str
     content: str
     image_url: Optional[str] = None
+    thumb_url: Optional[str] = None
+    webp_url: Optional[str] = None
     created_at: str
 
 def _utcnow():
@@ -50,95 +61,192 @@ def _ensure_default_chat(conn, user_id: int) -> int:
     conn.commit()
     return int(conn.execute("SELECT id FROM chats WHERE user_id=? ORDER BY id LIMIT 1", (user_id,)).fetchone()["id"])
 
-@router.get("", response_model=list[ChatOut])
-def list_chats(user_id: int = Depends(get_current_user_id)):
-    s = Settings.load()
-    conn = get_conn(s)
-    rows = conn.execute("SELECT id,title FROM chats WHERE user_id=? ORDER BY updated_at DESC", (user_id,)).fetchall()
-    if not rows:
+class ChatPage(BaseModel):
+    items: list[ChatOut]
+    next_cursor: Optional[str] = None
+
+class MessagePage(BaseModel):
+    items: list[MessageOut]
+    next_cursor: Optional[int] = None
+    has_more: bool = False
+
+class MessageDelta(BaseModel):
+    items: list[MessageOut]
+    last_id: int
+
+PAGE_DEFAULT = 50
+PAGE_MAX = 200
+
+# Variants come from the uploads row so history screens can show thumbnails instead of originals.
+MESSAGE_COLS = (
+    "SELECT m.id,m.role,m.content,m.image_path,m.created_at,u.variants "
+    "FROM messages m LEFT JOIN uploads u ON u.path=m.image_path"
+)
+
+def _message_out(s, r) -> dict:
+    # Plain dict in MessageOut's shape: list endpoints send these through FastJSONResponse unvalidated.
+    img, thumb, webp = blobs.urls(s, r["image_path"], r["variants"], "chat")
+    return {"id": r["id"], "role": r["role"], "content": r["content"], "image_url": img,
+            "thumb_url": thumb, "webp_url": webp, "created_at": r["created_at"]}
+
+def _page_messages(s, conn, chat_id: int, before: Optional[int], after: Optional[int], limit: Optional[int]) -> dict:
+    """Keyset page over messages.id, always returned oldest-first.
+
+    ``after`` walks forward (next_cursor is the next ``after``); otherwise the page is the
+    newest ``limit`` messages older than ``before`` (next_cursor is the next ``before``).
+    """
+    limit = min(limit or PAGE_DEFAULT, PAGE_MAX)
+    if after is not None:
+        rows = conn.execute(f"{MESSAGE_COLS} WHERE m.chat_id=? AND m.id>? ORDER BY m.id ASC LIMIT ?", (chat_id, after, limit + 1)).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"] if has_more else None
+    else:
+        rows = conn.execute(
+            f"{MESSAGE_COLS} WHERE m.chat_id=? AND m.id<? ORDER BY m.id DESC LIMIT ?",
+            (chat_id, before if before is not None else 2**63 - 1, limit + 1),
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+        next_cursor = rows[0]["id"] if has_more else None
+    return {"items": [_message_out(s, r) for r in rows], "next_cursor": next_cursor, "has_more": has_more}
+
+def _encode_chat_cursor(updated_at: str, chat_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{updated_at}|{chat_id}".encode("utf-8")).decode("ascii")
+
+def _decode_chat_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        updated_at, chat_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return updated_at, int(chat_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+
+@router.get("", response_model=Union[ChatPage, list[ChatOut]])
+def list_chats(
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX),
+    cursor: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
+    conn: sqlite3.Connection = Depends(get_db),
+):
+    """Chats by most recent activity. With ``limit``/``cursor`` returns a ChatPage;
+    without them, the legacy full list (kept for already-installed app versions)."""
+    if not conn.execute("SELECT 1 FROM chats WHERE user_id=? LIMIT 1", (user_id,)).fetchone():
         _ensure_default_chat(conn, user_id)
+    if limit is None and cursor is None:
         rows = conn.execute("SELECT id,title FROM chats WHERE user_id=? ORDER BY updated_at DESC", (user_id,)).fetchall()
-    conn.close()
-    return [ChatOut(id=r["id"], title=r["title"]) for r in rows]
+        return [ChatOut(id=r["id"], title=r["title"]) for r in rows]
+
+    limit = limit or PAGE_DEFAULT
+    if cursor:
+        updated_at, last_id = _decode_chat_cursor(cursor)
+        rows = conn.execute(
+            "SELECT id,title,updated_at FROM chats WHERE user_id=? AND (updated_at<? OR (updated_at=? AND id<?)) "
+            "ORDER BY updated_at DESC, id DESC LIMIT ?",
+            (user_id, updated_at, updated_at, last_id, limit + 1),
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT id,title,updated_at FROM chats WHERE user_id=? ORDER BY updated_at DESC, id DESC LIMIT ?",
+            (user_id, limit + 1),
+        ).fetchall()
+    next_cursor = _encode_chat_cursor(rows[limit - 1]["updated_at"], rows[limit - 1]["id"]) if len(rows) > limit else None
+    return ChatPage(items=[ChatOut(id=r["id"], title=r["title"]) for r in rows[:limit]], next_cursor=next_cursor)
 
 @router.post("")
-def create_chat(title: str = Form("Katara"), user_id: int = Depends(get_current_user_id)):
-    s = Settings.load()
-    conn = get_conn(s)
+def create_chat(title: str = Form("Katara"), user_id: int = Depends(get_current_user_id), conn: sqlite3.Connection = Depends(get_db)):
     now = _utcnow()
     conn.execute("INSERT INTO chats(user_id,title,created_at,updated_at) VALUES(?,?,?,?)", (user_id, title, now, now))
     conn.commit()
     chat_id = int(conn.execute("SELECT last_insert_rowid() AS id").fetchone()["id"])
-    conn.close()
     return {"ok": True, "chat_id": chat_id}
 
-@router.get("/{chat_id}/messages", response_model=list[MessageOut])
-def get_messages(chat_id: int, user_id: int = Depends(get_current_user_id)):
-    s = Settings.load()
-    conn = get_conn(s)
+def _check_owner(conn, chat_id: int, user_id: int) -> None:
     owns = conn.execute("SELECT 1 FROM chats WHERE id=? AND user_id=?", (chat_id, user_id)).fetchone()
     if not owns:
-        conn.close()
         raise HTTPException(status_code=404, detail="Chat no encontrado.")
-    rows = conn.execute("SELECT id,role,content,image_path,created_at FROM messages WHERE chat_id=? ORDER BY id ASC", (chat_id,)).fetchall()
-    conn.close()
-    out=[]
-    for r in rows:
-        img=None
-        if r["image_path"]:
-            img = f"{s.public_base_url}/uploads/chat/{os.path.basename(r['image_path'])}"
-        out.append(MessageOut(id=r["id"], role=r["role"], content=r["content"], image_url=img, created_at=r["created_at"]))
-    return out
 
-@router.post("/{chat_id}/messages")
-async def send_message(
+@router.get("/{chat_id}/messages", response_model=Union[MessagePage, list[MessageOut]], response_class=FastJSONResponse)
+def get_messages(
     chat_id: int,
-    text: str = Form(""),
-    lat: Optional[float] = Form(None),
-    lon: Optional[float] = Form(None),
-    image: Optional[UploadFile] = File(None),
+    before: Optional[int] = Query(None, ge=1),
+    after: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX),
     user_id: int = Depends(get_current_user_id),
+    conn: sqlite3.Connection = Depends(get_db),
 ):
-    s = Settings.load()
-    conn = get_conn(s)
-    owns = conn.execute("SELECT 1 FROM chats WHERE id=? AND user_id=?", (chat_id, user_id)).fetchone()
-    if not owns:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Chat no encontrado.")
+    """Paginated with ``before``/``after``/``limit`` (returns a MessagePage); without them,
+    the legacy full history list."""
+    s = get_settings()
+    _check_owner(conn, chat_id, user_id)
+    if before is None and after is None and limit is None:
+        rows = conn.execute(f"{MESSAGE_COLS} WHERE m.chat_id=? ORDER BY m.id ASC", (chat_id,)).fetchall()
+        return FastJSONResponse([_message_out(s, r) for r in rows])
+    return FastJSONResponse(_page_messages(s, conn, chat_id, before, after, limit))
+
+def _messages_since(s, conn, chat_id: int, after: int) -> MessageDelta:
+    last = conn.execute("SELECT MAX(id) AS m FROM messages WHERE chat_id=?", (chat_id,)).fetchone()["m"] or 0
+    if last <= after:
+        return MessageDelta(items=[], last_id=last)
+    items = _page_messages(s, conn, chat_id, None, after, PAGE_MAX)["items"]
+    return MessageDelta(items=items, last_id=items[-1]["id"] if items else after)
+
+@router.get("/{chat_id}/messages/since", response_model=MessageDelta)
+def messages_since(
+    chat_id: int,
+    after: int = Query(0, ge=0),
+    user_id: int = Depends(get_current_user_id),
+    conn: sqlite3.Connection = Depends(get_db),
+):
+    """Cheap poll: messages newer than ``after`` (at most one page) and the newest id seen."""
+    _check_owner(conn, chat_id, user_id)
+    return _messages_since(get_settings(), conn, chat_id, after)
+
+async def _prepare_turn(s, chat_id: int, user_id: int, text: str, lat, lon, image: Optional[UploadFile]) -> tuple[list, Optional[str], bool]:
+    """Store the user turn (and image analysis) and return the LLM messages, the saved image path
+    and whether the reply may come from the answer cache (first turn, text only)."""
+    # Connections are checked out only around DB work, never across the LLM calls.
+    await run_in_db(lambda conn: _check_owner(conn, chat_id, user_id), s)
 
     image_path = None
     vision_json = None
 
     if image is not None:
-        content = await image.read()
-        if len(content) > 10 * 1024 * 1024:
-            conn.close()
-            raise HTTPException(status_code=413, detail="Imagen demasiado grande (máx 10MB).")
-        fname = unique_filename(f"chat_{chat_id}_{user_id}", image.filename or "image.jpg")
-        image_path = os.path.join(s.upload_dir, "chat", fname)
-        with open(image_path, "wb") as f:
-            f.write(content)
+        # The multipart parser already spooled the file; copy it in chunks off the event loop.
         try:
-            vision_json = groq_vision(
-                api_key=s.groq_api_key_vision,
-                model=s.vision_model,
-                prompt=VISION_PROMPT,
-                image_bytes=content,
-                mime=image.content_type or "image/jpeg",
+            image_path = await run_in_threadpool(
+                blobs.ingest, s, image.file, image.filename or "image.jpg", image.content_type, s.chat_image_max_bytes,
             )
-        except Exception:
-            vision_json = '{"error":"vision_failed"}'
+        except UploadTooLarge:
+            raise HTTPException(status_code=413, detail=f"Imagen demasiado grande (máx {s.chat_image_max_bytes // (1024 * 1024)}MB).")
+        # Hash and send the downscaled copy: a fraction of the original in memory and upstream.
+        content, mime = await images.prepare_for_vision(s, blobs.abs_path(s, image_path), image.content_type or "image/jpeg")
+        vision_json, cache_key, phash = await run_in_threadpool(vision_cache.lookup, s, content, s.vision_model, VISION_PROMPT)
+        if vision_json is None:
+            try:
+                vision_json = await groq_vision(
+                    api_key=s.groq_api_key_vision,
+                    model=s.vision_model,
+                    prompt=VISION_PROMPT,
+                    image_bytes=content,
+                    mime=mime,
+                    timeout=s.llm_vision_timeout,
+                )
+                if s.groq_api_key_vision:
+                    await run_in_threadpool(vision_cache.store, s, cache_key, phash, s.vision_model, VISION_PROMPT, vision_json)
+            except Exception:
+                vision_json = '{"error":"vision_failed"}'
+        del content
 
-    conn.execute(
-        "INSERT INTO messages(chat_id,role,content,image_path,created_at) VALUES(?,?,?,?,?)",
-        (chat_id, "user", text or "(imagen)", image_path, _utcnow()),
-    )
-    conn.execute("UPDATE chats SET updated_at=? WHERE id=?", (_utcnow(), chat_id))
-    conn.commit()
-
-    # Build context from last 20 messages
-    rows = conn.execute("SELECT role,content FROM messages WHERE chat_id=? ORDER BY id DESC LIMIT 20", (chat_id,)).fetchall()
-    history = list(reversed(rows))
+    def store_turn(conn):
+        conn.execute(
+            "INSERT INTO messages(chat_id,role,content,image_path,created_at) VALUES(?,?,?,?,?)",
+            (chat_id, "user", text or "(imagen)", image_path, _utcnow()),
+        )
+        conn.execute("UPDATE chats SET updated_at=? WHERE id=?", (_utcnow(), chat_id))
+        conn.commit()
+        # Newest turns that fit CONTEXT_TOKEN_BUDGET, preceded by the rolling summary of older ones
+        return build_history(s, chat_id, conn)
+    history, turns = await run_in_db(store_turn, s)
 
     messages = [{"role":"system","content":SYSTEM_PROMPT}]
     if vision_json:
@@ -146,26 +254,102 @@ async def send_message(
     if lat is not None and lon is not None:
         messages.append({"role":"system","content":f"Ubicación aproximada del usuario: lat={lat}, lon={lon}."})
 
-    for r in history:
-        if r["role"] in ("user","assistant"):
-            messages.append({"role": r["role"], "content": r["content"]})
+    messages.extend(history)
 
     if not text and vision_json:
         messages.append({"role":"user","content":"¿Qué es esto y cómo debo desecharlo o reciclarlo en Guayaquil?"})
 
-    reply = groq_chat(s.groq_api_key_chat, s.chat_model, messages)
+    cacheable = (
+        s.answer_cache_enable and bool(s.groq_api_key_chat) and bool(text)
+        and image is None and lat is None and lon is None and turns == 1
+    )
+    return messages, image_path, cacheable
 
-    conn.execute("INSERT INTO messages(chat_id,role,content,image_path,created_at) VALUES(?,?,?,?,?)", (chat_id, "assistant", reply, None, _utcnow()))
-    conn.execute("UPDATE chats SET updated_at=? WHERE id=?", (_utcnow(), chat_id))
-    conn.commit()
-    conn.close()
+async def _save_reply(s, chat_id: int, reply: str) -> int:
+    def store(conn) -> int:
+        cur = conn.execute("INSERT INTO messages(chat_id,role,content,image_path,created_at) VALUES(?,?,?,?,?)", (chat_id, "assistant", reply, None, _utcnow()))
+        conn.execute("UPDATE chats SET updated_at=? WHERE id=?", (_utcnow(), chat_id))
+        conn.commit()
+        return int(cur.lastrowid)
+    return await run_in_db(store, s)
+
+def _chat_image_url(s, image_path: Optional[str]) -> Optional[str]:
+    return blobs.urls(s, image_path, None, "chat")[0]
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/{chat_id}/messages")
+async def send_message(
+    chat_id: int,
+    text: str = Form(""),
+    lat: Optional[float] = Form(None),
+    lon: Optional[float] = Form(None),
+    image: Optional[UploadFile] = File(None),
+    user_id: int = Depends(get_current_user_id),
+):
+    s = get_settings()
+    messages, image_path, cacheable = await _prepare_turn(s, chat_id, user_id, text, lat, lon, image)
+    reply = await run_in_threadpool(answer_cache.lookup, s, text, s.chat_model, SYSTEM_PROMPT) if cacheable else None
+    if reply is None:
+        reply = await groq_chat(s.groq_api_key_chat, s.chat_model, messages, timeout=s.llm_chat_timeout)
+        if cacheable:
+            await run_in_threadpool(answer_cache.store, s, text, s.chat_model, SYSTEM_PROMPT, reply)
+    await _save_reply(s, chat_id, reply)
 
     return {
         "ok": True,
         "reply": reply,
-        "image_url": f"{s.public_base_url}/uploads/chat/{os.path.basename(image_path)}" if image_path else None,
+        "image_url": _chat_image_url(s, image_path),
     }
 
+@router.post("/{chat_id}/messages/stream")
+async def send_message_stream(
+    chat_id: int,
+    text: str = Form(""),
+    lat: Optional[float] = Form(None),
+    lon: Optional[float] = Form(None),
+    image: Optional[UploadFile] = File(None),
+    user_id: int = Depends(get_current_user_id),
+):
+    """Same as send_message, but the reply is sent as Server-Sent Events while it is generated.
+
+    Events: ``token`` ({"delta"}), then ``done`` ({"ok", "message_id", "image_url"}) or ``error``.
+    The assistant message is stored once the upstream stream completes. If the client
+    disconnects, Starlette cancels this generator, which closes the upstream request.
+    """
+    s = get_settings()
+    messages, image_path, cacheable = await _prepare_turn(s, chat_id, user_id, text, lat, lon, image)
+    cached = await run_in_threadpool(answer_cache.lookup, s, text, s.chat_model, SYSTEM_PROMPT) if cacheable else None
+
+    async def replay(answer: str):
+        yield answer
+
+    async def events():
+        parts = []
+        source = replay(cached) if cached is not None else groq_chat_stream(s.groq_api_key_chat, s.chat_model, messages, timeout=s.llm_chat_timeout)
+        try:
+            async for delta in source:
+                parts.append(delta)
+                yield _sse("token", {"delta": delta})
+        except Overloaded as e:
+            yield _sse("error", {"detail": "Katara está muy ocupada, intenta de nuevo en unos segundos.", "retry_after": e.retry_after})
+            return
+        except Exception:
+            yield _sse("error", {"detail": "No se pudo generar la respuesta."})
+            return
+        reply = "".join(parts)
+        if cacheable and cached is None:
+            await run_in_threadpool(answer_cache.store, s, text, s.chat_model, SYSTEM_PROMPT, reply)
+        message_id = await _save_reply(s, chat_id, reply)
+        yield _sse("done", {"ok": True, "message_id": message_id, "image_url": _chat_image_url(s, image_path)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/default/message")
 async def default_message(
     text: str = Form(""),
@@ -174,24 +358,41 @@ async def default_message(
     image: Optional[UploadFile] = File(None),
     user_id: int = Depends(get_current_user_id),
 ):
-    s = Settings.load()
-    conn = get_conn(s)
-    chat_id = _ensure_default_chat(conn, user_id)
-    conn.close()
+    chat_id = await run_in_db(lambda conn: _ensure_default_chat(conn, user_id))
     # reuse route logic by calling send_message
     return await send_message(chat_id=chat_id, text=text, lat=lat, lon=lon, image=image, user_id=user_id)
 
-@router.get("/default/history")
-def default_history(user_id: int = Depends(get_current_user_id)):
-    s = Settings.load()
-    conn = get_conn(s)
+@router.post("/default/message/stream")
+async def default_message_stream(
+    text: str = Form(""),
+    lat: Optional[float] = Form(None),
+    lon: Optional[float] = Form(None),
+    image: Optional[UploadFile] = File(None),
+    user_id: int = Depends(get_current_user_id),
+):
+    chat_id = await run_in_db(lambda conn: _ensure_default_chat(conn, user_id))
+    return await send_message_stream(chat_id=chat_id, text=text, lat=lat, lon=lon, image=image, user_id=user_id)
+
+@router.get("/default/history", response_model=Union[MessagePage, list[MessageOut]], response_class=FastJSONResponse)
+def default_history(
+    before: Optional[int] = Query(None, ge=1),
+    after: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX),
+    user_id: int = Depends(get_current_user_id),
+    conn: sqlite3.Connection = Depends(get_db),
+):
+    s = get_settings()
+    chat_id = _ensure_default_chat(conn, user_id)
+    if before is None and after is None and limit is None:
+        rows = conn.execute(f"{MESSAGE_COLS} WHERE m.chat_id=? ORDER BY m.id ASC", (chat_id,)).fetchall()
+        return FastJSONResponse([_message_out(s, r) for r in rows])
+    return FastJSONResponse(_page_messages(s, conn, chat_id, before, after, limit))
+
+@router.get("/default/since", response_model=MessageDelta)
+def default_since(
+    after: int = Query(0, ge=0),
+    user_id: int = Depends(get_current_user_id),
+    conn: sqlite3.Connection = Depends(get_db),
+):
     chat_id = _ensure_default_chat(conn, user_id)
-    rows = conn.execute("SELECT id,role,content,image_path,created_at FROM messages WHERE chat_id=? ORDER BY id ASC", (chat_id,)).fetchall()
-    conn.close()
-    out=[]
-    for r in rows:
-        img=None
-        if r["image_path"]:
-            img = f"{s.public_base_url}/uploads/chat/{os.path.basename(r['image_path'])}"
-        out.append({"id":r["id"],"role":r["role"],"content":r["content"],"image_url":img,"created_at":r["created_at"]})
-    return out
+    return _messages_since(get_settings(), conn, chat_id, after)
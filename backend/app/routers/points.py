@@ -1,81 +1,133 @@
-from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, Query
-from ..settings import Settings
-from ..db import get_conn
+import hashlib
+from typing import Optional
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from ..settings import get_settings
+from ..db import db_session
 from ..utils.tokens import get_current_user_id
-from ..services.arcgis import geocode_single_line
+from ..services.geocoder import jobs as geocode_jobs
+from ..services.spatial import point_index, bbox_tiles
+from ..services.catalogue import points_version
+from ..utils.http_cache import BodyCache, CachedBody, http_date, not_modified, respond
+from ..utils.fast_json import FastJSONResponse
 
 router = APIRouter()
 
+# Below this zoom GET /points?bbox= returns clusters; from it on, individual points.
+CLUSTER_BELOW_ZOOM = 14
+MAX_TILES = 64
+
+def _parse_bbox(bbox: str) -> tuple[float, float, float, float]:
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox debe ser oeste,sur,este,norte.")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise HTTPException(status_code=400, detail="bbox fuera de rango.")
+    return west, south, east, north
+
+_bodies = BodyCache()
+
+def _points_list(s, category: Optional[str]) -> CachedBody:
+    sql = "SELECT id,name,address,lat,lon,category,notes,source_url FROM points"
+    with db_session(s) as conn:
+        rows = conn.execute(sql + (" WHERE category=?" if category else "") + " ORDER BY id", (category,) if category else ()).fetchall()
+    return CachedBody.json([dict(r) for r in rows], http_date(points_version.get(s)[1]))
+
 @router.get("")
-def list_points(user_id: int = Depends(get_current_user_id)):
-    s = Settings.load()
-    conn = get_conn(s)
-    rows = conn.execute("SELECT id,name,address,lat,lon,category,notes,source_url FROM points ORDER BY id").fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+def list_points(
+    request: Request,
+    bbox: Optional[str] = Query(None, description="oeste,sur,este,norte en grados"),
+    zoom: Optional[int] = Query(None, ge=0, le=22),
+    category: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
+):
+    s = get_settings()
+    version = points_version.get(s)[0]
+    if bbox is None:
+        # Legacy: the whole catalogue, including points not geocoded yet. Serialized once per version.
+        cached = _bodies.get(("list", category), version, lambda: _points_list(s, category))
+        return respond(request, cached, "private, no-cache")
 
-def _haversine_km(lat1, lon1, lat2, lon2):
-    import math
-    R=6371.0
-    p1, p2 = math.radians(lat1), math.radians(lat2)
-    dp = math.radians(lat2-lat1)
-    dl = math.radians(lon2-lon1)
-    a = math.sin(dp/2)**2 + math.cos(p1)*math.cos(p2)*math.sin(dl/2)**2
-    return 2*R*math.asin(math.sqrt(a))
+    # Map view: answered per slippy-map tile so every tile is cached once and reused across pans.
+    z = 12 if zoom is None else zoom
+    tiles = bbox_tiles(*_parse_bbox(bbox), z, MAX_TILES)
+    if tiles is None:
+        raise HTTPException(status_code=400, detail="El área es demasiado grande para ese zoom.")
+    # The body is fully determined by (version, tiles, category): no need to build it to tag it.
+    etag = '"p%d-%s"' % (version, hashlib.sha256(repr((z, tiles, category)).encode()).hexdigest()[:16])
+    # Weak: the coding is only chosen once the body exists, so one tag has to cover all of them.
+    headers = {"ETag": "W/" + etag, "Cache-Control": "private, max-age=60"}
+    if not_modified(request, etag, None):
+        return Response(status_code=304, headers=headers)
+    clustered = z < CLUSTER_BELOW_ZOOM
+    items = []
+    for x, y in tiles:
+        items.extend(point_index.tile(s, z, x, y, clustered, category))
+    return FastJSONResponse({
+        "zoom": z,
+        "mode": "clusters" if clustered else "points",
+        "tiles": [f"{z}/{x}/{y}" for x, y in tiles],
+        "items": items,
+    }, headers=headers)
 
-@router.get("/nearest")
-def nearest(lat: float = Query(...), lon: float = Query(...), k: int = 10, user_id: int = Depends(get_current_user_id)):
-    s = Settings.load()
-    conn = get_conn(s)
-    rows = conn.execute("SELECT id,name,address,lat,lon,category,notes,source_url FROM points").fetchall()
-    conn.close()
+def _nearest_item(lat: float, lon: float, d: Optional[float], row: dict) -> dict:
+    item = dict(row)
+    item["distance_km"] = None if d is None else round(d, 2)
+    # route link: keep as URL (frontend may open externally)
+    item["search_url"] = "https://www.openstreetmap.org/search?query=" + quote(item["address"])
+    if item.get("lat") is not None and item.get("lon") is not None:
+        item["directions_url"] = f"https://www.openstreetmap.org/directions?engine=fossgis_osrm_car&route={lat},{lon};{item['lat']},{item['lon']}"
+    else:
+        item["directions_url"] = item["search_url"]
+    return item
 
-    scored=[]
-    for r in rows:
-        if r["lat"] is None or r["lon"] is None:
-            d=1e9
-        else:
-            d=_haversine_km(lat, lon, r["lat"], r["lon"])
-        item=dict(r)
-        item["distance_km"] = None if d>=1e8 else round(d,2)
-        # route link: keep as URL (frontend may open externally)
-        addr_q = __import__("urllib.parse").parse.quote(item["address"])
-        item["search_url"] = "https://www.openstreetmap.org/search?query=" + addr_q
-        if item.get("lat") is not None and item.get("lon") is not None:
-            item["directions_url"] = f"https://www.openstreetmap.org/directions?engine=fossgis_osrm_car&route={lat},{lon};{item['lat']},{item['lon']}"
-        else:
-            item["directions_url"] = item["search_url"]
-        scored.append((d,item))
-    scored.sort(key=lambda x:x[0])
-    return [it for _,it in scored[:k]]
+@router.get("/nearest", response_class=FastJSONResponse)
+def nearest(
+    lat: float = Query(...),
+    lon: float = Query(...),
+    k: int = Query(10, ge=1, le=1000),
+    category: Optional[str] = None,
+    max_km: Optional[float] = Query(None, gt=0),
+    user_id: int = Depends(get_current_user_id),
+):
+    index = point_index.get(get_settings())
+    return FastJSONResponse([_nearest_item(lat, lon, d, row) for d, row in index.nearest(lat, lon, k, category, max_km)])
 
-@router.post("/geocode-missing")
-def geocode_missing(admin_key: str = Query(..., description="ADMIN_API_KEY"), user_id: int = Depends(get_current_user_id)):
-    s = Settings.load()
+@router.post("/geocode-missing", status_code=202)
+async def geocode_missing(
+    admin_key: str = Query(..., description="ADMIN_API_KEY"),
+    retry_misses: bool = Query(False, description="Volver a consultar direcciones que antes no se encontraron"),
+    user_id: int = Depends(get_current_user_id),
+):
+    s = get_settings()
     if admin_key != s.admin_api_key:
         return {"ok": False, "error": "Forbidden"}
     if not s.arcgis_geocode_enable:
         return {"ok": False, "error": "ARCGIS_GEOCODE_ENABLE=false"}
-    conn = get_conn(s)
-    rows = conn.execute("SELECT id,address FROM points WHERE lat IS NULL OR lon IS NULL").fetchall()
-    updated=0
-    for r in rows:
-        lat, lon = geocode_single_line(r["address"] + ", Guayaquil, Ecuador", s.arcgis_api_key)
-        if lat is not None and lon is not None:
-            conn.execute("UPDATE points SET lat=?, lon=?, updated_at=? WHERE id=?", (float(lat), float(lon), datetime.now(timezone.utc).isoformat(), r["id"]))
-            updated += 1
-    conn.commit()
-    conn.close()
-    return {"ok": True, "updated": updated}
+    if not s.arcgis_api_key and s.arcgis_geocode_url != "stub":
+        return {"ok": False, "error": "ARCGIS_API_KEY vacío"}
+    # Runs in the background; poll GET /points/geocode-missing for progress.
+    return {"ok": True, "job": geocode_jobs.start(s, retry_misses).to_dict()}
 
-@router.get("/map-config")
-def map_config():
-    s = Settings.load()
+@router.get("/geocode-missing")
+def geocode_status(admin_key: str = Query(..., description="ADMIN_API_KEY"), user_id: int = Depends(get_current_user_id)):
+    if admin_key != get_settings().admin_api_key:
+        return {"ok": False, "error": "Forbidden"}
+    job = geocode_jobs.current
+    return {"ok": True, "job": job.to_dict() if job else None}
+
+def _map_config(s) -> CachedBody:
     # Frontend can use this to initialize ArcGIS maps without Google.
-    return {
+    return CachedBody.json({
         "provider": "arcgis",
         "apiKey": s.arcgis_api_key[:6] + "..." if s.arcgis_api_key else "",
         "basemapUrl": "https://basemaps-api.arcgis.com/arcgis/rest/services/styles/ArcGIS:Streets?type=style",
         "tiles": "https://server.arcgisonline.com/ArcGIS/rest/services/World_Street_Map/MapServer/tile/{z}/{y}/{x}",
-    }
+    })
+
+@router.get("/map-config")
+def map_config(request: Request):
+    s = get_settings()
+    # The only variable input is the key, so it doubles as the version.
+    return respond(request, _bodies.get(("map-config",), s.arcgis_api_key, lambda: _map_config(s)), "public, no-cache")
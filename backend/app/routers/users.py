@@ -1,15 +1,16 @@
-import os
+import sqlite3
 from datetime import datetime, timezone
 from typing import Optional
 
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
 from pydantic import BaseModel, EmailStr, Field
 
-from ..settings import Settings
-from ..db import get_conn
+from ..settings import get_settings
+from ..db import get_db, db_session, run_in_db
 from ..utils.tokens import get_current_user_id
-from ..utils.passwords import verify_password, hash_password
-from ..utils.files import unique_filename
+from ..utils.passwords import hasher
+from ..utils.files import UploadTooLarge
+from ..services import blobs
 
 router = APIRouter()
 
@@ -19,22 +20,24 @@ class MeOut(BaseModel):
     username: str
     bio: str
     avatar_url: Optional[str] = None
+    avatar_thumb_url: Optional[str] = None
+    avatar_webp_url: Optional[str] = None
     is_verified: bool
 
 @router.get("/me", response_model=MeOut)
-def me(user_id: int = Depends(get_current_user_id)):
-    s = Settings.load()
-    conn = get_conn(s)
-    row = conn.execute("SELECT id,email,username,bio,avatar_path,is_verified FROM users WHERE id=?", (user_id,)).fetchone()
-    conn.close()
+def me(user_id: int = Depends(get_current_user_id), conn: sqlite3.Connection = Depends(get_db)):
+    s = get_settings()
+    row = conn.execute(
+        "SELECT users.id,email,username,bio,avatar_path,is_verified,uploads.variants FROM users "
+        "LEFT JOIN uploads ON uploads.path=users.avatar_path WHERE users.id=?",
+        (user_id,),
+    ).fetchone()
     if not row:
         raise HTTPException(status_code=404, detail="Usuario no encontrado.")
-    avatar_url = None
-    if row["avatar_path"]:
-        avatar_url = f"{s.public_base_url}/uploads/avatars/{os.path.basename(row['avatar_path'])}"
+    avatar_url, thumb_url, webp_url = blobs.urls(s, row["avatar_path"], row["variants"], "avatars")
     return MeOut(
         id=row["id"], email=row["email"], username=row["username"], bio=row["bio"],
-        avatar_url=avatar_url, is_verified=bool(row["is_verified"])
+        avatar_url=avatar_url, avatar_thumb_url=thumb_url, avatar_webp_url=webp_url, is_verified=bool(row["is_verified"])
     )
 
 @router.patch("/me")
@@ -44,39 +47,33 @@ def update_me(
     avatar: Optional[UploadFile] = File(None),
     user_id: int = Depends(get_current_user_id),
 ):
-    s = Settings.load()
-    conn = get_conn(s)
-
-    if username:
-        # uniqueness
-        if conn.execute("SELECT 1 FROM users WHERE username=? AND id<>?", (username, user_id)).fetchone():
-            conn.close()
-            raise HTTPException(status_code=400, detail="Username ya está en uso.")
+    s = get_settings()
 
+    # Ingest before checking out a connection: ingest takes one of its own, and holding ours
+    # meanwhile lets a burst of avatar uploads exhaust the pool.
     avatar_path = None
     if avatar is not None:
-        content = avatar.file.read()
-        if len(content) > 8 * 1024 * 1024:
-            conn.close()
-            raise HTTPException(status_code=413, detail="Avatar demasiado grande (máx 8MB).")
-        fname = unique_filename(f"avatar_{user_id}", avatar.filename or "avatar.jpg")
-        avatar_path = os.path.join(s.upload_dir, "avatars", fname)
-        with open(avatar_path, "wb") as f:
-            f.write(content)
+        try:
+            # sync endpoint: already off the loop
+            avatar_path = blobs.ingest(s, avatar.file, avatar.filename or "avatar.jpg", avatar.content_type, s.avatar_max_bytes)
+        except UploadTooLarge:
+            raise HTTPException(status_code=413, detail=f"Avatar demasiado grande (máx {s.avatar_max_bytes // (1024 * 1024)}MB).")
 
     now = datetime.now(timezone.utc).isoformat()
-    if username is not None and bio is not None and avatar_path is not None:
-        conn.execute("UPDATE users SET username=?, bio=?, avatar_path=?, updated_at=? WHERE id=?", (username, bio, avatar_path, now, user_id))
-    else:
-        if username is not None:
-            conn.execute("UPDATE users SET username=?, updated_at=? WHERE id=?", (username, now, user_id))
-        if bio is not None:
-            conn.execute("UPDATE users SET bio=?, updated_at=? WHERE id=?", (bio, now, user_id))
-        if avatar_path is not None:
-            conn.execute("UPDATE users SET avatar_path=?, updated_at=? WHERE id=?", (avatar_path, now, user_id))
-
-    conn.commit()
-    conn.close()
+    with db_session(s) as conn:
+        if username:
+            # uniqueness
+            if conn.execute("SELECT 1 FROM users WHERE username=? AND id<>?", (username, user_id)).fetchone():
+                raise HTTPException(status_code=400, detail="Username ya está en uso.")
+        if username is not None and bio is not None and avatar_path is not None:
+            conn.execute("UPDATE users SET username=?, bio=?, avatar_path=?, updated_at=? WHERE id=?", (username, bio, avatar_path, now, user_id))
+        else:
+            if username is not None:
+                conn.execute("UPDATE users SET username=?, updated_at=? WHERE id=?", (username, now, user_id))
+            if bio is not None:
+                conn.execute("UPDATE users SET bio=?, updated_at=? WHERE id=?", (bio, now, user_id))
+            if avatar_path is not None:
+                conn.execute("UPDATE users SET avatar_path=?, updated_at=? WHERE id=?", (avatar_path, now, user_id))
     return {"ok": True}
 
 class ChangePasswordIn(BaseModel):
@@ -84,18 +81,15 @@ class ChangePasswordIn(BaseModel):
     new_password: str = Field(min_length=8, max_length=128)
 
 @router.post("/me/change-password")
-def change_password(body: ChangePasswordIn, user_id: int = Depends(get_current_user_id)):
-    s = Settings.load()
-    conn = get_conn(s)
-    row = conn.execute("SELECT password_hash FROM users WHERE id=?", (user_id,)).fetchone()
+async def change_password(body: ChangePasswordIn, user_id: int = Depends(get_current_user_id)):
+    s = get_settings()
+    row = await run_in_db(lambda conn: conn.execute("SELECT password_hash FROM users WHERE id=?", (user_id,)).fetchone(), s)
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="Usuario no encontrado.")
-    if not verify_password(body.current_password, s.password_pepper, row["password_hash"]):
-        conn.close()
+    ok, _ = await hasher.verify(body.current_password, s.password_pepper, row["password_hash"])
+    if not ok:
         raise HTTPException(status_code=400, detail="Contraseña actual incorrecta.")
-    new_hash = hash_password(body.new_password, s.password_pepper)
-    conn.execute("UPDATE users SET password_hash=?, updated_at=? WHERE id=?", (new_hash, datetime.now(timezone.utc).isoformat(), user_id))
-    conn.commit()
-    conn.close()
+    new_hash = await hasher.hash(body.new_password, s.password_pepper)
+    now = datetime.now(timezone.utc).isoformat()
+    await run_in_db(lambda conn: conn.execute("UPDATE users SET password_hash=?, updated_at=? WHERE id=?", (new_hash, now, user_id)), s)
     return {"ok": True}
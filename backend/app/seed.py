@@ -1,7 +1,7 @@
 import json
 import os
 from datetime import datetime, timezone
-from .settings import Settings
+from .settings import Settings, get_settings
 from .db import get_conn
 
 def seed_if_empty(s: Settings):
@@ -24,7 +24,7 @@ def _seed(conn, s: Settings):
     conn.commit()
 
 def seed():
-    s = Settings.load()
+    s = get_settings()
     conn = get_conn(s)
     conn.execute("DELETE FROM points")
     conn.commit()
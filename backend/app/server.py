@@ -1,20 +1,67 @@
 import os
-from fastapi import FastAPI
+import signal
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
-from .settings import Settings
-from .db import init_db, get_conn
-from .routers import auth, users, chats, points, contact, legal
+from .settings import get_settings, reload_settings
+from .db import init_db, close_pools, get_pool, PoolTimeout
+from .routers import auth, users, chats, points, contact, legal, admin
 from .seed import seed_if_empty
+from .services import groq
+from .services.bulkhead import Overloaded
+from .utils.passwords import hasher
+from .services.sweeper import sweeper
+from .services.outbox import outbox
+from .services import metrics, images
+from .utils.body_limit import BodySizeLimit
+from .utils.static import CachedStaticFiles, upload_cache_control, brand_cache_control
+
+_MULTIPART_SLACK = 64 * 1024  # form fields and part headers around the file
+
+def _max_body() -> int:
+    s = get_settings()
+    return _MULTIPART_SLACK + max(s.chat_image_max_bytes, s.avatar_max_bytes)
 
 def create_app() -> FastAPI:
-    s = Settings.load()
+    s = get_settings()
     init_db(s)
     seed_if_empty(s)
+    groq.configure(
+        s.groq_endpoint, s.llm_max_connections,
+        chat_concurrency=s.llm_chat_concurrency, vision_concurrency=s.llm_vision_concurrency,
+        queue_size=s.llm_queue_size, queue_timeout=s.llm_queue_timeout,
+        vision_queue_size=s.llm_vision_queue_size, vision_queue_timeout=s.llm_vision_queue_timeout,
+    )
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        hasher.start(s.bcrypt_rounds, s.password_hash_workers, s.password_hash_queue, s.password_hash_queue_timeout)
+        if s.sweeper_enable:
+            sweeper.start()
+        outbox.start()
+        yield
+        await outbox.stop()
+        await sweeper.stop()
+        hasher.shutdown()
+        images.shutdown()
+        await groq.aclose()
+        close_pools()
+
+    app = FastAPI(title="KataraLM API", version="2.0.0", lifespan=lifespan)
 
-    app = FastAPI(title="KataraLM API", version="2.0.0")
+    @app.exception_handler(PoolTimeout)
+    async def pool_timeout(request: Request, exc: PoolTimeout):
+        return JSONResponse(status_code=503, content={"detail": "Servidor ocupado, intenta de nuevo."}, headers={"Retry-After": "1"})
 
+    @app.exception_handler(Overloaded)
+    async def overloaded(request: Request, exc: Overloaded):
+        return JSONResponse(status_code=503, content={"detail": "Katara está muy ocupada, intenta de nuevo en unos segundos."}, headers={"Retry-After": str(exc.retry_after)})
+
+    # Innermost, so a 413 still carries CORS headers. Per-file limits are enforced while saving.
+    app.add_middleware(BodySizeLimit, limit=_max_body)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=s.cors_allow_origins,
@@ -22,24 +69,59 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    if s.metrics_enable:
+        # Added last so it is outermost and also sees CORS preflights and 503s from the handlers above.
+        app.add_middleware(metrics.MetricsMiddleware)
 
-    # Uploads (avatars + chat images)
-    os.makedirs(s.upload_dir, exist_ok=True)
-    app.mount("/uploads", StaticFiles(directory=s.upload_dir), name="uploads")
+    # Uploads (avatars + chat images); directories are created by get_settings()
+    app.mount("/uploads", CachedStaticFiles(directory=s.upload_dir, cache_control=upload_cache_control), name="uploads")
 
     # Brand assets for email and UI
     if os.path.isdir(s.brand_dir):
-        app.mount("/brand", StaticFiles(directory=s.brand_dir), name="brand")
+        # SVGs have .br/.gz siblings after `python -m app.build_assets`
+        app.mount("/brand", CachedStaticFiles(directory=s.brand_dir, cache_control=brand_cache_control, precompressed=True), name="brand")
 
     @app.get("/health")
     def health():
         return {"ok": True}
 
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics(admin_key: str = Query(..., description="ADMIN_API_KEY")):
+        # Scrape config: params: {admin_key: [...]}
+        live = get_settings()
+        if not live.metrics_enable or admin_key != live.admin_api_key:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        return PlainTextResponse(metrics.render_latest(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
     app.include_router(auth.router, prefix="/auth", tags=["auth"])
     app.include_router(users.router, tags=["users"])
     app.include_router(chats.router, prefix="/chats", tags=["chats"])
     app.include_router(points.router, prefix="/points", tags=["points"])
     app.include_router(contact.router, tags=["contact"])
     app.include_router(legal.router, tags=["legal"])
+    app.include_router(admin.router, prefix="/admin", tags=["admin"])
+
+    metrics.registry.add_collector(_runtime_samples)
+    _install_reload_signal()
 
     return app
+
+def _runtime_samples():
+    # State that already lives elsewhere; read at scrape time instead of mirrored on every change.
+    pool = get_pool(get_settings()).stats()
+    yield "katara_db_pool_in_use", "gauge", "Pooled SQLite connections checked out.", {}, pool["in_use"]
+    yield "katara_db_pool_wait_seconds_total", "counter", "Time spent waiting for a pooled connection.", {}, pool["wait_time_s"]
+    yield "katara_db_pool_timeouts_total", "counter", "Pool checkouts that timed out.", {}, pool["timeouts"]
+    for bh in (groq.chat_bulkhead, groq.vision_bulkhead, hasher.bulkhead):
+        st = bh.stats()
+        yield "katara_bulkhead_in_flight", "gauge", "Calls holding a bulkhead slot.", {"bulkhead": bh.name}, st["in_flight"]
+        yield "katara_bulkhead_queue_depth", "gauge", "Calls waiting for a bulkhead slot.", {"bulkhead": bh.name}, st["queue_depth"]
+        yield "katara_bulkhead_rejected_total", "counter", "Calls rejected by a full queue.", {"bulkhead": bh.name}, st["rejected"]
+        yield "katara_bulkhead_timed_out_total", "counter", "Calls that timed out waiting for a slot.", {"bulkhead": bh.name}, st["timed_out"]
+
+def _install_reload_signal() -> None:
+    # `kill -HUP <pid>` re-reads .env without restarting. Not available on Windows,
+    # and signal handlers can only be installed from the main thread.
+    if not hasattr(signal, "SIGHUP") or threading.current_thread() is not threading.main_thread():
+        return
+    signal.signal(signal.SIGHUP, lambda signum, frame: reload_settings())
@@ -0,0 +1,196 @@
+"""Approximate answer cache for self-contained recycling questions.
+
+Only first-turn, text-only questions are cached (no image, no location, no prior history),
+so the reply depends on nothing but the question. Questions are normalised (lowercase, no
+accents, no punctuation, no filler words), words are cut to a crude 6-letter stem so
+"reciclo" and "reciclar" agree, and the result is compared as character-trigram vectors with
+cosine similarity; an inverted trigram index keeps lookups to a handful of candidates.
+Trigrams alone score "¿el vidrio es reciclable?" and "¿el vidrio no es reciclable?" at 0.92,
+so a hit also needs the same negation words and most of the same content words; the cosine
+threshold decides the rest. Entries persist in the answer_cache table and are loaded into
+memory on first use. Both methods touch SQLite: call them from a worker thread, not the
+event loop.
+"""
+import hashlib
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from ..settings import Settings
+from ..db import db_session
+
+_STOPWORDS = {
+    "el", "la", "los", "las", "un", "una", "unos", "unas", "de", "del", "al", "a", "en", "y", "o",
+    "que", "por", "para", "con", "se", "me", "mi", "lo", "le", "hola", "katara",
+    "porfa", "favor", "porfavor", "mis", "tu", "tus", "su", "sus",
+    "puedo", "puede", "pueden", "podria", "debo", "debe", "hay",
+}
+# Never dropped as filler, even if added to _STOPWORDS: they flip the meaning of the question.
+_NEGATIONS = {"no", "ni", "nunca", "jamas", "tampoco", "sin", "nada", "nadie", "ningun", "ninguna", "ninguno"}
+_STEM = 6
+# Share of stemmed content words two questions must have in common (Jaccard) to match.
+_MIN_WORD_OVERLAP = 0.7
+_NON_WORD = re.compile(r"[^a-z0-9ñ ]+")
+_SPACES = re.compile(r"\s+")
+
+def normalize(text: str) -> str:
+    t = unicodedata.normalize("NFKD", (text or "").lower())
+    t = "".join(c for c in t if not unicodedata.combining(c))
+    t = _SPACES.sub(" ", _NON_WORD.sub(" ", t)).strip()
+    words = [w for w in t.split(" ") if w and (w in _NEGATIONS or w not in _STOPWORDS)]
+    return " ".join(words) or t
+
+def _terms(norm: str) -> tuple[str, frozenset, frozenset]:
+    """(stemmed text, negation words, stemmed content words) of a normalised question."""
+    stems = [w if w in _NEGATIONS else w[:_STEM] for w in norm.split(" ")]
+    negations = frozenset(w for w in stems if w in _NEGATIONS)
+    return " ".join(stems), negations, frozenset(stems) - negations
+
+def _overlap(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def _trigrams(norm: str) -> Counter:
+    padded = f"  {norm} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def _variant(model: str, system_prompt: str) -> str:
+    return hashlib.sha256(f"{model}|{system_prompt}".encode("utf-8")).hexdigest()
+
+class _Entry:
+    __slots__ = ("id", "variant", "negations", "words", "vec", "norm", "answer", "created_at")
+
+    def __init__(self, id: int, variant: str, normalized: str, answer: str, created_at: str):
+        self.id = id
+        self.variant = variant
+        stemmed, self.negations, self.words = _terms(normalized)
+        self.vec = _trigrams(stemmed)
+        self.norm = math.sqrt(sum(v * v for v in self.vec.values())) or 1.0
+        self.answer = answer
+        self.created_at = created_at
+
+class AnswerCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._entries: dict[int, _Entry] = {}
+        self._postings: dict[str, set[int]] = {}
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+
+    def _add(self, e: _Entry) -> None:
+        self._entries[e.id] = e
+        for g in e.vec:
+            self._postings.setdefault(g, set()).add(e.id)
+
+    def _remove(self, entry_id: int) -> None:
+        e = self._entries.pop(entry_id, None)
+        if e is None:
+            return
+        for g in e.vec:
+            ids = self._postings.get(g)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._postings[g]
+
+    def _ensure_loaded(self, s: Settings) -> None:
+        if self._loaded:
+            return
+        with db_session(s) as conn:
+            rows = conn.execute("SELECT id,variant,normalized,answer,created_at FROM answer_cache ORDER BY id").fetchall()
+        for r in rows:
+            self._add(_Entry(r["id"], r["variant"], r["normalized"], r["answer"], r["created_at"]))
+        self._loaded = True
+
+    def lookup(self, s: Settings, question: str, model: str, system_prompt: str) -> Optional[str]:
+        norm = normalize(question)
+        if not norm:
+            return None
+        stemmed, negations, words = _terms(norm)
+        vec = _trigrams(stemmed)
+        qnorm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        variant = _variant(model, system_prompt)
+        cutoff = (datetime.now(timezone.utc) - timedelta(hours=s.answer_cache_ttl_hours)).isoformat()
+        best, best_score = None, 0.0
+        with self._lock:
+            self._ensure_loaded(s)
+            self.lookups += 1
+            candidates = Counter()
+            for g in vec:
+                for entry_id in self._postings.get(g, ()):
+                    candidates[entry_id] += 1
+            # Drop other variants, expired rows, flipped negations and questions about other
+            # things first, then score the entries sharing the most trigrams with the question.
+            eligible = Counter()
+            for entry_id, shared in candidates.items():
+                e = self._entries[entry_id]
+                if e.variant == variant and e.created_at >= cutoff and e.negations == negations \
+                        and _overlap(e.words, words) >= _MIN_WORD_OVERLAP:
+                    eligible[entry_id] = shared
+            for entry_id, _ in eligible.most_common(50):
+                e = self._entries[entry_id]
+                dot = sum(c * e.vec.get(g, 0) for g, c in vec.items())
+                score = dot / (qnorm * e.norm)
+                if score > best_score:
+                    best, best_score = e, score
+            if best is None or best_score < s.answer_cache_threshold:
+                return None
+            self.hits += 1
+            best_id = best.id
+        with db_session(s) as conn:
+            conn.execute("UPDATE answer_cache SET hits=hits+1 WHERE id=?", (best_id,))
+        return best.answer
+
+    def store(self, s: Settings, question: str, model: str, system_prompt: str, answer: str) -> None:
+        norm = normalize(question)
+        if not norm or not answer:
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        cutoff = (datetime.now(timezone.utc) - timedelta(hours=s.answer_cache_ttl_hours)).isoformat()
+        variant = _variant(model, system_prompt)
+        with db_session(s) as conn:
+            cur = conn.execute(
+                "INSERT INTO answer_cache(variant,question,normalized,answer,hits,created_at) VALUES(?,?,?,?,0,?)",
+                (variant, question, norm, answer, now),
+            )
+            entry_id = int(cur.lastrowid)
+            expired = [r["id"] for r in conn.execute("SELECT id FROM answer_cache WHERE created_at<?", (cutoff,))]
+            excess = conn.execute("SELECT COUNT(1) AS c FROM answer_cache").fetchone()["c"] - len(expired) - s.answer_cache_max_entries
+            if excess > 0:
+                expired += [r["id"] for r in conn.execute(
+                    "SELECT id FROM answer_cache WHERE created_at>=? ORDER BY id LIMIT ?", (cutoff, excess)
+                )]
+            conn.executemany("DELETE FROM answer_cache WHERE id=?", [(i,) for i in expired])
+        with self._lock:
+            self._ensure_loaded(s)
+            self._add(_Entry(entry_id, variant, norm, answer, now))
+            for i in expired:
+                self._remove(i)
+            self.stores += 1
+
+    def purge(self, s: Settings) -> int:
+        with db_session(s) as conn:
+            n = conn.execute("DELETE FROM answer_cache").rowcount
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._loaded = True
+        return n
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "misses": self.lookups - self.hits,
+                "stores": self.stores,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            }
+
+answer_cache = AnswerCache()
@@ -1,23 +1,39 @@
-import requests
+import hashlib
+from typing import Optional
+
+import httpx
 
 GEOCODE_URL = "https://geocode-api.arcgis.com/arcgis/rest/services/World/GeocodeServer/findAddressCandidates"
 
-def geocode_single_line(address: str, api_key: str, max_locations: int = 1):
+def _stub_location(address: str) -> tuple[float, float]:
+    # Deterministic point inside greater Guayaquil, for tests and offline development.
+    h = hashlib.sha256(address.lower().encode("utf-8")).digest()
+    return -2.35 + 0.35 * h[0] / 255, -80.05 + 0.30 * h[1] / 255
+
+async def geocode_single_line_async(
+    client: httpx.AsyncClient, address: str, api_key: str, url: str = "", timeout: float = 10,
+) -> tuple[Optional[float], Optional[float]]:
+    if url == "stub":
+        return _stub_location(address)
     if not api_key:
-        return None, None
+        # Not a miss: raised, so the job does not cache it and a later run with a key retries it.
+        raise ValueError("ARCGIS_API_KEY vacío")
     params = {
         "f": "json",
         "singleLine": address,
-        "maxLocations": max_locations,
+        "maxLocations": 1,
         "outFields": "Match_addr,Addr_type",
         "token": api_key,
     }
-    r = requests.get(GEOCODE_URL, params=params, timeout=25)
+    r = await client.get(url or GEOCODE_URL, params=params, timeout=timeout)
     r.raise_for_status()
     data = r.json()
+    if "error" in data:
+        # Bad token, quota, ...: ArcGIS answers these with HTTP 200. Raised, like a missing key.
+        err = data["error"] or {}
+        raise ValueError(f"ArcGIS {err.get('code')}: {err.get('message')}")
     cands = data.get("candidates") or []
     if not cands:
         return None, None
     loc = cands[0].get("location") or {}
-    # ArcGIS returns x=lon, y=lat
     return loc.get("y"), loc.get("x")
@@ -0,0 +1,156 @@
+"""Content-addressed upload store.
+
+Uploads live at ``<upload_dir>/blobs/ab/cd/<sha256>.<ext>``, so identical files are stored once
+and names never collide. ``messages.image_path`` and ``users.avatar_path`` hold that relative
+path; the ``uploads`` row keeps a reference count maintained by triggers (migration 11).
+A JPEG thumbnail and a WebP copy are written next to the original on the image pool, once per
+blob; ``variants`` records which exist plus an ATTEMPTED bit. Rows left without references
+are removed by the sweeper after SWEEPER_ORPHAN_GRACE.
+Older rows still hold absolute paths under uploads/chat and uploads/avatars and keep working.
+"""
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from ..settings import Settings
+from ..db import db_session
+from ..utils.files import save_upload
+from . import images
+
+ROOT = "blobs"
+THUMB_SUFFIX = ".thumb.jpg"
+WEBP_SUFFIX = ".webp"
+ATTEMPTED = 4  # uploads.variants bit: variants were built, or cannot be, for this blob
+EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".heic", ".heif", ".bmp"}
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _ext(filename: str, mime: Optional[str]) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in EXTENSIONS:
+        return ".jpg" if ext == ".jpeg" else ext
+    if mime and mime.startswith("image/"):
+        return "." + mime.split("/", 1)[1].split(";")[0].replace("jpeg", "jpg")[:8]
+    return ".bin"
+
+def rel_path(digest: str, ext: str) -> str:
+    return f"{ROOT}/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+def abs_path(s: Settings, path: str) -> str:
+    """Filesystem path for a stored image_path / avatar_path (relative blob or legacy absolute)."""
+    return path if os.path.isabs(path) else os.path.join(s.upload_dir, path)
+
+def _variant(path: str, suffix: str) -> str:
+    return os.path.splitext(path)[0] + suffix
+
+def ingest(s: Settings, src, filename: str, mime: Optional[str], max_bytes: int) -> str:
+    """Store an upload's file object and return its relative path. Blocking: call from a thread.
+    Raises UploadTooLarge. The caller references the path in its own row, which bumps refcount."""
+    tmp = os.path.join(s.upload_dir, ROOT, "tmp", uuid.uuid4().hex)  # created by Settings.ensure_dirs
+    h = hashlib.sha256()
+    size = save_upload(src, tmp, max_bytes, digest=h)
+    digest = h.hexdigest()
+    now = _now()
+    with db_session(s) as conn:
+        # The insert takes the write lock, so concurrent uploads of the same new bytes cannot both
+        # create the row, and a sweep deleting it has already removed its files (see collect).
+        created = conn.execute(
+            "INSERT INTO uploads(hash,path,size,mime,created_at,touched_at) VALUES(?,?,?,?,?,?) "
+            "ON CONFLICT(hash) DO NOTHING",
+            (digest, rel_path(digest, _ext(filename, mime)), size, mime, now, now),
+        ).rowcount == 1
+        if not created:
+            # Known content: restart its grace period, so the sweeper leaves it alone.
+            conn.execute("UPDATE uploads SET touched_at=? WHERE hash=?", (now, digest))
+        row = conn.execute("SELECT path,variants FROM uploads WHERE hash=?", (digest,)).fetchone()
+        conn.commit()
+    path, variants = row["path"], row["variants"]
+    dest = abs_path(s, path)
+    if created or not os.path.exists(dest):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(tmp, dest)
+    else:
+        os.remove(tmp)  # keep the first copy
+    if not variants & ATTEMPTED:
+        images.submit(s, _build_variants, s, digest, path)
+    return path
+
+def _build_variants(s: Settings, digest: str, path: str) -> None:
+    src = abs_path(s, path)
+    done = images.make_variants(
+        src, _variant(src, THUMB_SUFFIX), _variant(src, WEBP_SUFFIX),
+        s.thumb_max_side, s.webp_max_side, s.vision_jpeg_quality,
+    )
+    if images.Image is None:
+        return  # retried on a later upload once Pillow is installed
+    with db_session(s) as conn:
+        # ATTEMPTED also covers non-images and failed decodes, so re-uploads do not resubmit them.
+        conn.execute("UPDATE uploads SET variants=variants|? WHERE hash=?", (done | ATTEMPTED, digest))
+
+def urls(s: Settings, path: Optional[str], variants: Optional[int], legacy_dir: str) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    """(original, thumbnail, webp) URLs; variants that are not generated yet come back as None."""
+    if not path:
+        return None, None, None
+    base = f"{s.public_base_url}/uploads"
+    if os.path.isabs(path):
+        return f"{base}/{legacy_dir}/{os.path.basename(path)}", None, None
+    variants = variants or 0
+    return (
+        f"{base}/{path}",
+        f"{base}/{_variant(path, THUMB_SUFFIX)}" if variants & images.THUMB else None,
+        f"{base}/{_variant(path, WEBP_SUFFIX)}" if variants & images.WEBP else None,
+    )
+
+def collect(s: Settings, conn, batch: int) -> tuple[int, int]:
+    """Delete unreferenced blobs (and their variants) idle for longer than SWEEPER_ORPHAN_GRACE."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=s.sweeper_orphan_grace)).isoformat()
+    files = removed_bytes = 0
+    while True:
+        rows = conn.execute(
+            "SELECT hash,path FROM uploads WHERE refcount<=0 AND touched_at<? LIMIT ?", (cutoff, batch),
+        ).fetchall()
+        for r in rows:
+            # Re-checked per row: an upload of the same bytes may have revived it meanwhile.
+            if conn.execute("DELETE FROM uploads WHERE hash=? AND refcount<=0 AND touched_at<?", (r["hash"], cutoff)).rowcount != 1:
+                continue
+            # Files go before the commit: until then the DELETE holds the write lock, so an ingest
+            # of the same bytes waits and writes its file after these are gone, not before.
+            src = abs_path(s, r["path"])
+            for p in (src, _variant(src, THUMB_SUFFIX), _variant(src, WEBP_SUFFIX)):
+                try:
+                    removed_bytes += os.path.getsize(p)
+                    os.remove(p)
+                    files += 1
+                except OSError:
+                    pass
+            conn.commit()
+        conn.commit()
+        if len(rows) < batch:
+            break
+    # Temp files left by an interrupted ingest.
+    try:
+        entries = list(os.scandir(os.path.join(s.upload_dir, ROOT, "tmp")))
+    except FileNotFoundError:
+        entries = []
+    stale = datetime.now(timezone.utc).timestamp() - s.sweeper_orphan_grace
+    for entry in entries:
+        try:
+            st = entry.stat()
+            if st.st_mtime < stale:
+                os.remove(entry.path)
+                files += 1
+                removed_bytes += st.st_size
+        except OSError:
+            pass
+    return files, removed_bytes
+
+def stats(s: Settings) -> dict:
+    with db_session(s) as conn:
+        row = conn.execute(
+            "SELECT count(*) AS blobs, coalesce(sum(size),0) AS bytes, coalesce(sum(refcount),0) AS refs, "
+            "sum(refcount<=0) AS unreferenced, sum((variants&3)=3) AS with_variants FROM uploads"
+        ).fetchone()
+    return {k: row[k] or 0 for k in row.keys()}
@@ -0,0 +1,108 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+
+class Overloaded(Exception):
+    """Raised when a bulkhead queue is full or the caller's deadline passes while queued."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} overloaded")
+        self.name = name
+        self.retry_after = retry_after
+
+class Bulkhead:
+    """Concurrency budget with a bounded priority wait queue (lower priority value runs first).
+
+    Runs on the event loop only, so plain counters are enough; no locks needed.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._queue_max = 0
+        self._hold_avg = 1.0  # EWMA of seconds a slot is held, for Retry-After
+
+    def configure(self, max_concurrent: int, max_queue: int, queue_timeout: float) -> None:
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+
+    def _retry_after(self) -> int:
+        backlog = len(self._waiters) + self._active
+        return int(min(30, max(1, math.ceil(self._hold_avg * backlog / self.max_concurrent))))
+
+    def _wake_next(self) -> None:
+        while self._waiters and self._active < self.max_concurrent:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self._active += 1
+                fut.set_result(None)
+
+    async def _acquire(self, priority: int) -> None:
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._rejected += 1
+            raise Overloaded(self.name, self._retry_after())
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self._queue_max = max(self._queue_max, len(self._waiters))
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # Slot was granted just as we gave up; hand it on.
+                self._active -= 1
+                self._wake_next()
+            else:
+                fut.cancel()
+                self._waiters = [w for w in self._waiters if w[2] is not fut]
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._timed_out += 1
+            raise Overloaded(self.name, self._retry_after())
+        finally:
+            waited = time.monotonic() - started
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = 0):
+        await self._acquire(priority)
+        self._admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._hold_avg = 0.8 * self._hold_avg + 0.2 * (time.monotonic() - started)
+            self._active -= 1
+            self._wake_next()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self._active,
+            "queue_depth": len(self._waiters),
+            "queue_depth_max": self._queue_max,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+            "wait_time_s": round(self._wait_total, 6),
+            "wait_time_max_s": round(self._wait_max, 6),
+        }
@@ -0,0 +1,34 @@
+"""Version of the points catalogue, maintained by triggers on `points` (migration 8)."""
+import threading
+import time
+
+from ..settings import Settings
+from ..db import db_session
+
+# How long a version read is trusted before asking SQLite again. Writes made through this
+# process call invalidate(), so the lag only applies to other processes (seed CLI, other workers).
+RECHECK_S = 2.0
+
+class CatalogueVersion:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._value: tuple[int, str] = (0, "")
+        self._checked_at = 0.0
+
+    def invalidate(self) -> None:
+        self._checked_at = 0.0
+
+    def get(self, s: Settings) -> tuple[int, str]:
+        """(version, changed_at ISO string)."""
+        if time.monotonic() - self._checked_at < RECHECK_S:
+            return self._value
+        with self._lock:
+            if time.monotonic() - self._checked_at >= RECHECK_S:
+                with db_session(s) as conn:
+                    row = conn.execute("SELECT version,changed_at FROM catalogue_version WHERE name=?", (self.name,)).fetchone()
+                self._value = (int(row["version"]), row["changed_at"]) if row else (0, "")
+                self._checked_at = time.monotonic()
+            return self._value
+
+points_version = CatalogueVersion("points")
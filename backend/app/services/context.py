@@ -0,0 +1,162 @@
+"""Token-budgeted chat context with a rolling summary of older turns.
+
+build_history() walks the chat newest-first and keeps turns until CONTEXT_TOKEN_BUDGET is
+spent. Anything older is represented by the stored summary in chat_summaries. Turns that fall
+out of the window but are not in the summary yet are folded in by a low-priority background
+task, a chunk at a time, so the request path never re-summarises the whole chat.
+"""
+import asyncio
+import logging
+import math
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import anyio
+
+from ..settings import Settings
+from ..db import db_session, run_in_db
+from .groq import groq_chat
+
+try:  # optional dependency
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+log = logging.getLogger(__name__)
+
+_PIECES = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+SUMMARY_CHUNK = 30          # messages folded per LLM call
+SUMMARY_PRIORITY = 10       # behind interactive chat calls in the LLM bulkhead
+_MAX_CHARS_PER_MESSAGE = 1500
+
+SUMMARY_PROMPT = (
+    "Resume la conversación entre un usuario y Katara (asistente de reciclaje en Guayaquil). "
+    "Conserva datos útiles para continuar: materiales, dudas, ubicaciones, decisiones y preferencias del usuario. "
+    "Máximo 120 palabras, en español, sin saludos."
+)
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # First use, not import: get_encoding may download its BPE files.
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # encoding files unavailable offline
+        return None
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    # Offline approximation of a BPE tokenizer: one token per punctuation mark,
+    # roughly one per 4 characters of each word.
+    return sum(1 if len(p) <= 4 else math.ceil(len(p) / 4) for p in _PIECES.findall(text))
+
+def build_history(s: Settings, chat_id: int, conn=None) -> tuple[list[dict], int]:
+    """Return (messages for the prompt, number of turns in the chat window).
+
+    The summary, when present, comes first as a system message. Schedules a background
+    fold when older turns are outside both the window and the summary. Callers inside
+    run_in_db pass the connection they already hold.
+    """
+    if conn is None:
+        with db_session(s) as conn:
+            return build_history(s, chat_id, conn)
+    budget = s.context_token_budget
+    turns: list[dict] = []
+    oldest_included = None
+    overflow = False
+    srow = conn.execute("SELECT summary,upto_message_id FROM chat_summaries WHERE chat_id=?", (chat_id,)).fetchone()
+    upto = int(srow["upto_message_id"]) if srow else 0
+    if srow:
+        budget -= count_tokens(srow["summary"])
+    cur = conn.execute(
+        "SELECT id,role,content FROM messages WHERE chat_id=? AND id>? ORDER BY id DESC",
+        (chat_id, upto),
+    )
+    for r in cur:
+        if r["role"] not in ("user", "assistant"):
+            continue
+        cost = count_tokens(r["content"]) + 4  # role/formatting overhead
+        if turns and cost > budget:
+            overflow = True
+            break
+        budget -= cost
+        turns.append({"role": r["role"], "content": r["content"]})
+        oldest_included = int(r["id"])
+    turns.reverse()
+
+    messages = []
+    if srow:
+        messages.append({"role": "system", "content": f"Resumen de la conversación anterior: {srow['summary']}"})
+    messages.extend(turns)
+    if overflow and oldest_included is not None:
+        schedule_fold(s, chat_id, oldest_included - 1)
+    return messages, len(turns) + (1 if srow else 0)
+
+_folding: set[int] = set()
+_tasks: set[asyncio.Task] = set()
+
+def schedule_fold(s: Settings, chat_id: int, fold_upto: int) -> None:
+    """Fold messages up to fold_upto into the chat summary in the background (one task per chat)."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Called from a worker thread (build_history inside run_in_db): hop back to its event loop.
+        try:
+            anyio.from_thread.run_sync(schedule_fold, s, chat_id, fold_upto)
+        except RuntimeError:  # plain thread, no loop to schedule on
+            pass
+        return
+    if chat_id in _folding:
+        return
+    _folding.add(chat_id)
+    task = loop.create_task(_fold(s, chat_id, fold_upto))
+    _tasks.add(task)
+    task.add_done_callback(lambda t: (_tasks.discard(t), _folding.discard(chat_id)))
+
+def _pending(conn, chat_id: int, fold_upto: int):
+    """(current summary row, next chunk of messages to fold into it)."""
+    srow = conn.execute("SELECT summary,upto_message_id FROM chat_summaries WHERE chat_id=?", (chat_id,)).fetchone()
+    upto = int(srow["upto_message_id"]) if srow else 0
+    rows = conn.execute(
+        "SELECT id,role,content FROM messages WHERE chat_id=? AND id>? AND id<=? ORDER BY id LIMIT ?",
+        (chat_id, upto, fold_upto, SUMMARY_CHUNK),
+    ).fetchall()
+    return srow, rows
+
+async def _fold(s: Settings, chat_id: int, fold_upto: int) -> None:
+    if not s.groq_api_key_chat:
+        return
+    try:
+        while True:
+            srow, rows = await run_in_db(lambda conn: _pending(conn, chat_id, fold_upto), s)
+            if not rows:
+                return
+            transcript = "\n".join(
+                f"{'Usuario' if r['role'] == 'user' else 'Katara'}: {r['content'][:_MAX_CHARS_PER_MESSAGE]}"
+                for r in rows if r["role"] in ("user", "assistant")
+            )
+            previous = srow["summary"] if srow else "(sin resumen previo)"
+            summary = await groq_chat(
+                s.groq_api_key_chat,
+                s.chat_model,
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": f"Resumen previo:\n{previous}\n\nNuevos mensajes:\n{transcript}"},
+                ],
+                temperature=0.1,
+                max_tokens=s.summary_max_tokens,
+                timeout=s.llm_chat_timeout,
+                priority=SUMMARY_PRIORITY,
+            )
+            values = (chat_id, summary.strip(), int(rows[-1]["id"]), datetime.now(timezone.utc).isoformat())
+            await run_in_db(lambda conn: conn.execute(
+                "INSERT INTO chat_summaries(chat_id,summary,upto_message_id,updated_at) VALUES(?,?,?,?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET summary=excluded.summary, upto_message_id=excluded.upto_message_id, updated_at=excluded.updated_at",
+                values,
+            ), s)
+    except Exception:
+        log.warning("chat %s: summary fold failed", chat_id, exc_info=True)
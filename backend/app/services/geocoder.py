@@ -0,0 +1,136 @@
+"""Background job behind POST /points/geocode-missing.
+
+Addresses are geocoded concurrently (GEOCODE_CONCURRENCY at a time) and each result is written
+to geocode_cache and to its points at once, so an interrupted run loses nothing: the next run
+only sees points that still lack coordinates, and cached addresses cost no request.
+"""
+import asyncio
+import logging
+import re
+from datetime import datetime, timezone
+from typing import Optional
+
+import httpx
+
+from ..settings import Settings
+from ..db import run_in_db
+from .arcgis import geocode_single_line_async
+from .catalogue import points_version
+from .metrics import time_dependency
+
+log = logging.getLogger(__name__)
+
+CITY_SUFFIX = ", Guayaquil, Ecuador"
+_SPACES = re.compile(r"\s+")
+
+def normalize_query(address: str) -> str:
+    return _SPACES.sub(" ", (address or "").strip().lower())
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+class GeocodeJob:
+    def __init__(self, retry_misses: bool):
+        self.retry_misses = retry_misses
+        self.status = "running"
+        self.started_at = _now()
+        self.finished_at: Optional[str] = None
+        self.total = 0          # distinct addresses to resolve
+        self.done = 0
+        self.updated = 0        # points that got coordinates
+        self.from_cache = 0
+        self.not_found = 0
+        self.errors = 0
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {k: v for k, v in vars(self).items() if not k.startswith("_")}
+
+    async def _apply(self, s: Settings, query: str, point_ids: list[int], lat, lon, cache: bool) -> None:
+        # One short transaction per address: progress survives a crash or restart.
+        def write(conn) -> int:
+            if cache:
+                conn.execute(
+                    "INSERT OR REPLACE INTO geocode_cache(query,lat,lon,created_at) VALUES(?,?,?,?)",
+                    (query, lat, lon, _now()),
+                )
+            if lat is None or lon is None:
+                return 0
+            now = _now()
+            # Rows actually changed: a point edited by hand meanwhile is skipped by the guard.
+            return conn.executemany(
+                "UPDATE points SET lat=?, lon=?, updated_at=? WHERE id=? AND (lat IS NULL OR lon IS NULL)",
+                [(float(lat), float(lon), now, pid) for pid in point_ids],
+            ).rowcount
+
+        changed = await run_in_db(write, s)
+        if lat is not None and lon is not None:
+            self.updated += changed
+        else:
+            self.not_found += 1
+
+    async def run(self, s: Settings) -> None:
+        try:
+            def plan(conn):
+                rows = conn.execute("SELECT id,address FROM points WHERE lat IS NULL OR lon IS NULL").fetchall()
+                pending: dict[str, list[int]] = {}
+                for r in rows:
+                    pending.setdefault(normalize_query(r["address"] + CITY_SUFFIX), []).append(int(r["id"]))
+                cached = {}
+                for q in pending:
+                    row = conn.execute("SELECT lat,lon FROM geocode_cache WHERE query=?", (q,)).fetchone()
+                    if row is not None and (row["lat"] is not None or not self.retry_misses):
+                        cached[q] = (row["lat"], row["lon"])
+                return pending, cached
+
+            pending, cached = await run_in_db(plan, s)
+            self.total = len(pending)
+
+            for q, (lat, lon) in cached.items():
+                await self._apply(s, q, pending.pop(q), lat, lon, cache=False)
+                self.from_cache += 1
+                self.done += 1
+
+            sem = asyncio.Semaphore(max(1, s.geocode_concurrency))
+            async with httpx.AsyncClient() as client:
+                async def one(query: str, point_ids: list[int]) -> None:
+                    async with sem:
+                        try:
+                            with time_dependency("geocoder"):
+                                lat, lon = await geocode_single_line_async(
+                                    client, query, s.arcgis_api_key, s.arcgis_geocode_url, s.geocode_timeout,
+                                )
+                        except (httpx.HTTPError, ValueError) as e:
+                            # Not cached: a transient failure should be retried by the next run.
+                            self.errors += 1
+                            log.warning("geocode failed for %r: %s", query, e)
+                        else:
+                            await self._apply(s, query, point_ids, lat, lon, cache=True)
+                        self.done += 1
+
+                await asyncio.gather(*(one(q, ids) for q, ids in pending.items()))
+            self.status = "done"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            log.exception("geocode job failed")
+        finally:
+            self.finished_at = _now()
+            points_version.invalidate()
+
+class GeocodeJobs:
+    """At most one job at a time; the last one stays around for the status endpoint."""
+
+    def __init__(self):
+        self.current: Optional[GeocodeJob] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, s: Settings, retry_misses: bool = False) -> GeocodeJob:
+        if self.current is not None and self.current.status == "running":
+            return self.current
+        job = GeocodeJob(retry_misses)
+        self.current = job
+        self._task = asyncio.get_running_loop().create_task(job.run(s))
+        return job
+
+jobs = GeocodeJobs()
@@ -1,17 +1,98 @@
+import asyncio
 import base64
-import requests
+import json
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from .bulkhead import Bulkhead
+from .metrics import time_dependency
 
 GROQ_ENDPOINT = "https://api.groq.com/openai/v1/chat/completions"
 
-def groq_chat(api_key: str, model: str, messages: list, temperature: float = 0.3, max_tokens: int = 700) -> str:
+# Shared keep-alive pool. configure() is called at startup with values from Settings;
+# GROQ_ENDPOINT can point at a local stub server in tests.
+_endpoint = GROQ_ENDPOINT
+_limits = httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=30)
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Separate admission budgets so a burst of image uploads cannot starve text chats.
+chat_bulkhead = Bulkhead("llm_chat", max_concurrent=8, max_queue=32, queue_timeout=15)
+vision_bulkhead = Bulkhead("llm_vision", max_concurrent=3, max_queue=16, queue_timeout=15)
+
+def configure(
+    endpoint: str, max_connections: int, chat_concurrency: int = 8, vision_concurrency: int = 3,
+    queue_size: int = 32, queue_timeout: float = 15, vision_queue_size: int = 16, vision_queue_timeout: float = 15,
+) -> None:
+    global _endpoint, _limits
+    _endpoint = endpoint or GROQ_ENDPOINT
+    _limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=30)
+    chat_bulkhead.configure(chat_concurrency, queue_size, queue_timeout)
+    vision_bulkhead.configure(vision_concurrency, vision_queue_size, vision_queue_timeout)
+
+def _get_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    # A client is bound to the loop that created it (matters for test clients that spin up new loops).
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(limits=_limits)
+        _client_loop = loop
+    return _client
+
+async def aclose() -> None:
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+async def _complete(bulkhead: Bulkhead, api_key: str, payload: dict, timeout: float, priority: int) -> str:
+    # Timed inside the slot: queueing shows up in the bulkhead stats, not as provider latency.
+    async with bulkhead.slot(priority):
+        with time_dependency(bulkhead.name):
+            r = await _get_client().post(
+                _endpoint,
+                headers={"Authorization": f"Bearer {api_key}", "Content-Type":"application/json"},
+                json=payload,
+                timeout=httpx.Timeout(timeout, connect=10.0),
+            )
+            r.raise_for_status()
+    return r.json()["choices"][0]["message"]["content"]
+
+async def groq_chat(api_key: str, model: str, messages: list, temperature: float = 0.3, max_tokens: int = 700, timeout: float = 60, priority: int = 0) -> str:
     if not api_key:
         return "⚠️ Katara no está configurada (falta GROQ_API_KEY_CHAT)."
     payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
-    r = requests.post(GROQ_ENDPOINT, headers={"Authorization": f"Bearer {api_key}", "Content-Type":"application/json"}, json=payload, timeout=60)
-    r.raise_for_status()
-    return r.json()["choices"][0]["message"]["content"]
+    return await _complete(chat_bulkhead, api_key, payload, timeout, priority)
 
-def groq_vision(api_key: str, model: str, prompt: str, image_bytes: bytes, mime: str = "image/jpeg") -> str:
+async def groq_chat_stream(api_key: str, model: str, messages: list, temperature: float = 0.3, max_tokens: int = 700, timeout: float = 60, priority: int = 0) -> AsyncIterator[str]:
+    """Yield content deltas as the completion is generated (OpenAI-compatible SSE)."""
+    if not api_key:
+        yield "⚠️ Katara no está configurada (falta GROQ_API_KEY_CHAT)."
+        return
+    payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens, "stream": True}
+    async with chat_bulkhead.slot(priority):
+        with time_dependency("llm_chat_stream"):
+            async with _get_client().stream(
+                "POST",
+                _endpoint,
+                headers={"Authorization": f"Bearer {api_key}", "Content-Type":"application/json"},
+                json=payload,
+                timeout=httpx.Timeout(timeout, connect=10.0),
+            ) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+
+async def groq_vision(api_key: str, model: str, prompt: str, image_bytes: bytes, mime: str = "image/jpeg", timeout: float = 90, priority: int = 0) -> str:
     if not api_key:
         return '{"error":"missing GROQ_API_KEY_VISION"}'
     data_url = f"data:{mime};base64," + base64.b64encode(image_bytes).decode("utf-8")
@@ -23,6 +104,4 @@ def groq_vision(api_key: str, model: str, prompt: str, image_bytes: bytes, mime:
         ],
     }]
     payload = {"model": model, "messages": messages, "temperature": 0.2, "max_tokens": 700}
-    r = requests.post(GROQ_ENDPOINT, headers={"Authorization": f"Bearer {api_key}", "Content-Type":"application/json"}, json=payload, timeout=90)
-    r.raise_for_status()
-    return r.json()["choices"][0]["message"]["content"]
+    return await _complete(vision_bulkhead, api_key, payload, timeout, priority)
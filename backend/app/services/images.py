@@ -0,0 +1,107 @@
+"""Downscale uploaded photos before they are hashed and sent to the vision model.
+
+A phone photo is often 4000x3000 and several MB; the vision model gains nothing beyond
+VISION_MAX_SIDE pixels. JPEGs are decoded with ``draft`` (libjpeg scales while decoding), so
+even the decoded bitmap stays small. Work runs on a small dedicated pool so a burst of uploads
+cannot take over the threadpool that serves sync endpoints. Without Pillow the original is used.
+"""
+import asyncio
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_stats = {"downscaled": 0, "passthrough": 0, "bytes_in": 0, "bytes_out": 0}
+
+def _pool(workers: int) -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image")
+    return _executor
+
+def shutdown() -> None:
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def downscale(path: str, mime: str, max_side: int, quality: int) -> tuple[bytes, str]:
+    """(bytes, mime) of the image at path, re-encoded as JPEG no larger than max_side.
+    Falls back to the original file when Pillow is missing or cannot decode it."""
+    _stats["bytes_in"] += os.path.getsize(path)
+    if Image is not None:
+        try:
+            with Image.open(path) as im:
+                if im.format == "JPEG" and max(im.size) <= max_side:
+                    raise ValueError("already small")  # re-encoding would only lose quality
+                im.draft("RGB", (max_side, max_side))
+                im = ImageOps.exif_transpose(im)
+                if im.mode != "RGB":
+                    im = im.convert("RGB")
+                im.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+                out = io.BytesIO()
+                im.save(out, "JPEG", quality=quality, optimize=True)
+            data = out.getvalue()
+            _stats["downscaled"] += 1
+            _stats["bytes_out"] += len(data)
+            return data, "image/jpeg"
+        except Exception:
+            pass
+    with open(path, "rb") as f:
+        data = f.read()
+    _stats["passthrough"] += 1
+    _stats["bytes_out"] += len(data)
+    return data, mime
+
+async def prepare_for_vision(s, path: str, mime: str) -> tuple[bytes, str]:
+    return await asyncio.get_running_loop().run_in_executor(
+        _pool(s.image_workers), downscale, path, mime, s.vision_max_side, s.vision_jpeg_quality,
+    )
+
+def stats() -> dict:
+    return {"pillow": Image is not None, **_stats}
+
+THUMB = 1
+WEBP = 2
+
+def _save_atomic(im, dest: str, fmt: str, **params) -> None:
+    tmp = dest + ".part"
+    im.save(tmp, fmt, **params)
+    os.replace(tmp, dest)
+
+def make_variants(path: str, thumb_dest: str, webp_dest: str, thumb_side: int, webp_side: int, quality: int) -> int:
+    """Write a JPEG thumbnail and a WebP copy of the image at path; returns the THUMB|WEBP bits
+    that now exist. Decodes once, at the size the larger variant needs."""
+    if Image is None:
+        return 0
+    done = 0
+    try:
+        with Image.open(path) as im:
+            im.draft("RGB", (webp_side, webp_side))
+            im = ImageOps.exif_transpose(im)
+            if im.mode not in ("RGB", "RGBA"):
+                im = im.convert("RGBA" if "transparency" in im.info else "RGB")
+            im.thumbnail((webp_side, webp_side), Image.Resampling.LANCZOS)
+            _save_atomic(im, webp_dest, "WEBP", quality=quality, method=4)
+            done |= WEBP
+            im.thumbnail((thumb_side, thumb_side), Image.Resampling.LANCZOS)
+            _save_atomic(im.convert("RGB"), thumb_dest, "JPEG", quality=quality, optimize=True)
+            done |= THUMB
+    except Exception:
+        pass
+    return done
+
+def submit(s, fn, *args):
+    """Fire-and-forget on the image pool; usable from sync endpoints and the event loop alike."""
+    return _pool(s.image_workers).submit(fn, *args)
@@ -0,0 +1,204 @@
+"""Prometheus text-format metrics without the client library.
+
+Every thread records into its own shard (a plain dict reached through threading.local), so the
+hot path never takes a lock; shards are only summed when /metrics is scraped. Most recording
+happens on the event loop thread anyway, which makes that one shard effectively private.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _fmt_num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._shards_lock:  # once per thread
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _snapshot(self) -> list[dict]:
+        with self._shards_lock:
+            return [dict(s) for s in self._shards]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0.0) + amount
+
+    def collect(self) -> Iterable[str]:
+        total: dict = {}
+        for shard in self._snapshot():
+            for k, v in shard.items():
+                total[k] = total.get(k, 0.0) + v
+        for k in sorted(total):
+            yield f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_num(total[k])}"
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1.0) -> None:
+        self.inc(*label_values, amount=-amount)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *label_values) -> None:
+        shard = self._shard()
+        row = shard.get(label_values)
+        if row is None:
+            # per-bucket (non-cumulative) counts, then sum, then count
+            row = shard[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                row[i] += 1
+                break
+        row[-2] += value
+        row[-1] += 1
+
+    def collect(self) -> Iterable[str]:
+        total: dict = {}
+        for shard in self._snapshot():
+            for k, row in shard.items():
+                acc = total.setdefault(k, [0] * len(row))
+                for i, v in enumerate(list(row)):
+                    acc[i] += v
+        for k in sorted(total):
+            row = total[k]
+            cumulative = 0
+            for i, upper in enumerate(self.buckets):
+                cumulative += row[i]
+                le = 'le="%s"' % upper
+                yield f"{self.name}_bucket{_fmt_labels(self.labels, k, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_fmt_labels(self.labels, k, le)} {row[-1]}"
+            yield f"{self.name}_sum{_fmt_labels(self.labels, k)} {_fmt_num(round(row[-2], 6))}"
+            yield f"{self.name}_count{_fmt_labels(self.labels, k)} {row[-1]}"
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], Iterable[tuple[str, str, str, dict, float]]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn: Callable[[], Iterable[tuple[str, str, str, dict, float]]]) -> None:
+        """fn yields (name, kind, help, labels, value) at scrape time, for state owned elsewhere."""
+        if fn not in self._collectors:  # create_app may run more than once per process
+            self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.collect())
+        # Each family's samples must be contiguous in the exposition format.
+        families: dict[str, tuple[str, str, list[str]]] = {}
+        for fn in self._collectors:
+            try:
+                samples = list(fn())
+            except Exception:
+                continue
+            for name, kind, help_text, labels, value in samples:
+                names = tuple(labels)
+                sample = f"{name}{_fmt_labels(names, tuple(labels[n] for n in names))} {_fmt_num(value)}"
+                families.setdefault(name, (kind, help_text, []))[2].append(sample)
+        for name, (kind, help_text, samples) in families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.register(Counter("katara_http_requests_total", "HTTP requests by route template, method and status.", ("route", "method", "status")))
+http_latency = registry.register(Histogram("katara_http_request_duration_seconds", "Time from request start to the last response byte.", ("route", "method")))
+http_in_flight = registry.register(Gauge("katara_http_requests_in_flight", "Requests currently being served.", ("method",)))
+dependency_latency = registry.register(Histogram("katara_dependency_duration_seconds", "Outbound calls by dependency and outcome.", ("dependency", "outcome")))
+
+@contextmanager
+def time_dependency(name: str):
+    """Time an outbound call: `with time_dependency("llm_chat"): ...` (also fine inside async code)."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        dependency_latency.observe(time.perf_counter() - started, name, outcome)
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are timed to their last chunk."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        root_path = scope.get("root_path", "")
+        status = {"code": 500}
+        started = time.perf_counter()
+        http_in_flight.inc(method)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec(method)
+            route = _route_template(scope, root_path)
+            http_requests.inc(route, method, str(status["code"]))
+            http_latency.observe(time.perf_counter() - started, route, method)
+
+def _route_template(scope, root_path: str) -> str:
+    # Templates, never raw paths, so /chats/123/messages and /chats/456/messages share a series.
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path_format", None) or route.path
+    mounted = scope.get("root_path", "")
+    if mounted != root_path:
+        return mounted[len(root_path):] + "/{path}"  # StaticFiles mounts
+    return "<unmatched>"
+
+def render_latest() -> str:
+    return registry.render()
@@ -0,0 +1,181 @@
+"""Transactional email outbox.
+
+Request handlers call ``enqueue`` with the same connection that writes the OTP or contact row, so
+the email exists if and only if that row does. ``OutboxSender`` (started from the app lifespan)
+claims due rows, sends them with at most MAIL_CONCURRENCY requests in flight, and reschedules
+failures with exponential backoff until MAIL_MAX_ATTEMPTS, after which the row is dead-lettered.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import httpx
+
+from ..settings import Settings, get_settings
+from ..db import db_session
+from .mailer import PermanentMailError, send_email_async
+from .metrics import time_dependency
+
+log = logging.getLogger(__name__)
+
+LEASE_S = 120          # a 'sending' row whose lease ran out (crashed worker) is picked up again
+CLAIM_BATCH = 50
+KEEP_SENT = timedelta(days=7)
+KEEP_DEAD = timedelta(days=30)
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat()
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def enqueue(conn, idempotency_key: str, to_email: str, subject: str, html: str) -> None:
+    """Queue an email inside the caller's transaction. A repeated key is ignored. Caller commits."""
+    now = _iso(_utcnow())
+    conn.execute(
+        "INSERT OR IGNORE INTO email_outbox(idempotency_key,to_email,subject,html,next_attempt_at,created_at) VALUES(?,?,?,?,?,?)",
+        (idempotency_key, to_email, subject, html, now, now),
+    )
+
+def backoff_s(s: Settings, attempts: int) -> float:
+    # Full jitter keeps a burst of failures from retrying in lockstep.
+    return random.uniform(0.5, 1.0) * min(s.mail_backoff_max, s.mail_backoff_base * (2 ** max(0, attempts - 1)))
+
+class OutboxSender:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.sent = 0
+        self.failed_attempts = 0
+        self.dead = 0
+
+    def wake(self) -> None:
+        """Ask the sender to look for work now. Safe to call from request threads."""
+        if self._loop is not None and self._wake is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _claim(self, s: Settings) -> list[dict]:
+        now = _utcnow()
+        lease = _iso(now + timedelta(seconds=LEASE_S))
+        claimed = []
+        with db_session(s) as conn:
+            install_id = conn.execute("SELECT value FROM app_meta WHERE key='install_id'").fetchone()["value"]
+            rows = conn.execute(
+                "SELECT id,idempotency_key,to_email,subject,html,attempts FROM email_outbox "
+                "WHERE status IN ('pending','sending') AND next_attempt_at<=? ORDER BY next_attempt_at LIMIT ?",
+                (_iso(now), CLAIM_BATCH),
+            ).fetchall()
+            for r in rows:
+                # Conditional update: another worker process may have claimed the row meanwhile.
+                cur = conn.execute(
+                    "UPDATE email_outbox SET status='sending', next_attempt_at=? WHERE id=? AND status IN ('pending','sending') AND next_attempt_at<=?",
+                    (lease, r["id"], _iso(now)),
+                )
+                if cur.rowcount == 1:
+                    claimed.append(dict(r, send_key=f"{install_id}-{r['idempotency_key']}"))
+        return claimed
+
+    def _finish(self, s: Settings, row: dict, error: Optional[str], permanent: bool = False, skipped: bool = False) -> None:
+        now = _utcnow()
+        with db_session(s) as conn:
+            if error is None:
+                conn.execute(
+                    "UPDATE email_outbox SET status=?, html='', sent_at=?, attempts=attempts+?, purge_after=?, last_error=? WHERE id=?",
+                    ("skipped" if skipped else "sent", _iso(now), 0 if skipped else 1, _iso(now + KEEP_SENT),
+                     "RESEND_API_KEY vacío" if skipped else None, row["id"]),
+                )
+                return
+            attempts = row["attempts"] + 1
+            if permanent or attempts >= s.mail_max_attempts:
+                conn.execute(
+                    "UPDATE email_outbox SET status='dead', attempts=?, last_error=?, purge_after=? WHERE id=?",
+                    (attempts, error[:500], _iso(now + KEEP_DEAD), row["id"]),
+                )
+                self.dead += 1
+                log.error("email %s dead-lettered after %d attempts: %s", row["idempotency_key"], attempts, error)
+            else:
+                conn.execute(
+                    "UPDATE email_outbox SET status='pending', attempts=?, last_error=?, next_attempt_at=? WHERE id=?",
+                    (attempts, error[:500], _iso(now + timedelta(seconds=backoff_s(s, attempts))), row["id"]),
+                )
+
+    async def _deliver(self, s: Settings, client: httpx.AsyncClient, sem: asyncio.Semaphore, row: dict) -> None:
+        async with sem:
+            if not s.resend_api_key:
+                # Same as before the outbox: no provider configured means nothing is sent.
+                await asyncio.to_thread(self._finish, s, row, None, skipped=True)
+                return
+            try:
+                with time_dependency("mail"):
+                    await send_email_async(
+                        client, s.resend_api_key, s.resend_from, row["to_email"], row["subject"], row["html"],
+                        idempotency_key=row["send_key"], endpoint=s.resend_endpoint,
+                    )
+            except PermanentMailError as e:
+                self.failed_attempts += 1
+                await asyncio.to_thread(self._finish, s, row, str(e), permanent=True)
+            except Exception as e:
+                self.failed_attempts += 1
+                await asyncio.to_thread(self._finish, s, row, f"{type(e).__name__}: {e}")
+            else:
+                self.sent += 1
+                await asyncio.to_thread(self._finish, s, row, None)
+
+    async def drain_once(self, client: httpx.AsyncClient) -> int:
+        s = get_settings()
+        rows = await asyncio.to_thread(self._claim, s)
+        if rows:
+            sem = asyncio.Semaphore(max(1, s.mail_concurrency))
+            await asyncio.gather(*(self._deliver(s, client, sem, r) for r in rows))
+        return len(rows)
+
+    async def _run(self) -> None:
+        async with httpx.AsyncClient() as client:
+            while True:
+                try:
+                    if await self.drain_once(client) >= CLAIM_BATCH:
+                        continue  # more may be due right now
+                except Exception:
+                    log.exception("outbox drain failed")
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=get_settings().mail_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._loop = None
+
+    def retry(self, s: Settings, outbox_id: int) -> bool:
+        """Put a dead-lettered email back in the queue."""
+        with db_session(s) as conn:
+            cur = conn.execute(
+                "UPDATE email_outbox SET status='pending', attempts=0, next_attempt_at=?, purge_after=NULL WHERE id=? AND status='dead'",
+                (_iso(_utcnow()), outbox_id),
+            )
+        self.wake()
+        return cur.rowcount == 1
+
+    def stats(self, s: Settings) -> dict:
+        with db_session(s) as conn:
+            counts = {r["status"]: r["n"] for r in conn.execute("SELECT status, count(*) AS n FROM email_outbox GROUP BY status")}
+        return {"running": self._task is not None, "sent": self.sent, "failed_attempts": self.failed_attempts,
+                "dead_lettered": self.dead, "by_status": counts}
+
+outbox = OutboxSender()
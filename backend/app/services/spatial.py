@@ -0,0 +1,261 @@
+"""In-memory grid index over the points catalogue for /points/nearest and map tiles.
+
+Points are bucketed into CELL_DEG x CELL_DEG cells and stored cell-contiguous in NumPy arrays,
+so a query reads rings of cells outwards from the query cell and computes haversine on each ring
+in one vectorized call. It stops as soon as the next ring cannot hold anything closer than the
+current k-th result (or beyond max_km).
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from ..settings import Settings
+from ..db import db_session
+from .catalogue import points_version
+
+EARTH_KM = 6371.0
+CELL_DEG = 0.05  # ~5.5 km at the equator
+KM_PER_DEG = math.pi * EARTH_KM / 180.0
+LON_CELLS = round(360 / CELL_DEG)
+MERCATOR_MAX_LAT = 85.05112878
+TILE_CACHE_MAX = 4096
+CLUSTER_GRID = 8  # clusters per tile side (a 256px tile -> 32px cells)
+
+POINT_COLUMNS = "id,name,address,lat,lon,category,notes,source_url"
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Distances from one point to arrays of points, all in radians."""
+    dlat = lats - lat
+    dlon = lons - lon
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def mercator(lat, lon):
+    lat = np.clip(lat, -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT)
+    mx = (np.asarray(lon) + 180.0) / 360.0
+    my = (1.0 - np.arcsinh(np.tan(np.radians(lat))) / math.pi) / 2.0
+    return np.clip(mx, 0.0, np.nextafter(1.0, 0)), np.clip(my, 0.0, np.nextafter(1.0, 0))
+
+def bbox_tiles(west: float, south: float, east: float, north: float, zoom: int, limit: int) -> Optional[list[tuple[int, int]]]:
+    """Slippy-map tiles (x, y) covering a bbox in degrees; west > east crosses the antimeridian.
+
+    None when more than ``limit`` tiles would be needed (counted before building anything).
+    """
+    n = 1 << zoom
+    (x0, x1), (y0, y1) = [np.floor(np.asarray(v) * n).astype(int).tolist() for v in mercator([north, south], [west, east])]
+    x_ranges = [range(x0, x1 + 1)] if x0 <= x1 else [range(x0, n), range(0, x1 + 1)]
+    if sum(len(r) for r in x_ranges) * (y1 - y0 + 1) > limit:
+        return None
+    return [(x, y) for r in x_ranges for x in r for y in range(y0, y1 + 1)]
+
+class PointIndex:
+    def __init__(self, rows: list[dict]):
+        located = [r for r in rows if r["lat"] is not None and r["lon"] is not None]
+        self.unlocated = [r for r in rows if r["lat"] is None or r["lon"] is None]
+        lat = np.array([float(r["lat"]) for r in located], dtype=np.float64)
+        lon = np.array([float(r["lon"]) for r in located], dtype=np.float64)
+        ci = np.floor(lat / CELL_DEG).astype(np.int64)
+        cj = (np.floor(lon / CELL_DEG).astype(np.int64) + LON_CELLS // 2) % LON_CELLS - LON_CELLS // 2
+        order = np.lexsort((cj, ci))
+        self.rows = [located[i] for i in order]
+        self.lat = np.radians(lat[order])
+        self.lon = np.radians(lon[order])
+        self.category = np.array([r["category"] for r in self.rows], dtype=object)
+        # Web Mercator position in [0, 1), for map tiles and clusters
+        self.mx, self.my = mercator(lat[order], lon[order])
+        ci, cj = ci[order], cj[order]
+        # cell -> slice into the sorted arrays
+        self.cells: dict[tuple[int, int], tuple[int, int]] = {}
+        if len(order):
+            bounds = np.flatnonzero((np.diff(ci) != 0) | (np.diff(cj) != 0)) + 1
+            starts = np.concatenate(([0], bounds))
+            ends = np.concatenate((bounds, [len(order)]))
+            for a, b in zip(starts.tolist(), ends.tolist()):
+                self.cells[(int(ci[a]), int(cj[a]))] = (a, b)
+            self.ci_range = (int(ci.min()), int(ci.max()))
+            self.cj_range = (int(cj.min()), int(cj.max()))
+            # Narrowest longitude spacing anywhere in the data, for a safe ring distance bound.
+            self.cos_min = max(math.cos(math.radians(max(abs(lat).max(), 0.0))), 1e-6)
+        self.size = len(rows)
+
+    def _ring(self, i0: int, j0: int, r: int) -> list[tuple[int, int]]:
+        if r == 0:
+            return [(i0, j0)]
+        # Longitude cells wrap at the antimeridian.
+        wrap = lambda j: (j + LON_CELLS // 2) % LON_CELLS - LON_CELLS // 2
+        cells = []
+        for j in range(j0 - r, j0 + r + 1):
+            cells.append((i0 - r, wrap(j)))
+            cells.append((i0 + r, wrap(j)))
+        for i in range(i0 - r + 1, i0 + r):
+            cells.append((i, wrap(j0 - r)))
+            cells.append((i, wrap(j0 + r)))
+        return cells
+
+    def _exhausted(self, i0: int, j0: int, r: int) -> bool:
+        # Ring r already lies outside every occupied cell (ignoring wrap, which only delays this).
+        return (i0 - r < self.ci_range[0] and i0 + r > self.ci_range[1]
+                and j0 - r < self.cj_range[0] and j0 + r > self.cj_range[1])
+
+    def nearest(self, lat: float, lon: float, k: int, category: Optional[str] = None,
+                max_km: Optional[float] = None) -> list[tuple[float, dict]]:
+        """Up to k (distance_km, row) pairs, closest first. Points without coordinates follow
+        with distance None, unless max_km is set."""
+        out: list[tuple[float, dict]] = []
+        if self.cells and k > 0:
+            qlat, qlon = math.radians(lat), math.radians(lon)
+            i0 = math.floor(lat / CELL_DEG)
+            j0 = (math.floor(lon / CELL_DEG) + LON_CELLS // 2) % LON_CELLS - LON_CELLS // 2
+            best_d = np.empty(0)
+            best_i = np.empty(0, dtype=np.int64)
+            # 0.95: slack for great-circle vs along-the-parallel distance across a few cells.
+            km_per_cell = 0.95 * CELL_DEG * KM_PER_DEG * min(self.cos_min, math.cos(qlat))
+            r = 0
+            while True:
+                if (2 * r + 1) ** 2 > 4 * len(self.cells):
+                    # Rings now cost more than the occupied cells: finish with one pass over all.
+                    idx = np.arange(len(self.rows))
+                    idx = idx[~np.isin(idx, best_i)] if len(best_i) else idx
+                    done = True
+                else:
+                    slices = [self.cells[c] for c in self._ring(i0, j0, r) if c in self.cells]
+                    idx = np.concatenate([np.arange(a, b) for a, b in slices]) if slices else np.empty(0, dtype=np.int64)
+                    done = self._exhausted(i0, j0, r + 1)
+                if category is not None and len(idx):
+                    idx = idx[self.category[idx] == category]
+                if len(idx):
+                    d = haversine_km(qlat, qlon, self.lat[idx], self.lon[idx])
+                    if max_km is not None:
+                        keep = d <= max_km
+                        idx, d = idx[keep], d[keep]
+                    best_d = np.concatenate((best_d, d))
+                    best_i = np.concatenate((best_i, idx))
+                    if len(best_d) > k:
+                        top = np.argpartition(best_d, k - 1)[:k]
+                        best_d, best_i = best_d[top], best_i[top]
+                if done:
+                    break
+                # Anything in ring r+1 is at least r cells away in lat or lon.
+                reach = r * km_per_cell
+                if max_km is not None and reach > max_km:
+                    break
+                if len(best_d) >= k and reach > best_d.max():
+                    break
+                r += 1
+            order = np.argsort(best_d, kind="stable")
+            out = [(float(best_d[o]), self.rows[int(best_i[o])]) for o in order]
+        if max_km is None and len(out) < k:
+            extra = [r for r in self.unlocated if category is None or r["category"] == category]
+            out.extend((None, r) for r in extra[: k - len(out)])
+        return out
+
+    def _tile_candidates(self, zoom: int, x: int, y: int) -> np.ndarray:
+        """Indices of the points in the grid cells overlapping a tile (a superset of the tile)."""
+        n = 1 << zoom
+        west, east = x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0
+        # Mercator clips latitudes beyond +-85.05 into the edge rows, so those rows reach the poles.
+        north = 90.0 if y == 0 else math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+        south = -90.0 if y == n - 1 else math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+        i_lo, i_hi = math.floor(south / CELL_DEG), math.floor(north / CELL_DEG)
+        j_lo, j_hi = math.floor(west / CELL_DEG), math.floor(east / CELL_DEG)
+        wrap = lambda j: (j + LON_CELLS // 2) % LON_CELLS - LON_CELLS // 2
+        if (i_hi - i_lo + 1) * (j_hi - j_lo + 1) <= len(self.cells):
+            slices = [self.cells[c] for c in ((i, wrap(j)) for i in range(i_lo, i_hi + 1) for j in range(j_lo, j_hi + 1))
+                      if c in self.cells]
+        else:
+            # Low zooms: fewer occupied cells than cells under the tile, so filter those instead.
+            slices = [ab for (i, j), ab in self.cells.items()
+                      if i_lo <= i <= i_hi and (j_lo <= j <= j_hi or j_lo <= j + LON_CELLS <= j_hi)]
+        return np.concatenate([np.arange(a, b) for a, b in slices]) if slices else np.empty(0, dtype=np.int64)
+
+    def tile(self, zoom: int, x: int, y: int, clustered: bool, category: Optional[str] = None) -> list[dict]:
+        """Points in one tile, or grid clusters (count + centroid) when clustered."""
+        if not self.rows:
+            return []
+        n = 1 << zoom
+        idx = self._tile_candidates(zoom, x, y)
+        mask = (np.floor(self.mx[idx] * n) == x) & (np.floor(self.my[idx] * n) == y)
+        if category is not None:
+            mask &= self.category[idx] == category
+        idx = np.sort(idx[mask])
+        if not clustered:
+            return [self.rows[i] for i in idx.tolist()]
+        if not len(idx):
+            return []
+        g = n * CLUSTER_GRID
+        cell = np.floor(self.my[idx] * g).astype(np.int64) * g + np.floor(self.mx[idx] * g).astype(np.int64)
+        keys, inverse, counts = np.unique(cell, return_inverse=True, return_counts=True)
+        lat_deg, lon_deg = np.degrees(self.lat[idx]), np.degrees(self.lon[idx])
+        lat_c = np.bincount(inverse, weights=lat_deg) / counts
+        lon_c = np.bincount(inverse, weights=lon_deg) / counts
+        first = np.full(len(keys), -1, dtype=np.int64)
+        first[inverse[::-1]] = idx[::-1]  # any member; only used for single-point clusters
+        out = []
+        for c, la, lo, f in zip(counts.tolist(), lat_c.tolist(), lon_c.tolist(), first.tolist()):
+            item = {"count": c, "lat": round(la, 6), "lon": round(lo, 6)}
+            if c == 1:
+                item["point"] = self.rows[f]
+            out.append(item)
+        return out
+
+class PointIndexCache:
+    """One PointIndex per database, rebuilt when the points catalogue version changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (index, catalogue version, build number), swapped in one assignment
+        self._state: Optional[tuple[PointIndex, int, int]] = None
+        self.builds = 0
+        self.build_time_s = 0.0
+        self._tiles: OrderedDict = OrderedDict()
+        self.tile_hits = 0
+        self.tile_misses = 0
+
+    def _current(self, s: Settings) -> tuple[PointIndex, int]:
+        """The index for the current catalogue version and the build number it came from."""
+        version = points_version.get(s)[0]
+        state = self._state
+        if state is None or state[1] != version:
+            with self._lock:
+                state = self._state
+                if state is None or state[1] != version:
+                    started = time.perf_counter()
+                    with db_session(s) as conn:
+                        rows = [dict(r) for r in conn.execute(f"SELECT {POINT_COLUMNS} FROM points ORDER BY id")]
+                    self.builds += 1
+                    state = self._state = (PointIndex(rows), version, self.builds)
+                    self.build_time_s = round(time.perf_counter() - started, 4)
+        return state[0], state[2]
+
+    def get(self, s: Settings) -> PointIndex:
+        return self._current(s)[0]
+
+    def tile(self, s: Settings, zoom: int, x: int, y: int, clustered: bool, category: Optional[str]) -> list[dict]:
+        # Keyed by the build of the index the tile is computed from, taken together with it.
+        index, build = self._current(s)
+        key = (build, zoom, x, y, clustered, category)
+        with self._lock:
+            items = self._tiles.get(key)
+            if items is not None:
+                self._tiles.move_to_end(key)
+                self.tile_hits += 1
+                return items
+        items = index.tile(zoom, x, y, clustered, category)
+        with self._lock:
+            self.tile_misses += 1
+            self._tiles[key] = items
+            while len(self._tiles) > TILE_CACHE_MAX:
+                self._tiles.popitem(last=False)
+        return items
+
+    def stats(self) -> dict:
+        idx = self._state[0] if self._state else None
+        return {"points": idx.size if idx else 0, "cells": len(idx.cells) if idx else 0,
+                "builds": self.builds, "last_build_s": self.build_time_s,
+                "tiles_cached": len(self._tiles), "tile_hits": self.tile_hits, "tile_misses": self.tile_misses}
+
+point_index = PointIndexCache()
@@ -0,0 +1,165 @@
+"""In-process maintenance: expired auth rows, orphaned uploads and blobs, free pages and the WAL.
+
+Started from the app lifespan; every SWEEPER_INTERVAL seconds it runs ``sweep`` in a worker
+thread on its own connection (not a pool slot) and keeps the per-run report for /admin/sweeper.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from ..settings import Settings, get_settings
+from ..db import get_conn
+from . import blobs
+
+log = logging.getLogger(__name__)
+
+# (table, expiry column) swept in batches
+EXPIRING = [("refresh_tokens", "expires_at"), ("email_otps", "expires_at"), ("email_outbox", "purge_after")]
+# (uploads subdir, query returning the paths still referenced)
+UPLOAD_REFS = [
+    ("chat", "SELECT image_path FROM messages WHERE image_path IS NOT NULL"),
+    ("avatars", "SELECT avatar_path FROM users WHERE avatar_path IS NOT NULL"),
+]
+
+def _delete_expired(conn, table: str, column: str, now: str, batch: int) -> int:
+    # Small batches, one commit each, so a large backlog never holds the write lock for long.
+    total = 0
+    while True:
+        cur = conn.execute(
+            f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {column} < ? LIMIT ?)",
+            (now, batch),
+        )
+        conn.commit()
+        total += cur.rowcount
+        if cur.rowcount < batch:
+            return total
+
+def _remove_orphans(s: Settings, conn, subdir: str, sql: str) -> tuple[int, int]:
+    folder = os.path.join(s.upload_dir, subdir)
+    referenced = {os.path.basename(r[0]) for r in conn.execute(sql)}
+    # Files younger than the grace period may belong to a request that has not inserted its row yet.
+    cutoff = time.time() - s.sweeper_orphan_grace
+    files = removed_bytes = 0
+    try:
+        entries = list(os.scandir(folder))
+    except FileNotFoundError:
+        return 0, 0
+    for entry in entries:
+        if not entry.is_file() or entry.name in referenced:
+            continue
+        st = entry.stat()
+        if st.st_mtime > cutoff:
+            continue
+        try:
+            os.remove(entry.path)
+        except OSError:
+            continue
+        files += 1
+        removed_bytes += st.st_size
+    return files, removed_bytes
+
+def sweep(s: Settings) -> dict:
+    started = time.perf_counter()
+    report: dict = {"started_at": datetime.now(timezone.utc).isoformat(), "rows": {}, "files": {}, "bytes": 0}
+    conn = get_conn(s)
+    try:
+        now = datetime.now(timezone.utc).isoformat()
+        for table, column in EXPIRING:
+            report["rows"][table] = _delete_expired(conn, table, column, now, s.sweeper_batch_size)
+        for subdir, sql in UPLOAD_REFS:
+            files, nbytes = _remove_orphans(s, conn, subdir, sql)
+            report["files"][subdir] = files
+            report["bytes"] += nbytes
+        files, nbytes = blobs.collect(s, conn, s.sweeper_batch_size)
+        report["files"]["blobs"] = files
+        report["bytes"] += nbytes
+
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:  # INCREMENTAL
+            # executescript steps the pragma to completion; execute() would free a single page.
+            conn.executescript(f"PRAGMA incremental_vacuum({int(s.sweeper_vacuum_pages)});")
+        free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        report["pages_reclaimed"] = free_before - free_after
+        report["free_pages"] = free_after
+
+        busy, wal_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        report["wal"] = {"busy": bool(busy), "pages": wal_pages, "checkpointed": checkpointed}
+    finally:
+        conn.close()
+    report["rows_reclaimed"] = sum(report["rows"].values())
+    report["duration_s"] = round(time.perf_counter() - started, 4)
+    return report
+
+class Sweeper:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.last: Optional[dict] = None
+        self.totals = {"rows_reclaimed": 0, "files": 0, "bytes": 0, "pages_reclaimed": 0}
+
+    def _record(self, report: dict) -> None:
+        self.runs += 1
+        self.last = report
+        self.totals["rows_reclaimed"] += report["rows_reclaimed"]
+        self.totals["files"] += sum(report["files"].values())
+        self.totals["bytes"] += report["bytes"]
+        self.totals["pages_reclaimed"] += report["pages_reclaimed"]
+        log.info("sweep: %d rows, %d files, %d pages reclaimed in %.3fs", report["rows_reclaimed"],
+                 sum(report["files"].values()), report["pages_reclaimed"], report["duration_s"])
+
+    async def run_once(self) -> dict:
+        report = await asyncio.to_thread(sweep, get_settings())
+        self._record(report)
+        return report
+
+    async def _loop(self) -> None:
+        while True:
+            # Re-read each time so SWEEPER_INTERVAL follows a settings reload.
+            await asyncio.sleep(max(10, get_settings().sweeper_interval))
+            try:
+                await self.run_once()
+            except Exception:
+                self.failures += 1
+                log.exception("sweep failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"running": self._task is not None, "runs": self.runs, "failures": self.failures,
+                "totals": self.totals, "last": self.last}
+
+sweeper = Sweeper()
+
+def main() -> int:
+    # python -m app.services.sweeper                -> run one sweep and print the report
+    # python -m app.services.sweeper --full-vacuum  -> switch an existing DB to incremental auto_vacuum first
+    import json
+    from ..db import init_db
+    s = get_settings()
+    init_db(s)
+    if "--full-vacuum" in sys.argv[1:]:
+        conn = get_conn(s)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        conn.close()
+    print(json.dumps(sweep(s), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Content-addressed cache of vision analyses, stored in SQLite.
+
+Exact hits are keyed by sha256(image bytes | model | prompt). When VISION_CACHE_PHASH is on
+and Pillow is installed, a 64-bit difference hash also lets re-encoded or resized copies of
+the same photo hit the cache. Entries expire after VISION_CACHE_TTL_DAYS and the table is
+trimmed to VISION_CACHE_MAX_ENTRIES, least recently used first.
+"""
+import hashlib
+import io
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from ..settings import Settings
+from ..db import db_session
+
+try:
+    from PIL import Image
+except ImportError:  # optional dependency
+    Image = None
+
+_stats = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _variant(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}|{prompt}".encode("utf-8")).hexdigest()
+
+def cache_key(image_bytes: bytes, model: str, prompt: str) -> str:
+    h = hashlib.sha256(image_bytes)
+    h.update(b"|" + model.encode("utf-8") + b"|" + prompt.encode("utf-8"))
+    return h.hexdigest()
+
+def dhash(image_bytes: bytes) -> Optional[int]:
+    """64-bit difference hash as a signed int (fits SQLite INTEGER), or None if not computable."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as im:
+            im.draft("L", (64, 64))  # let JPEG decode at reduced size
+            px = list(im.convert("L").resize((9, 8)).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return bits - (1 << 64) if bits >= (1 << 63) else bits
+
+def _hamming(a: int, b: int) -> int:
+    return ((a ^ b) & 0xFFFFFFFFFFFFFFFF).bit_count()
+
+def lookup(s: Settings, image_bytes: bytes, model: str, prompt: str) -> tuple[Optional[str], str, Optional[int]]:
+    """Return (cached result or None, exact key, phash). Blocking: call from a worker thread."""
+    key = cache_key(image_bytes, model, prompt)
+    cutoff = (_now() - timedelta(days=s.vision_cache_ttl_days)).isoformat()
+    ph = dhash(image_bytes) if s.vision_cache_phash else None
+    with db_session(s) as conn:
+        row = conn.execute("SELECT key,result FROM vision_cache WHERE key=? AND created_at>=?", (key, cutoff)).fetchone()
+        kind = "hits"
+        if row is None and ph is not None:
+            kind = "near_hits"
+            best = None
+            for r in conn.execute(
+                "SELECT key,result,phash FROM vision_cache WHERE variant=? AND phash IS NOT NULL AND created_at>=?",
+                (_variant(model, prompt), cutoff),
+            ):
+                d = _hamming(ph, r["phash"])
+                if d <= s.vision_cache_phash_distance and (best is None or d < best[0]):
+                    best = (d, r)
+            row = best[1] if best else None
+        if row is None:
+            _stats["misses"] += 1
+            return None, key, ph
+        conn.execute("UPDATE vision_cache SET hits=hits+1, last_used_at=? WHERE key=?", (_now().isoformat(), row["key"]))
+    _stats[kind] += 1
+    return row["result"], key, ph
+
+def store(s: Settings, key: str, phash: Optional[int], model: str, prompt: str, result: str) -> None:
+    now = _now().isoformat()
+    cutoff = (_now() - timedelta(days=s.vision_cache_ttl_days)).isoformat()
+    with db_session(s) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO vision_cache(key,variant,phash,result,hits,created_at,last_used_at) VALUES(?,?,?,?,0,?,?)",
+            (key, _variant(model, prompt), phash, result, now, now),
+        )
+        evicted = conn.execute("DELETE FROM vision_cache WHERE created_at<?", (cutoff,)).rowcount
+        excess = conn.execute("SELECT COUNT(1) AS c FROM vision_cache").fetchone()["c"] - s.vision_cache_max_entries
+        if excess > 0:
+            evicted += conn.execute(
+                "DELETE FROM vision_cache WHERE key IN (SELECT key FROM vision_cache ORDER BY last_used_at ASC LIMIT ?)",
+                (excess,),
+            ).rowcount
+    _stats["stores"] += 1
+    _stats["evictions"] += evicted
+
+def stats() -> dict:
+    lookups = _stats["hits"] + _stats["near_hits"] + _stats["misses"]
+    hit_rate = (_stats["hits"] + _stats["near_hits"]) / lookups if lookups else 0.0
+    return {**_stats, "hit_rate": round(hit_rate, 4)}
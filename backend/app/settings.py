@@ -1,6 +1,11 @@
+import logging
 import os
-from dataclasses import dataclass
+import threading
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
+from typing import Optional
+
+log = logging.getLogger(__name__)
 
 def _getenv(name: str, default: str = "") -> str:
     return os.getenv(name, default)
@@ -13,6 +18,8 @@ class Settings:
     public_base_url: str
     data_dir: str
     db_path: str
+    db_pool_size: int
+    db_pool_timeout: float
     upload_dir: str
     brand_dir: str
 
@@ -24,6 +31,12 @@ class Settings:
 
     resend_api_key: str
     resend_from: str
+    resend_endpoint: str
+    mail_concurrency: int
+    mail_max_attempts: int
+    mail_backoff_base: float
+    mail_backoff_max: float
+    mail_poll_interval: float
     contact_email: str
     whatsapp_link: str
     terms_url: str
@@ -33,9 +46,54 @@ class Settings:
     groq_api_key_vision: str
     chat_model: str
     vision_model: str
+    groq_endpoint: str
+    llm_max_connections: int
+    llm_chat_timeout: float
+    llm_vision_timeout: float
+    llm_chat_concurrency: int
+    llm_vision_concurrency: int
+    llm_queue_size: int
+    llm_queue_timeout: float
+    llm_vision_queue_size: int
+    llm_vision_queue_timeout: float
+    vision_cache_ttl_days: int
+    vision_cache_max_entries: int
+    vision_cache_phash: bool
+    vision_cache_phash_distance: int
+    chat_image_max_bytes: int
+    avatar_max_bytes: int
+    vision_max_side: int
+    vision_jpeg_quality: int
+    image_workers: int
+    thumb_max_side: int
+    webp_max_side: int
+    answer_cache_enable: bool
+    answer_cache_ttl_hours: int
+    answer_cache_max_entries: int
+    answer_cache_threshold: float
+    context_token_budget: int
+    summary_max_tokens: int
+    bcrypt_rounds: int
+    password_hash_workers: int
+    password_hash_queue: int
+    password_hash_queue_timeout: float
+    token_cache_size: int
+    token_cache_ttl: int
+    token_revocation: bool
+    token_epoch_ttl: int
+    sweeper_enable: bool
+    sweeper_interval: int
+    sweeper_batch_size: int
+    sweeper_orphan_grace: int
+    sweeper_vacuum_pages: int
+    metrics_enable: bool
+    json_compress_min_bytes: int
 
     arcgis_api_key: str
     arcgis_geocode_enable: bool
+    arcgis_geocode_url: str
+    geocode_concurrency: int
+    geocode_timeout: float
 
     cors_allow_origins: list
     admin_api_key: str
@@ -43,12 +101,7 @@ class Settings:
     @staticmethod
     def load() -> "Settings":
         data_dir = _getenv("KATARA_DATA_DIR", "./data")
-        os.makedirs(data_dir, exist_ok=True)
-
         upload_dir = os.path.join(data_dir, "uploads")
-        os.makedirs(upload_dir, exist_ok=True)
-        os.makedirs(os.path.join(upload_dir, "chat"), exist_ok=True)
-        os.makedirs(os.path.join(upload_dir, "avatars"), exist_ok=True)
 
         # static/brand sits next to app/ at project root
         brand_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "brand"))
@@ -60,6 +113,8 @@ class Settings:
             public_base_url=_getenv("PUBLIC_BASE_URL", "http://152.67.69.61:6767").rstrip("/"),
             data_dir=data_dir,
             db_path=os.path.join(data_dir, "katara.sqlite3"),
+            db_pool_size=int(_getenv("DB_POOL_SIZE", "8")),
+            db_pool_timeout=float(_getenv("DB_POOL_TIMEOUT", "10")),
             upload_dir=upload_dir,
             brand_dir=brand_dir,
 
@@ -71,6 +126,12 @@ class Settings:
 
             resend_api_key=_getenv("RESEND_API_KEY", ""),
             resend_from=_getenv("RESEND_FROM", "noreply-katara@wiccagirl.online"),
+            resend_endpoint=_getenv("RESEND_ENDPOINT", ""),
+            mail_concurrency=int(_getenv("MAIL_CONCURRENCY", "4")),
+            mail_max_attempts=int(_getenv("MAIL_MAX_ATTEMPTS", "8")),
+            mail_backoff_base=float(_getenv("MAIL_BACKOFF_BASE", "2")),
+            mail_backoff_max=float(_getenv("MAIL_BACKOFF_MAX", "600")),
+            mail_poll_interval=float(_getenv("MAIL_POLL_INTERVAL", "5")),
             contact_email=_getenv("CONTACT_EMAIL", "gchaviano@itb.edu.ec"),
             whatsapp_link=_getenv("WHATSAPP_LINK", ""),
             terms_url=_getenv("TERMS_URL", ""),
@@ -80,14 +141,119 @@ class Settings:
             groq_api_key_vision=_getenv("GROQ_API_KEY_VISION", ""),
             chat_model=_getenv("CHAT_MODEL", "llama-3.3-70b-versatile"),
             vision_model=_getenv("VISION_MODEL", "llama-4-scout"),
+            groq_endpoint=_getenv("GROQ_ENDPOINT", "https://api.groq.com/openai/v1/chat/completions"),
+            llm_max_connections=int(_getenv("LLM_MAX_CONNECTIONS", "20")),
+            llm_chat_timeout=float(_getenv("LLM_CHAT_TIMEOUT", "60")),
+            llm_vision_timeout=float(_getenv("LLM_VISION_TIMEOUT", "90")),
+            llm_chat_concurrency=int(_getenv("LLM_CHAT_CONCURRENCY", "8")),
+            llm_vision_concurrency=int(_getenv("LLM_VISION_CONCURRENCY", "3")),
+            llm_queue_size=int(_getenv("LLM_QUEUE_SIZE", "32")),
+            llm_queue_timeout=float(_getenv("LLM_QUEUE_TIMEOUT", "15")),
+            llm_vision_queue_size=int(_getenv("LLM_VISION_QUEUE_SIZE", "16")),
+            llm_vision_queue_timeout=float(_getenv("LLM_VISION_QUEUE_TIMEOUT", "15")),
+            vision_cache_ttl_days=int(_getenv("VISION_CACHE_TTL_DAYS", "30")),
+            vision_cache_max_entries=int(_getenv("VISION_CACHE_MAX_ENTRIES", "5000")),
+            vision_cache_phash=_getbool("VISION_CACHE_PHASH", "false"),
+            vision_cache_phash_distance=int(_getenv("VISION_CACHE_PHASH_DISTANCE", "4")),
+            chat_image_max_bytes=int(_getenv("CHAT_IMAGE_MAX_BYTES", str(10 * 1024 * 1024))),
+            avatar_max_bytes=int(_getenv("AVATAR_MAX_BYTES", str(8 * 1024 * 1024))),
+            vision_max_side=int(_getenv("VISION_MAX_SIDE", "1024")),
+            vision_jpeg_quality=int(_getenv("VISION_JPEG_QUALITY", "80")),
+            image_workers=int(_getenv("IMAGE_WORKERS", "2")),
+            thumb_max_side=int(_getenv("THUMB_MAX_SIDE", "320")),
+            webp_max_side=int(_getenv("WEBP_MAX_SIDE", "1600")),
+            answer_cache_enable=_getbool("ANSWER_CACHE_ENABLE", "true"),
+            answer_cache_ttl_hours=int(_getenv("ANSWER_CACHE_TTL_HOURS", "72")),
+            answer_cache_max_entries=int(_getenv("ANSWER_CACHE_MAX_ENTRIES", "2000")),
+            answer_cache_threshold=float(_getenv("ANSWER_CACHE_THRESHOLD", "0.88")),
+            context_token_budget=int(_getenv("CONTEXT_TOKEN_BUDGET", "2500")),
+            summary_max_tokens=int(_getenv("SUMMARY_MAX_TOKENS", "300")),
+            bcrypt_rounds=int(_getenv("BCRYPT_ROUNDS", "12")),
+            password_hash_workers=int(_getenv("PASSWORD_HASH_WORKERS", "0")),  # 0 = cpu count
+            password_hash_queue=int(_getenv("PASSWORD_HASH_QUEUE", "64")),
+            password_hash_queue_timeout=float(_getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "10")),
+            token_cache_size=int(_getenv("TOKEN_CACHE_SIZE", "10000")),
+            token_cache_ttl=int(_getenv("TOKEN_CACHE_TTL", "300")),
+            token_revocation=_getbool("TOKEN_REVOCATION", "false"),
+            token_epoch_ttl=int(_getenv("TOKEN_EPOCH_TTL", "30")),
+            sweeper_enable=_getbool("SWEEPER_ENABLE", "true"),
+            sweeper_interval=int(_getenv("SWEEPER_INTERVAL", "3600")),
+            sweeper_batch_size=int(_getenv("SWEEPER_BATCH_SIZE", "500")),
+            sweeper_orphan_grace=int(_getenv("SWEEPER_ORPHAN_GRACE", "3600")),
+            sweeper_vacuum_pages=int(_getenv("SWEEPER_VACUUM_PAGES", "1000")),
+            metrics_enable=_getbool("METRICS_ENABLE", "true"),
+            json_compress_min_bytes=int(_getenv("JSON_COMPRESS_MIN_BYTES", "1024")),
 
             arcgis_api_key=_getenv("ARCGIS_API_KEY", ""),
             arcgis_geocode_enable=_getbool("ARCGIS_GEOCODE_ENABLE", "false"),
+            arcgis_geocode_url=_getenv("ARCGIS_GEOCODE_URL", ""),  # "stub" = offline fake geocoder
+            geocode_concurrency=int(_getenv("GEOCODE_CONCURRENCY", "4")),
+            geocode_timeout=float(_getenv("GEOCODE_TIMEOUT", "10")),
 
             cors_allow_origins=cors_allow_origins,
             admin_api_key=_getenv("ADMIN_API_KEY", "change-admin"),
         )
 
+    def ensure_dirs(self) -> None:
+        """Create data/upload directories. Called once at boot and on reload, never per request."""
+        os.makedirs(self.data_dir, exist_ok=True)
+        os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(os.path.join(self.upload_dir, "chat"), exist_ok=True)
+        os.makedirs(os.path.join(self.upload_dir, "avatars"), exist_ok=True)
+        os.makedirs(os.path.join(self.upload_dir, "blobs", "tmp"), exist_ok=True)
+
     @staticmethod
     def now_iso() -> str:
         return datetime.now(timezone.utc).isoformat()
+
+# ---- Process-wide cached settings ----
+
+# Read once at boot to build long-lived components: the DB pool and data directories, the
+# Groq client and bulkheads, the bcrypt and image pools, CORS/metrics middleware, mounts and
+# the sweeper task. A reload keeps their running values (so the cached Settings always
+# describe what is running) and reports any that changed; those need a restart.
+RESTART_REQUIRED = (
+    "data_dir", "db_path", "upload_dir", "brand_dir", "db_pool_size", "db_pool_timeout",
+    "groq_endpoint", "llm_max_connections", "llm_chat_concurrency", "llm_vision_concurrency",
+    "llm_queue_size", "llm_queue_timeout", "llm_vision_queue_size", "llm_vision_queue_timeout",
+    "password_hash_workers", "password_hash_queue", "password_hash_queue_timeout", "image_workers",
+    "cors_allow_origins", "metrics_enable", "sweeper_enable",
+)
+
+_current: Optional[Settings] = None
+_restart_pending: list[str] = []
+_lock = threading.RLock()
+
+def get_settings() -> Settings:
+    """Return the cached Settings, building them on first use."""
+    s = _current
+    if s is None:
+        with _lock:
+            if _current is None:
+                _swap(Settings.load())
+            s = _current
+    return s
+
+def reload_settings() -> Settings:
+    """Re-read .env and the environment, then atomically swap the cached Settings.
+    Fields in RESTART_REQUIRED keep their running values; see restart_pending()."""
+    from dotenv import load_dotenv
+    load_dotenv(override=True)
+    with _lock:
+        new = Settings.load()
+        if _current is not None:
+            _restart_pending[:] = [f for f in RESTART_REQUIRED if getattr(new, f) != getattr(_current, f)]
+            new = replace(new, **{f: getattr(_current, f) for f in RESTART_REQUIRED})
+            if _restart_pending:
+                log.warning("settings reloaded; restart to apply: %s", ", ".join(_restart_pending))
+        _swap(new)
+        return _current
+
+def restart_pending() -> list[str]:
+    """Settings changed by a reload that only take effect after a restart."""
+    return list(_restart_pending)
+
+def _swap(s: Settings) -> None:
+    global _current
+    s.ensure_dirs()
+    _current = s
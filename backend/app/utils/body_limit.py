@@ -0,0 +1,34 @@
+"""Reject oversized request bodies while they arrive, before multipart parsing spools them."""
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+DETAIL = "Solicitud demasiado grande."
+
+class BodySizeLimit:
+    """Pure ASGI middleware. ``limit`` is a callable so it follows settings reloads."""
+
+    def __init__(self, app, limit):
+        self.app = app
+        self.limit = limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limit = self.limit()
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            return await JSONResponse({"detail": DETAIL}, status_code=413)(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside the route's body parsing, so FastAPI turns it into the response.
+                    raise HTTPException(status_code=413, detail=DETAIL)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,26 @@
+"""Content-Encoding support shared by the JSON, cached-body and static file responses."""
+from typing import Optional
+
+try:  # optional: pip install brotli
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+def _q(params: str) -> Optional[float]:
+    for param in params.split(";"):
+        key, _, value = param.strip().partition("=")
+        if key.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return 1.0
+
+def accepts(accept_encoding: str, coding: str) -> bool:
+    """True if an Accept-Encoding value lists ``coding`` without refusing it (q=0)."""
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            q = _q(params)
+            return q is not None and q > 0
+    return False
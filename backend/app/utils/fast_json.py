@@ -0,0 +1,55 @@
+"""JSON response for large lists built from trusted DB rows.
+
+Returning a Response from a route makes FastAPI skip response_model validation and its
+jsonable_encoder pass; ``FastJSONResponse`` then serializes with orjson and compresses for
+the client: brotli or gzip by Accept-Encoding, only above JSON_COMPRESS_MIN_BYTES. A strong
+ETag set by the route gets the coding appended, as in http_cache. Routes keep their
+response_model for the OpenAPI schema, so the payload shape must stay the same as what
+validation would have produced.
+"""
+import gzip
+from typing import Any
+
+import anyio
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+from ..settings import get_settings
+from .encoding import accepts, brotli
+
+GZIP_LEVEL = 6       # on-the-fly: most of level 9's ratio at a fraction of the CPU
+BROTLI_QUALITY = 5
+OFFLOAD_BYTES = 256 * 1024  # compress bigger bodies in a worker thread, not on the event loop
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def _encode(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+    async def __call__(self, scope, receive, send) -> None:
+        headers = MutableHeaders(raw=self.raw_headers)
+        headers.add_vary_header("Accept-Encoding")
+        if len(self.body) >= get_settings().json_compress_min_bytes and "content-encoding" not in headers:
+            accept = Headers(scope=scope).get("accept-encoding", "")
+            coding = "br" if brotli is not None and accepts(accept, "br") else "gzip" if accepts(accept, "gzip") else None
+            if coding is not None:
+                if len(self.body) > OFFLOAD_BYTES:
+                    self.body = await anyio.to_thread.run_sync(_encode, self.body, coding)
+                else:
+                    self.body = _encode(self.body, coding)
+                headers["content-encoding"] = coding
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["etag"] = f'{etag[:-1]}-{coding}"'
+                headers["content-length"] = str(len(self.body))
+        await super().__call__(scope, receive, send)
@@ -1,6 +1,5 @@
 import os
 import re
-from datetime import datetime, timezone
 
 SAFE = re.compile(r"[^a-zA-Z0-9._-]+")
 
@@ -9,7 +8,34 @@ def safe_name(name: str) -> str:
     name = SAFE.sub("_", name)
     return name[:120]
 
-def unique_filename(prefix: str, original: str) -> str:
-    base = safe_name(original)
-    ts = int(datetime.now(timezone.utc).timestamp())
-    return f"{prefix}_{ts}_{base}"
+
+CHUNK = 1024 * 1024
+
+class UploadTooLarge(Exception):
+    pass
+
+def save_upload(src, dest: str, max_bytes: int, digest=None) -> int:
+    """Copy an upload's file object to dest in chunks, stopping as soon as max_bytes is exceeded.
+    Blocking: call from a worker thread. No partial file is left behind on failure.
+    ``digest`` (a hashlib object) is fed the same chunks."""
+    src.seek(0)
+    size = 0
+    try:
+        with open(dest, "wb") as out:
+            while True:
+                chunk = src.read(CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(dest)
+                if digest is not None:
+                    digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        try:
+            os.remove(dest)
+        except OSError:
+            pass
+        raise
+    return size
@@ -0,0 +1,97 @@
+"""Pre-serialized, pre-compressed response bodies with strong ETags and conditional GET.
+
+Each content-coding gets its own validator (``"<etag>-gzip"``, ``"<etag>-br"``, as static.py
+does for precompressed files), so a cache never revalidates one coding with another's tag.
+"""
+import gzip
+import hashlib
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from datetime import datetime
+from typing import Callable, Optional
+
+from fastapi import Request, Response
+
+from .encoding import accepts, brotli
+from .fast_json import dumps
+
+COMPRESS_MIN_BYTES = 1024
+
+class CachedBody:
+    __slots__ = ("body", "gzip", "br", "etag", "last_modified", "media_type")
+
+    def __init__(self, body: bytes, last_modified: Optional[str] = None, media_type: str = "application/json"):
+        self.body = body
+        self.media_type = media_type
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.last_modified = last_modified
+        big = len(body) >= COMPRESS_MIN_BYTES
+        self.gzip = gzip.compress(body, compresslevel=9, mtime=0) if big else None
+        self.br = brotli.compress(body, quality=11) if big and brotli is not None else None
+
+    @classmethod
+    def json(cls, obj, last_modified: Optional[str] = None) -> "CachedBody":
+        return cls(dumps(obj), last_modified)
+
+def coded_etag(etag: str, coding: Optional[str]) -> str:
+    return f'{etag[:-1]}-{coding}"' if coding else etag
+
+def http_date(iso: str) -> str:
+    return formatdate(datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp(), usegmt=True)
+
+def not_modified(request: Request, etag: str, last_modified: Optional[str]) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        # Weak comparison, as RFC 9110 asks for If-None-Match (proxies may add W/).
+        # Any coding of the representation matches; the 304 then carries the tag for this request.
+        tags = {t.strip().removeprefix("W/") for t in inm.split(",")}
+        return "*" in tags or any(coded_etag(etag, c) in tags for c in (None, "gzip", "br"))
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def respond(request: Request, cached: CachedBody, cache_control: str) -> Response:
+    accept = request.headers.get("accept-encoding", "")
+    body, coding = cached.body, None
+    if cached.br is not None and accepts(accept, "br"):
+        body, coding = cached.br, "br"
+    elif cached.gzip is not None and accepts(accept, "gzip"):
+        body, coding = cached.gzip, "gzip"
+    headers = {"ETag": coded_etag(cached.etag, coding), "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if cached.last_modified:
+        headers["Last-Modified"] = cached.last_modified
+    if not_modified(request, cached.etag, cached.last_modified):
+        return Response(status_code=304, headers=headers)
+    if coding is not None:
+        headers["Content-Encoding"] = coding
+    return Response(content=body, media_type=cached.media_type, headers=headers)
+
+class BodyCache:
+    """Small keyed store of CachedBody objects, each tagged with the version it was built from."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._data: dict = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, key, version, build: Callable[[], CachedBody]) -> CachedBody:
+        item = self._data.get(key)
+        if item is not None and item[0] == version:
+            self.hits += 1
+            return item[1]
+        cached = build()
+        with self._lock:
+            self.builds += 1
+            if len(self._data) >= self.max_entries and key not in self._data:
+                self._data.clear()
+            self._data[key] = (version, cached)
+        return cached
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "hits": self.hits, "builds": self.builds}
@@ -1,12 +1,124 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
 from passlib.context import CryptContext
 
-_pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from ..services.bulkhead import Bulkhead
+from ..settings import get_settings
+
+DEFAULT_ROUNDS = 12
+_contexts: dict[int, CryptContext] = {}
+
+def _context(rounds: int) -> CryptContext:
+    # min == max == default, so needs_update() flags hashes made with any other cost.
+    ctx = _contexts.get(rounds)
+    if ctx is None:
+        ctx = CryptContext(
+            schemes=["bcrypt"], deprecated="auto",
+            bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds,
+        )
+        _contexts[rounds] = ctx
+    return ctx
 
-def hash_password(password: str, pepper: str) -> str:
-    return _pwd.hash(password + pepper)
+def hash_password(password: str, pepper: str, rounds: int = DEFAULT_ROUNDS) -> str:
+    return _context(rounds).hash(password + pepper)
 
 def verify_password(password: str, pepper: str, password_hash: str) -> bool:
     try:
-        return _pwd.verify(password + pepper, password_hash)
+        return _context(DEFAULT_ROUNDS).verify(password + pepper, password_hash)
     except Exception:
         return False
+
+def _noop() -> None:
+    pass
+
+def _verify_and_rehash(password: str, pepper: str, password_hash: str, rounds: int) -> tuple[bool, Optional[str]]:
+    """Runs in a worker: verify, and if the stored cost differs from `rounds`, return a fresh hash."""
+    ctx = _context(rounds)
+    try:
+        ok = ctx.verify(password + pepper, password_hash)
+    except Exception:
+        return False, None
+    if ok and ctx.needs_update(password_hash):
+        return True, ctx.hash(password + pepper)
+    return ok, None
+
+class PasswordHasher:
+    """bcrypt off the event loop and off the shared request threadpool.
+
+    Work runs in a dedicated process pool (forked at startup, so workers do not re-import the
+    app), or a thread pool where fork is unavailable; bcrypt releases the GIL there. Admission
+    goes through a Bulkhead so a login storm queues here instead of stalling other endpoints.
+    """
+
+    def __init__(self):
+        self.rounds = DEFAULT_ROUNDS
+        self._executor: Optional[Executor] = None
+        self.bulkhead = Bulkhead("password_hash", max_concurrent=os.cpu_count() or 2, max_queue=64, queue_timeout=10)
+        self._latency = {"hash": [0, 0.0, 0.0], "verify": [0, 0.0, 0.0]}  # count, total_s, max_s
+        self.rehashed = 0
+
+    def start(self, rounds: int, workers: int, max_queue: int, queue_timeout: float) -> None:
+        self.rounds = rounds
+        workers = max(1, workers or os.cpu_count() or 2)
+        self.bulkhead.configure(workers, max_queue, queue_timeout)
+        if self._executor is not None:
+            return
+        if "fork" in multiprocessing.get_all_start_methods():
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+            # Fork every worker now, before the server spins up its own threads: with fork the pool
+            # starts all of them on the first submit. Not waited for; no bcrypt work at boot.
+            self._executor.submit(_noop)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, op: str, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.bulkhead.max_concurrent, thread_name_prefix="bcrypt")
+        async with self.bulkhead.slot():
+            started = time.perf_counter()
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            except BrokenProcessPool:
+                # A worker died (OOM killer, etc.); keep serving from threads.
+                self._executor = ThreadPoolExecutor(max_workers=self.bulkhead.max_concurrent, thread_name_prefix="bcrypt")
+                result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            took = time.perf_counter() - started
+        stat = self._latency[op]
+        stat[0] += 1
+        stat[1] += took
+        stat[2] = max(stat[2], took)
+        return result
+
+    def _current_rounds(self) -> int:
+        # Read per call so a settings reload (SIGHUP / admin) changes the cost without a restart.
+        self.rounds = get_settings().bcrypt_rounds
+        return self.rounds
+
+    async def hash(self, password: str, pepper: str) -> str:
+        return await self._run("hash", hash_password, password, pepper, self._current_rounds())
+
+    async def verify(self, password: str, pepper: str, password_hash: str) -> tuple[bool, Optional[str]]:
+        """Return (matches, new_hash). new_hash is set when the stored hash used a different cost."""
+        ok, new_hash = await self._run("verify", _verify_and_rehash, password, pepper, password_hash, self._current_rounds())
+        if new_hash:
+            self.rehashed += 1
+        return ok, new_hash
+
+    def stats(self) -> dict:
+        out = {"rounds": self.rounds, "rehashed": self.rehashed, "queue": self.bulkhead.stats()}
+        for op, (n, total, worst) in self._latency.items():
+            out[op] = {"count": n, "avg_s": round(total / n, 6) if n else 0.0, "max_s": round(worst, 6)}
+        return out
+
+hasher = PasswordHasher()
@@ -0,0 +1,136 @@
+"""StaticFiles with cache headers, strong ETags, precompressed variants and byte ranges.
+
+Starlette 0.38's StaticFiles sends no Cache-Control and ignores Range; FileResponse only
+learned ranges later. Content-addressed blobs get a year-long immutable policy and their hash
+as ETag. With ``precompressed``, ``<file>.br`` / ``<file>.gz`` written by
+``python -m app.build_assets`` are sent when Accept-Encoding allows.
+"""
+import os
+import re
+from email.utils import formatdate
+from mimetypes import guess_type
+from typing import Callable, Optional
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from .encoding import accepts
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+RANGE_CHUNK = 64 * 1024
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_HASHED = re.compile(r"^[0-9a-f]{64}$")
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """(start, end) inclusive for a single satisfiable range; None to serve the whole file.
+    Raises ValueError when the range cannot be satisfied (416)."""
+    m = _RANGE.match(header.strip())
+    if m is None:  # multiple ranges or another unit: ignoring Range is always allowed
+        return None
+    first, last = m.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+async def _read_range(path: str, start: int, length: int):
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        while length > 0:
+            chunk = await f.read(min(RANGE_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+class CachedStaticFiles(StaticFiles):
+    def __init__(self, *, cache_control: Callable[[str], str], precompressed: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.cache_control = cache_control
+        self.precompressed = precompressed
+
+    def _etag(self, full_path: str, st: os.stat_result) -> str:
+        name = os.path.basename(full_path)
+        if _HASHED.match(name.split(".", 1)[0]):
+            return f'"{name}"'  # the name carries the content hash (and the variant suffix)
+        # Same validator for the same bytes on disk; mtime_ns also catches same-second rewrites.
+        return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        full_path = str(full_path)
+        request_headers = Headers(scope=scope)
+        rel = os.path.relpath(full_path, str(self.directory)).replace(os.sep, "/")
+        etag = self._etag(full_path, stat_result)
+        headers = {
+            "cache-control": self.cache_control(rel),
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "accept-ranges": "bytes",
+        }
+
+        if self.precompressed:
+            headers["vary"] = "Accept-Encoding"
+            accept = request_headers.get("accept-encoding", "")
+            for coding, suffix in ENCODINGS:
+                if not accepts(accept, coding):
+                    continue
+                try:
+                    variant = os.stat(full_path + suffix)
+                except OSError:
+                    continue
+                if variant.st_mtime < stat_result.st_mtime:
+                    continue  # stale build output
+                headers.update({"etag": f'{etag[:-1]}-{coding}"', "content-encoding": coding})
+                headers.pop("accept-ranges")
+                response = FileResponse(full_path + suffix, headers=headers, stat_result=variant,
+                                        media_type=self.media_type(full_path))
+                if self.is_not_modified(response.headers, request_headers):
+                    return NotModifiedResponse(response.headers)
+                return response
+
+        headers["etag"] = etag
+        response = FileResponse(full_path, status_code=status_code, headers=headers, stat_result=stat_result)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and status_code == 200 and (if_range is None or if_range == etag):
+            size = stat_result.st_size
+            try:
+                span = parse_range(range_header, size)
+            except ValueError:
+                return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+            if span is not None:
+                start, end = span
+                headers.update({"content-range": f"bytes {start}-{end}/{size}", "content-length": str(end - start + 1)})
+                media_type = self.media_type(full_path)
+                if scope["method"] == "HEAD":
+                    return Response(status_code=206, headers=headers, media_type=media_type)
+                return StreamingResponse(_read_range(full_path, start, end - start + 1), status_code=206,
+                                         headers=headers, media_type=media_type)
+        return response
+
+    @staticmethod
+    def media_type(full_path: str) -> str:
+        return guess_type(full_path)[0] or "application/octet-stream"
+
+def upload_cache_control(rel: str) -> str:
+    if rel.startswith("blobs/") and not rel.startswith("blobs/tmp/"):
+        return IMMUTABLE  # the name is the content hash
+    # Legacy chat/ and avatars/ names could be overwritten within the same second.
+    return "public, max-age=86400"
+
+def brand_cache_control(rel: str) -> str:
+    # Brand files keep their names across releases: cache for a day, then revalidate via ETag.
+    return "public, max-age=86400, stale-while-revalidate=604800"
@@ -1,20 +1,103 @@
 import hashlib
+import threading
+import time
 import jwt
+from collections import OrderedDict
 from typing import Optional
 from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from ..settings import Settings
-from ..db import get_conn
+from ..settings import Settings, get_settings
+from ..db import db_session
 
 bearer = HTTPBearer(auto_error=False)
 
 def _utcnow():
     return datetime.now(timezone.utc)
 
-def make_access_token(s: Settings, user_id: int) -> str:
+class _TTLCache:
+    """Bounded LRU where every entry also carries its own absolute deadline (time.monotonic)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, deadline: float) -> None:
+        with self._lock:
+            self._data[key] = (value, deadline)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"entries": len(self._data), "max_entries": self.max_entries, "hits": self.hits,
+                "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+# token digest -> (user_id, epoch); deadline = min(exp, now + TOKEN_CACHE_TTL)
+_verified = _TTLCache(10000)
+# user_id -> current token_epoch; only used when TOKEN_REVOCATION is on
+_epochs = _TTLCache(10000)
+_verified_secret: Optional[str] = None
+
+def user_epoch(s: Settings, user_id: int, conn: Optional[object] = None) -> int:
+    """Current revocation epoch for a user, cached for TOKEN_EPOCH_TTL seconds.
+
+    The TTL bounds how long a logout-everywhere done by another worker process takes to apply
+    here; in this process it applies at once (see bump_user_epoch). Callers that already hold a
+    connection pass it, so a cache miss does not check out a second one.
+    """
+    epoch = _epochs.get(user_id)
+    if epoch is None:
+        if conn is None:
+            with db_session(s) as conn:
+                row = conn.execute("SELECT token_epoch FROM users WHERE id=?", (user_id,)).fetchone()
+        else:
+            row = conn.execute("SELECT token_epoch FROM users WHERE id=?", (user_id,)).fetchone()
+        epoch = int(row["token_epoch"]) if row else 0
+        _epochs.max_entries = s.token_cache_size
+        _epochs.put(user_id, epoch, time.monotonic() + s.token_epoch_ttl)
+    return epoch
+
+def bump_user_epoch(s: Settings, user_id: int, conn) -> int:
+    """Invalidate every access token issued to the user so far. Caller commits."""
+    conn.execute("UPDATE users SET token_epoch=token_epoch+1 WHERE id=?", (user_id,))
+    epoch = int(conn.execute("SELECT token_epoch FROM users WHERE id=?", (user_id,)).fetchone()["token_epoch"])
+    _epochs.put(user_id, epoch, time.monotonic() + s.token_epoch_ttl)
+    return epoch
+
+def token_cache_stats() -> dict:
+    return {"verified": _verified.stats(), "epochs": _epochs.stats()}
+
+def make_access_token(s: Settings, user_id: int, conn: Optional[object] = None) -> str:
     exp = _utcnow() + timedelta(minutes=s.access_token_minutes)
     payload = {"sub": str(user_id), "iss": s.jwt_issuer, "exp": exp}
+    if s.token_revocation:
+        payload["ep"] = user_epoch(s, user_id, conn=conn)
     return jwt.encode(payload, s.jwt_secret, algorithm="HS256")
 
 def make_refresh_token(s: Settings, user_id: int) -> str:
@@ -26,36 +109,47 @@ def refresh_hash(token: str) -> str:
     return hashlib.sha256(token.encode("utf-8")).hexdigest()
 
 def store_refresh(s: Settings, token: str, user_id: int, expires_at: str, conn: Optional[object] = None):
-    owns_conn = conn is None
-    if owns_conn:
-        conn = get_conn(s)
+    if conn is None:
+        with db_session(s) as conn:
+            return store_refresh(s, token, user_id, expires_at, conn=conn)
     conn.execute(
         "INSERT OR REPLACE INTO refresh_tokens(token_hash,user_id,expires_at) VALUES(?,?,?)",
         (refresh_hash(token), user_id, expires_at),
     )
     conn.commit()
-    if owns_conn:
-        conn.close()
 
 
 def revoke_refresh(s: Settings, token: str, conn: Optional[object] = None):
-    owns_conn = conn is None
-    if owns_conn:
-        conn = get_conn(s)
+    if conn is None:
+        with db_session(s) as conn:
+            return revoke_refresh(s, token, conn=conn)
     conn.execute("DELETE FROM refresh_tokens WHERE token_hash=?", (refresh_hash(token),))
     conn.commit()
-    if owns_conn:
-        conn.close()
 
 
 def verify_access_token(s: Settings, token: str) -> int:
-    try:
-        payload = jwt.decode(token, s.jwt_secret, algorithms=["HS256"], options={"require": ["exp"]})
-        return int(payload["sub"])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    global _verified_secret
+    if _verified_secret != s.jwt_secret:
+        # Secret rotated by a settings reload: nothing verified under the old one counts.
+        _verified.clear()
+        _verified_secret = s.jwt_secret
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    cached = _verified.get(key)
+    if cached is None:
+        try:
+            payload = jwt.decode(token, s.jwt_secret, algorithms=["HS256"], options={"require": ["exp"]})
+            cached = (int(payload["sub"]), int(payload.get("ep", 0)))
+        except Exception:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        _verified.max_entries = s.token_cache_size
+        _verified.put(key, cached, time.monotonic() + min(s.token_cache_ttl, payload["exp"] - time.time()))
+    user_id, epoch = cached
+    if s.token_revocation and epoch < user_epoch(s, user_id):
+        _verified.discard(key)
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return user_id
 
-def verify_refresh(s: Settings, token: str) -> int:
+def verify_refresh(s: Settings, token: str, conn: Optional[object] = None) -> int:
     try:
         payload = jwt.decode(token, s.jwt_secret, algorithms=["HS256"], options={"require": ["exp"]})
         if payload.get("typ") != "refresh":
@@ -64,18 +158,17 @@ def verify_refresh(s: Settings, token: str) -> int:
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-    conn = get_conn(s)
-    row = conn.execute("SELECT token_hash FROM refresh_tokens WHERE token_hash=?", (refresh_hash(token),)).fetchone()
-    conn.close()
+    if conn is None:
+        with db_session(s) as conn:
+            row = conn.execute("SELECT token_hash FROM refresh_tokens WHERE token_hash=?", (refresh_hash(token),)).fetchone()
+    else:
+        row = conn.execute("SELECT token_hash FROM refresh_tokens WHERE token_hash=?", (refresh_hash(token),)).fetchone()
     if not row:
         raise HTTPException(status_code=401, detail="Refresh token revoked")
     return user_id
 
 # ---- FastAPI dependency ----
 
-def get_settings() -> Settings:
-    return Settings.load()
-
 def get_current_user_id(
     s: Settings = Depends(get_settings),
     creds: HTTPAuthorizationCredentials = Depends(bearer),
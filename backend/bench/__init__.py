@@ -0,0 +1 @@
+"""Micro-benchmarks. Run from backend/, e.g. ``python -m bench.nearest``."""
@@ -0,0 +1,66 @@
+"""Per-email render cost: full template render (previous mailer) vs. cached shell + code fill-in.
+
+    python -m bench.email_render [--n 20000]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault("KATARA_DATA_DIR", tempfile.mkdtemp(prefix="katara-bench-"))
+
+from jinja2 import Template
+
+from app.services import mailer
+
+ARGS = dict(public_base_url="https://katara.example", contact_email="hola@katara.example",
+            whatsapp_link="https://wa.me/593000000000", terms_url="https://katara.example/terms",
+            privacy_url="https://katara.example/privacy")
+
+def legacy_render(template: Template, code: str) -> str:
+    # What send_otp_email did on every call before templates were pre-rendered.
+    year = __import__("datetime").datetime.utcnow().year
+    return template.render(
+        subject="Verifica tu correo - KataraLM", title="Verificación de correo",
+        body="Gracias por registrarte. Ingresa este código para verificar tu correo y activar tu cuenta.",
+        code=code, cta_url=ARGS["terms_url"], cta_text="Ver términos",
+        logo_url=f"{ARGS['public_base_url']}/brand/KataraLM_logo.png",
+        banner_url=f"{ARGS['public_base_url']}/brand/KataraLM_banner.png",
+        contact_email=ARGS["contact_email"], whatsapp_link=ARGS["whatsapp_link"],
+        terms_url=ARGS["terms_url"], privacy_url=ARGS["privacy_url"], year=year,
+    )
+
+def _per_call_us(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(f"{i % 1000000:06d}")
+    return round((time.perf_counter() - t0) / n * 1e6, 2)
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    args = ap.parse_args()
+
+    with open(os.path.join(mailer.TEMPLATE_DIR, "base.html"), encoding="utf-8") as f:
+        template = Template(f.read())
+    fast = lambda code: mailer.render_otp_email(ARGS["public_base_url"], "verify_email", code, ARGS["contact_email"],
+                                                ARGS["whatsapp_link"], ARGS["terms_url"], ARGS["privacy_url"])[1]
+    assert fast("123456") == legacy_render(template, "123456"), "cached render differs from a full render"
+
+    t0 = time.perf_counter()
+    mailer._otp_shell.cache_clear()
+    fast("000000")
+    first_us = round((time.perf_counter() - t0) * 1e6, 2)
+
+    report = {
+        "emails": args.n,
+        "full_render_us": _per_call_us(lambda c: legacy_render(template, c), args.n),
+        "cached_shell_us": _per_call_us(fast, args.n),
+        "first_render_us": first_us,
+    }
+    report["speedup"] = round(report["full_render_us"] / report["cached_shell_us"], 1)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Serialization time and wire size of a 10k-message history.
+
+    python -m bench.json_history [--messages 10000] [--repeat 5]
+
+"before" is what FastAPI did for get_messages: MessageOut models, response_model validation
+and serialization, then stdlib json in JSONResponse. "after" is plain dicts through
+FastJSONResponse (orjson). Sizes are for identity, gzip and, if the brotli
+package is installed, br at the levels FastJSONResponse uses.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import time
+from typing import Union
+
+os.environ.setdefault("KATARA_DATA_DIR", tempfile.mkdtemp(prefix="katara-bench-"))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.routers.chats import MessageOut, MessagePage
+from app.utils import encoding, fast_json
+
+def _rows(n: int) -> list[dict]:
+    base = "https://katara.example/uploads/blobs/ab/cd/" + "0" * 64
+    rows = []
+    for i in range(n):
+        image = i % 10 == 0
+        rows.append({
+            "id": i + 1, "role": "user" if i % 2 == 0 else "assistant",
+            "content": ("¿Dónde reciclo botellas de plástico en Guayaquil? " if i % 2 == 0 else
+                        "Puedes llevarlas al punto limpio más cercano; enjuágalas y aplástalas antes. ") * (1 + i % 4),
+            "image_url": base + ".jpg" if image else None,
+            "thumb_url": base + ".thumb.jpg" if image else None,
+            "webp_url": base + ".webp" if image else None,
+            "created_at": f"2026-01-01T{(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d}.000000+00:00",
+        })
+    return rows
+
+def _before(rows: list[dict], field) -> bytes:
+    models = [MessageOut(**r) for r in rows]  # what _message_out used to build
+    content = asyncio.run(serialize_response(field=field, response_content=models, is_coroutine=True))
+    return JSONResponse(content).body
+
+def _after(rows: list[dict]) -> bytes:
+    return fast_json.FastJSONResponse(rows).body
+
+def _best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return round(best * 1000, 2)
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=10000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    rows = _rows(args.messages)
+    field = create_response_field(name="Response_history", type_=Union[MessagePage, list[MessageOut]], mode="serialization")
+
+    before, after = _before(rows, field), _after(rows)
+    assert json.loads(before) == json.loads(after), "payloads differ"
+    sizes = {"identity": len(after), "gzip": len(gzip.compress(after, compresslevel=fast_json.GZIP_LEVEL, mtime=0))}
+    if encoding.brotli is not None:
+        sizes["br"] = len(encoding.brotli.compress(after, quality=fast_json.BROTLI_QUALITY))
+    out = {
+        "messages": args.messages,
+        "serialize_ms": {"before": _best_ms(lambda: _before(rows, field), args.repeat),
+                         "after": _best_ms(lambda: _after(rows), args.repeat)},
+        "gzip_ms": _best_ms(lambda: fast_json._encode(after, "gzip"), args.repeat),
+        "bytes": {"before": len(before), **{f"after_{k}": v for k, v in sizes.items()}},
+    }
+    out["speedup"] = round(out["serialize_ms"]["before"] / max(out["serialize_ms"]["after"], 1e-3), 1)
+    print(json.dumps(out, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+"""End-to-end load test: the real app in a subprocess against local provider stubs.
+
+    python -m bench.load [--scenarios login_storm,chat_images,points_browsing,register_verify]
+                         [--concurrency 16] [--iterations 200] [--out report.json] [--baseline old.json]
+
+Every scenario gets a fresh app and KATARA_DATA_DIR, so results do not depend on the order
+they run in. Groq, Resend and ArcGIS are served by stubs with configurable latency and error
+rate (``--groq-latency-ms``, ``--resend-error-rate``...). The report is JSON with throughput and
+p50/p95/p99 per route and the git commit it ran on; with ``--baseline`` it also carries the
+relative change against an earlier report.
+"""
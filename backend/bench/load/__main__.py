@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+from app.utils.passwords import DEFAULT_ROUNDS
+
+from . import scenarios
+from .report import compare
+from .stubs import StubConfig, start_all
+from .target import BACKEND_DIR, Target
+
+def _commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+def _env_pair(value: str) -> tuple[str, str]:
+    key, sep, val = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError("se espera KEY=VALUE")
+    return key, val
+
+def main() -> None:
+    ap = argparse.ArgumentParser(prog="python -m bench.load")
+    ap.add_argument("--scenarios", default=",".join(scenarios.SCENARIOS))
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--iterations", type=int, default=200, help="per scenario")
+    for name, latency in (("groq", 800), ("resend", 150), ("arcgis", 120)):
+        ap.add_argument(f"--{name}-latency-ms", type=float, default=latency)
+        ap.add_argument(f"--{name}-error-rate", type=float, default=0.0)
+    ap.add_argument("--groq-token-delay-ms", type=float, default=20)
+    ap.add_argument("--bcrypt-rounds", type=int, default=DEFAULT_ROUNDS)
+    ap.add_argument("--env", type=_env_pair, action="append", default=[], metavar="KEY=VALUE",
+                    help="extra settings for the app under test")
+    ap.add_argument("--out", help="write the JSON report here as well as to stdout")
+    ap.add_argument("--baseline", help="earlier report to compare against")
+    ap.add_argument("--keep-data", action="store_true", help="keep each scenario's KATARA_DATA_DIR")
+    args = ap.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in scenarios.SCENARIOS]
+    if unknown:
+        ap.error(f"escenarios desconocidos: {', '.join(unknown)}")
+    configs = {
+        name: StubConfig(getattr(args, f"{name}_latency_ms"), getattr(args, f"{name}_error_rate"))
+        for name in ("groq", "resend", "arcgis")
+    }
+    configs["groq"].token_delay_ms = args.groq_token_delay_ms
+    env = {"BCRYPT_ROUNDS": str(args.bcrypt_rounds), **dict(args.env)}
+
+    report = {
+        "commit": _commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {"concurrency": args.concurrency, "iterations": args.iterations, "env": env,
+                   "stubs": {k: vars(v) for k, v in configs.items()}},
+        "scenarios": {},
+        "stubs": {},
+    }
+    for name in names:
+        stubs = start_all(**configs)
+        target = Target(stubs, env, keep_data=args.keep_data)
+        try:
+            target.start()
+            print(f"{name}: {args.iterations} iteraciones, concurrencia {args.concurrency}", file=sys.stderr)
+            report["scenarios"][name] = asyncio.run(
+                scenarios.run(name, target, stubs, args.concurrency, args.iterations, args.bcrypt_rounds))
+            report["stubs"][name] = {k: s.summary() for k, s in stubs.items()}
+        finally:
+            target.stop()
+            for s in stubs.values():
+                s.stop()
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["baseline_commit"] = baseline.get("commit")
+        report["delta"] = compare(baseline, report)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    main()
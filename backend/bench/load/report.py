@@ -0,0 +1,69 @@
+"""Per-route latency samples and the JSON summary."""
+import math
+import time
+from collections import defaultdict
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    # Nearest rank: the value below which p% of the samples fall.
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: dict[str, int] = defaultdict(int)
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, route: str, seconds: float, status, ok: bool) -> None:
+        self.latencies[route].append(seconds)
+        self.statuses[route][str(status)] += 1
+        if not ok:
+            self.errors[route] += 1
+
+    def stop(self) -> None:
+        self.finished = time.perf_counter()
+
+    def summary(self) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        routes = {}
+        for route in sorted(self.latencies):
+            values = sorted(self.latencies[route])
+            routes[route] = {
+                "count": len(values),
+                "errors": self.errors.get(route, 0),
+                "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+                "status": dict(self.statuses[route]),
+            }
+        total = sum(r["count"] for r in routes.values())
+        return {
+            "duration_s": round(elapsed, 3),
+            "requests": total,
+            "errors": sum(r["errors"] for r in routes.values()),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "routes": routes,
+        }
+
+def compare(baseline: dict, current: dict) -> dict:
+    """Relative change of throughput and p95/p99 per scenario and route (positive = slower/more)."""
+    out = {}
+    for name, scen in current.get("scenarios", {}).items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        rows = {"throughput_rps": _delta(base["throughput_rps"], scen["throughput_rps"])}
+        for route, r in scen["routes"].items():
+            b = base["routes"].get(route)
+            if b:
+                rows[route] = {k: _delta(b[k], r[k]) for k in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")}
+        out[name] = rows
+    return out
+
+def _delta(before: float, after: float):
+    return None if not before else round((after - before) / before, 4)
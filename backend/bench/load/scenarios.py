@@ -0,0 +1,203 @@
+"""Load scenarios. Each has an untimed setup and a step run ``iterations`` times across workers."""
+import asyncio
+import io
+import random
+import re
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import httpx
+from PIL import Image
+
+from app.utils.passwords import DEFAULT_ROUNDS, hash_password
+
+from .report import Recorder
+from .target import ADMIN_KEY, PEPPER, Target
+
+PASSWORD = "bench-password-1"
+_CODE = re.compile(r'data-code="(\d{6})"')
+# Guayaquil, where the ArcGIS stub puts every address.
+_WEST, _SOUTH, _EAST, _NORTH = -79.98, -2.28, -79.82, -2.07
+
+@dataclass
+class Context:
+    client: httpx.AsyncClient
+    target: Target
+    stubs: dict
+    rec: Recorder
+    rounds: int = DEFAULT_ROUNDS
+    users: list[str] = field(default_factory=list)
+    tokens: list[str] = field(default_factory=list)
+    images: list[bytes] = field(default_factory=list)
+    etags: dict[int, str] = field(default_factory=dict)
+
+    def auth(self, worker: int) -> dict:
+        return {"Authorization": "Bearer " + self.tokens[worker % len(self.tokens)]}
+
+async def call(ctx: Context, route: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+    """One timed request, recorded under ``route`` (the template, not the concrete URL)."""
+    t0 = time.perf_counter()
+    try:
+        r = await ctx.client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        ctx.rec.add(route, time.perf_counter() - t0, type(e).__name__, ok=False)
+        return None
+    ctx.rec.add(route, time.perf_counter() - t0, r.status_code, ok=r.status_code < 400)
+    return r
+
+async def stream(ctx: Context, route: str, url: str, **kwargs) -> None:
+    """A timed SSE request, to its last event. Failed unless it streamed tokens and ended without an error event."""
+    t0 = time.perf_counter()
+    try:
+        async with ctx.client.stream("POST", url, **kwargs) as r:
+            events = [line[7:] async for line in r.aiter_lines() if line.startswith("event: ")]
+    except httpx.HTTPError as e:
+        ctx.rec.add(route, time.perf_counter() - t0, type(e).__name__, ok=False)
+        return
+    status = r.status_code
+    if status < 400 and ("token" not in events or "error" in events):
+        status = "sse_error" if "error" in events else "sse_no_tokens"
+    ctx.rec.add(route, time.perf_counter() - t0, status, ok=status == 200)
+
+def _create_users(ctx: Context, n: int) -> list[str]:
+    """Verified users straight into SQLite: registering them through the API is its own scenario."""
+    pw_hash = hash_password(PASSWORD, PEPPER, ctx.rounds)
+    now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+    names = [f"load_{uuid.uuid4().hex[:12]}" for _ in range(n)]
+    conn = sqlite3.connect(ctx.target.db_path(), timeout=30)
+    try:
+        conn.executemany(
+            "INSERT INTO users(email,username,password_hash,bio,is_verified,created_at,updated_at) VALUES(?,?,?,?,?,?,?)",
+            [(f"{u}@example.com", u, pw_hash, "", 1, now, now) for u in names],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return names
+
+async def _login_all(ctx: Context, names: list[str]) -> None:
+    for u in names:
+        r = await ctx.client.post("/auth/login", json={"identifier": u, "password": PASSWORD})
+        r.raise_for_status()
+        ctx.tokens.append(r.json()["access_token"])
+
+def _jpeg(seed: int) -> bytes:
+    rnd = random.Random(seed)
+    img = Image.new("RGB", (640, 480), tuple(rnd.randrange(256) for _ in range(3)))
+    for _ in range(20):
+        x, y = rnd.randrange(600), rnd.randrange(440)
+        img.paste(tuple(rnd.randrange(256) for _ in range(3)), (x, y, x + 40, y + 40))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+# login_storm: many users signing in at once (bcrypt pool and queue).
+
+async def login_setup(ctx: Context, workers: int) -> None:
+    ctx.users = _create_users(ctx, max(workers, 1))
+
+async def login_step(ctx: Context, worker: int, i: int) -> None:
+    await call(ctx, "POST /auth/login", "POST", "/auth/login",
+               json={"identifier": ctx.users[i % len(ctx.users)], "password": PASSWORD})
+
+# chat_images: text and photo questions (LLM and vision stubs, uploads, thumbnails), a streamed
+# follow-up (SSE), then history.
+
+async def chat_setup(ctx: Context, workers: int) -> None:
+    await _login_all(ctx, _create_users(ctx, max(workers, 1)))
+    # A small pool, so repeated photos also exercise the content-addressed store and vision cache.
+    ctx.images = [_jpeg(n) for n in range(16)]
+
+async def chat_step(ctx: Context, worker: int, i: int) -> None:
+    files = None
+    if i % 2:
+        files = {"image": (f"foto{i}.jpg", ctx.images[i % len(ctx.images)], "image/jpeg")}
+    await call(ctx, "POST /chats/default/message", "POST", "/chats/default/message",
+               data={"text": f"¿Dónde reciclo esto? ({i})"}, files=files, headers=ctx.auth(worker))
+    await stream(ctx, "POST /chats/default/message/stream", "/chats/default/message/stream",
+                 data={"text": f"¿Y cómo lo preparo? ({i})"}, headers=ctx.auth(worker))
+    await call(ctx, "GET /chats/default/history", "GET", "/chats/default/history",
+               params={"limit": 50}, headers={**ctx.auth(worker), "Accept-Encoding": "gzip"})
+
+# points_browsing: catalogue, map pans/zooms and nearest points.
+
+async def points_setup(ctx: Context, workers: int) -> None:
+    await _login_all(ctx, _create_users(ctx, max(workers, 1)))
+    # Geocode the seed catalogue through the ArcGIS stub so bbox and nearest have points to return.
+    params = {"admin_key": ADMIN_KEY}
+    (await ctx.client.post("/points/geocode-missing", params=params, headers=ctx.auth(0))).raise_for_status()
+    while True:
+        job = (await ctx.client.get("/points/geocode-missing", params=params, headers=ctx.auth(0))).json().get("job")
+        if not job or job["finished_at"]:
+            break
+        await asyncio.sleep(0.2)
+
+async def points_step(ctx: Context, worker: int, i: int) -> None:
+    rnd = random.Random(i)
+    headers = ctx.auth(worker)
+    etag = ctx.etags.get(worker)
+    r = await call(ctx, "GET /points", "GET", "/points", headers={**headers, **({"If-None-Match": etag} if etag else {})})
+    if r is not None and r.status_code == 200:
+        ctx.etags[worker] = r.headers.get("etag")
+    zoom = rnd.choice((11, 12, 13, 14, 15))
+    span = 0.02 * 2 ** (15 - zoom) / 2
+    lon, lat = rnd.uniform(_WEST, _EAST), rnd.uniform(_SOUTH, _NORTH)
+    bbox = f"{lon - span:.5f},{lat - span / 2:.5f},{lon + span:.5f},{lat + span / 2:.5f}"
+    await call(ctx, "GET /points?bbox", "GET", "/points", params={"bbox": bbox, "zoom": zoom}, headers=headers)
+    await call(ctx, "GET /points/nearest", "GET", "/points/nearest",
+               params={"lat": f"{lat:.5f}", "lon": f"{lon:.5f}", "k": 10}, headers=headers)
+
+# register_verify: sign-up, OTP mail through the outbox and Resend stub, verification, first login.
+
+async def register_setup(ctx: Context, workers: int) -> None:
+    pass
+
+async def register_step(ctx: Context, worker: int, i: int) -> None:
+    name = f"reg_{i}_{uuid.uuid4().hex[:10]}"
+    email = f"{name}@example.com"
+    r = await call(ctx, "POST /auth/register", "POST", "/auth/register",
+                   json={"email": email, "username": name, "password": PASSWORD})
+    if r is None or r.status_code != 200:
+        return
+    # Time until the code reaches the inbox: outbox pickup, rendering, provider latency and retries.
+    t0 = time.perf_counter()
+    code = None
+    while time.perf_counter() - t0 < 60:
+        messages = ctx.stubs["resend"].messages(email)
+        if messages:
+            code = _CODE.search(messages[-1]["html"])
+            break
+        await asyncio.sleep(0.05)
+    ctx.rec.add("(mail) verify_email", time.perf_counter() - t0, 200 if code else "timeout", ok=code is not None)
+    if code is None:
+        return
+    r = await call(ctx, "POST /auth/verify-email", "POST", "/auth/verify-email", json={"email": email, "code": code.group(1)})
+    if r is None or r.status_code != 200:
+        return
+    await call(ctx, "POST /auth/login", "POST", "/auth/login", json={"identifier": email, "password": PASSWORD})
+
+SCENARIOS = {
+    "login_storm": (login_setup, login_step),
+    "chat_images": (chat_setup, chat_step),
+    "points_browsing": (points_setup, points_step),
+    "register_verify": (register_setup, register_step),
+}
+
+async def run(name: str, target: Target, stubs: dict, concurrency: int, iterations: int, rounds: int) -> dict:
+    setup, step = SCENARIOS[name]
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=target.base_url, timeout=120, limits=limits) as client:
+        ctx = Context(client=client, target=target, stubs=stubs, rec=Recorder(), rounds=rounds)
+        await setup(ctx, concurrency)
+        counter = iter(range(iterations))
+
+        async def worker(w: int) -> None:
+            for i in counter:  # shared: workers pull the next iteration until none are left
+                await step(ctx, w, i)
+
+        ctx.rec = Recorder()  # time only the steps
+        await asyncio.gather(*(worker(w) for w in range(concurrency)))
+        ctx.rec.stop()
+    return ctx.rec.summary()
@@ -0,0 +1,178 @@
+"""Local stand-ins for Groq, Resend and ArcGIS with configurable latency and error rates.
+
+Each stub is a stdlib ThreadingHTTPServer on 127.0.0.1 in a daemon thread of the bench process,
+so a slow "provider" never costs CPU in the app under test. Latency is uniform in
+[0.5, 1.5] x latency_ms; an injected error is a 5xx after the same delay.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 200.0
+    error_rate: float = 0.0
+    token_delay_ms: float = 20.0  # between streamed chat tokens (Groq only)
+
+@dataclass
+class StubStats:
+    requests: int = 0
+    injected_errors: int = 0
+    by_kind: dict = field(default_factory=dict)
+
+class _Stub:
+    name = ""
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.stats = StubStats()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"stub-{self.name}", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "_Stub":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, kind: str) -> bool:
+        """Sleep the configured latency; True when this request should fail."""
+        c = self.config
+        time.sleep(max(0.0, c.latency_ms * random.uniform(0.5, 1.5)) / 1000)
+        fail = random.random() < c.error_rate
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.injected_errors += fail
+            self.stats.by_kind[kind] = self.stats.by_kind.get(kind, 0) + 1
+        return fail
+
+    def handle(self, req: BaseHTTPRequestHandler) -> None:
+        raise NotImplementedError
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.handle(self)
+
+            def do_POST(self):
+                stub.handle(self)
+
+        return Handler
+
+    def summary(self) -> dict:
+        return {"url": self.base_url, "latency_ms": self.config.latency_ms, "error_rate": self.config.error_rate,
+                "requests": self.stats.requests, "injected_errors": self.stats.injected_errors, "by_kind": self.stats.by_kind}
+
+def _read_json(req: BaseHTTPRequestHandler) -> dict:
+    length = int(req.headers.get("Content-Length") or 0)
+    return json.loads(req.rfile.read(length) or b"{}")
+
+def _send_json(req: BaseHTTPRequestHandler, status: int, obj) -> None:
+    body = json.dumps(obj).encode("utf-8")
+    req.send_response(status)
+    req.send_header("Content-Type", "application/json")
+    req.send_header("Content-Length", str(len(body)))
+    req.end_headers()
+    req.wfile.write(body)
+
+VISION_ANSWER = json.dumps({
+    "material": "plástico PET", "categoria": "plastico", "reciclable": True,
+    "como_preparar": "Enjuagar y aplastar.", "riesgos": "Ninguno.",
+    "recomendacion": "Llevar a un punto limpio.", "palabras_clave": ["botella", "pet"],
+}, ensure_ascii=False)
+CHAT_TOKENS = ["Puedes ", "llevarlo ", "al ", "punto ", "limpio ", "más ", "cercano ", "en ", "Guayaquil."]
+
+class GroqStub(_Stub):
+    """OpenAI-compatible /chat/completions: plain, streamed (SSE) and vision requests."""
+    name = "groq"
+    path = "/openai/v1/chat/completions"
+
+    def handle(self, req):
+        payload = _read_json(req)
+        content = payload.get("messages", [{}])[-1].get("content")
+        kind = "vision" if isinstance(content, list) else "stream" if payload.get("stream") else "chat"
+        if self._count(kind):
+            return _send_json(req, 503, {"error": {"message": "stub overloaded"}})
+        if kind != "stream":
+            answer = VISION_ANSWER if kind == "vision" else "".join(CHAT_TOKENS)
+            return _send_json(req, 200, {"choices": [{"message": {"role": "assistant", "content": answer}}]})
+        req.send_response(200)
+        req.send_header("Content-Type", "text/event-stream")
+        req.send_header("Transfer-Encoding", "chunked")
+        req.end_headers()
+
+        def chunk(data: bytes) -> None:
+            req.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            req.wfile.flush()
+
+        for tok in CHAT_TOKENS:
+            chunk(("data: " + json.dumps({"choices": [{"delta": {"content": tok}}]}) + "\n\n").encode())
+            time.sleep(self.config.token_delay_ms / 1000)
+        chunk(b"data: [DONE]\n\n")
+        req.wfile.write(b"0\r\n\r\n")
+
+class ResendStub(_Stub):
+    """POST /emails. Delivered messages are kept in an inbox so scenarios can read OTP codes."""
+    name = "resend"
+    path = "/emails"
+
+    def __init__(self, config: StubConfig):
+        super().__init__(config)
+        self.inbox: dict[str, list[dict]] = {}
+        self.idempotency_keys: set[str] = set()
+
+    def handle(self, req):
+        payload = _read_json(req)
+        if self._count("email"):
+            return _send_json(req, 500, {"message": "stub failure"})
+        key = req.headers.get("Idempotency-Key")
+        with self._lock:
+            duplicate = key is not None and key in self.idempotency_keys
+            if key is not None:
+                self.idempotency_keys.add(key)
+            if not duplicate:
+                for to in payload.get("to") or []:
+                    self.inbox.setdefault(to.lower(), []).append({"subject": payload.get("subject"), "html": payload.get("html", ""),
+                                                                  "received": time.monotonic()})
+        _send_json(req, 200, {"id": str(uuid.uuid4())})
+
+    def messages(self, email: str) -> list[dict]:
+        with self._lock:
+            return list(self.inbox.get(email.lower(), []))
+
+class ArcGISStub(_Stub):
+    """findAddressCandidates: a deterministic location inside Guayaquil for every address."""
+    name = "arcgis"
+    path = "/arcgis/rest/services/World/GeocodeServer/findAddressCandidates"
+
+    def handle(self, req):
+        query = parse_qs(urlparse(req.path).query)
+        if self._count("geocode"):
+            return _send_json(req, 500, {"error": {"code": 500}})
+        address = (query.get("singleLine") or [""])[0]
+        rnd = random.Random(address)
+        location = {"x": -79.95 + rnd.uniform(0, 0.1), "y": -2.25 + rnd.uniform(0, 0.15)}
+        _send_json(req, 200, {"candidates": [{"address": address, "location": location, "score": 100}]})
+
+def start_all(groq: StubConfig, resend: StubConfig, arcgis: StubConfig) -> dict[str, _Stub]:
+    return {"groq": GroqStub(groq).start(), "resend": ResendStub(resend).start(), "arcgis": ArcGISStub(arcgis).start()}
@@ -0,0 +1,92 @@
+"""/points/nearest: grid index vs. the previous full-scan Python loop over synthetic points.
+
+    python -m bench.nearest [--points 100000] [--queries 500] [--k 10]
+"""
+import argparse
+import json
+import math
+import random
+import time
+
+from app.services.spatial import PointIndex
+
+CATEGORIES = ["centro_acopio", "punto_limpio", "reciclaje", "electronicos"]
+# Greater Guayaquil, roughly
+LAT_RANGE = (-2.35, -2.0)
+LON_RANGE = (-80.05, -79.75)
+
+def synthetic_points(n: int, rng: random.Random) -> list[dict]:
+    rows = []
+    for i in range(n):
+        located = rng.random() > 0.01
+        rows.append({
+            "id": i + 1, "name": f"Punto {i + 1}", "address": f"Calle {i % 500} y Av. {i % 97}",
+            "lat": rng.uniform(*LAT_RANGE) if located else None,
+            "lon": rng.uniform(*LON_RANGE) if located else None,
+            "category": rng.choice(CATEGORIES), "notes": "", "source_url": "",
+        })
+    return rows
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = math.radians(lat2 - lat1), math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+def full_scan(rows, lat, lon, k, category=None, max_km=None):
+    scored = []
+    for r in rows:
+        if category is not None and r["category"] != category:
+            continue
+        if r["lat"] is None:
+            continue
+        d = _haversine_km(lat, lon, r["lat"], r["lon"])
+        if max_km is None or d <= max_km:
+            scored.append((d, r["id"]))
+    scored.sort()
+    return scored[:k]
+
+def _timed(fn, queries) -> list[float]:
+    out = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(*q)
+        out.append(time.perf_counter() - t0)
+    return out
+
+def _summary(samples: list[float]) -> dict:
+    s = sorted(samples)
+    pick = lambda p: round(s[min(len(s) - 1, int(p * len(s)))] * 1000, 3)
+    return {"mean_ms": round(sum(s) / len(s) * 1000, 3), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--points", type=int, default=100_000)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = synthetic_points(args.points, rng)
+    t0 = time.perf_counter()
+    index = PointIndex(rows)
+    build_s = time.perf_counter() - t0
+
+    queries = []
+    for i in range(args.queries):
+        category = rng.choice(CATEGORIES) if i % 3 == 0 else None
+        max_km = 2.0 if i % 5 == 0 else None
+        queries.append((rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE), args.k, category, max_km))
+
+    indexed = _timed(index.nearest, queries)
+    scanned = _timed(lambda *q: full_scan(rows, *q), queries[: max(20, args.queries // 20)])
+    report = {
+        "points": args.points, "cells": len(index.cells), "k": args.k, "build_s": round(build_s, 3),
+        "indexed": _summary(indexed), "full_scan": _summary(scanned),
+    }
+    report["speedup_p50"] = round(report["full_scan"]["p50_ms"] / max(report["indexed"]["p50_ms"], 1e-6), 1)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
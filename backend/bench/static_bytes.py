@@ -0,0 +1,106 @@
+"""Bytes on the wire for /brand and /uploads: plain StaticFiles (before) vs CachedStaticFiles.
+
+    python -m bench.static_bytes [--launches 10] [--images 30]
+
+A client loads every brand SVG and a chat history's images once per app launch, through a small
+HTTP cache: a response is reused without a request while fresh (max-age), otherwise revalidated
+with If-None-Match. "no cache" is the WebView re-downloading everything on each launch.
+All launches fall within the brand max-age (one day).
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+from starlette.testclient import TestClient
+
+from app.build_assets import build
+from app.utils.static import CachedStaticFiles, brand_cache_control, upload_cache_control
+
+BRAND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "brand")
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+def _fixture(images: int) -> tuple[str, str, list[str]]:
+    root = tempfile.mkdtemp(prefix="katara-static-")
+    brand = os.path.join(root, "brand")
+    shutil.copytree(BRAND_DIR, brand, ignore=shutil.ignore_patterns("*.gz", "*.br"))
+    build(brand)
+    uploads = os.path.join(root, "uploads")
+    urls = [f"/brand/{n}" for n in sorted(os.listdir(brand)) if n.endswith(".svg")]
+    for i in range(images):
+        body = os.urandom(150_000 + i * 1000)  # photos: already compressed, sizes vary
+        digest = hashlib.sha256(body).hexdigest()
+        rel = f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+        os.makedirs(os.path.join(uploads, os.path.dirname(rel)), exist_ok=True)
+        with open(os.path.join(uploads, rel), "wb") as f:
+            f.write(body)
+        urls.append(f"/uploads/{rel}")
+    return brand, uploads, urls
+
+def _app(brand: str, uploads: str, cached: bool) -> Starlette:
+    if not cached:
+        return Starlette(routes=[Mount("/brand", StaticFiles(directory=brand)), Mount("/uploads", StaticFiles(directory=uploads))])
+    return Starlette(routes=[
+        Mount("/brand", CachedStaticFiles(directory=brand, cache_control=brand_cache_control, precompressed=True)),
+        Mount("/uploads", CachedStaticFiles(directory=uploads, cache_control=upload_cache_control)),
+    ])
+
+def _wire_bytes(r) -> int:
+    # Status line + headers + body as sent (compressed when Content-Encoding is set).
+    return 17 + sum(len(k) + len(v) + 4 for k, v in r.headers.items()) + r.num_bytes_downloaded
+
+def run(client: TestClient, urls: list[str], launches: int, use_cache: bool) -> dict:
+    cache: dict[str, tuple[str, bool]] = {}  # url -> (etag, fresh)
+    total = requests = full = 0
+    for _ in range(launches):
+        for url in urls:
+            headers = {"accept-encoding": "gzip, br"}
+            if use_cache and url in cache:
+                etag, fresh = cache[url]
+                if fresh:
+                    continue
+                headers["if-none-match"] = etag
+            r = client.get(url, headers=headers)
+            requests += 1
+            total += _wire_bytes(r)
+            full += r.status_code == 200
+            m = _MAX_AGE.search(r.headers.get("cache-control", ""))
+            if r.status_code == 200:
+                cache[url] = (r.headers.get("etag", ""), bool(m and int(m.group(1)) > 0))
+    return {"requests": requests, "full_responses": full, "bytes": total}
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--launches", type=int, default=10)
+    ap.add_argument("--images", type=int, default=30)
+    args = ap.parse_args()
+    brand, uploads, urls = _fixture(args.images)
+    try:
+        before = TestClient(_app(brand, uploads, cached=False))
+        after = TestClient(_app(brand, uploads, cached=True))
+        out = {
+            "urls": len(urls), "launches": args.launches,
+            "before_no_cache": run(before, urls, args.launches, use_cache=False),
+            "before_revalidate": run(before, urls, args.launches, use_cache=True),
+            "after": run(after, urls, args.launches, use_cache=True),
+        }
+        out["saved_vs_no_cache"] = round(1 - out["after"]["bytes"] / out["before_no_cache"]["bytes"], 4)
+        # Resuming an interrupted download of the largest image from its midpoint.
+        big = max((u for u in urls if u.startswith("/uploads/")), key=lambda u: os.path.getsize(os.path.join(uploads, u[len("/uploads/"):])))
+        size = os.path.getsize(os.path.join(uploads, big[len("/uploads/"):]))
+        r_before = before.get(big, headers={"range": f"bytes={size // 2}-"})
+        r_after = after.get(big, headers={"range": f"bytes={size // 2}-"})
+        out["resume_half"] = {"before": {"status": r_before.status_code, "bytes": len(r_before.content)},
+                              "after": {"status": r_after.status_code, "bytes": len(r_after.content)}}
+        print(json.dumps(out, indent=2))
+    finally:
+        shutil.rmtree(os.path.dirname(brand), ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
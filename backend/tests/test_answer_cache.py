@@ -0,0 +1,27 @@
+from app.db import init_db
+from app.services.answer_cache import AnswerCache
+from app.settings import Settings
+
+MODEL = "llama-test"
+PROMPT = "system prompt"
+
+def _cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("KATARA_DATA_DIR", str(tmp_path))
+    s = Settings.load()
+    s.ensure_dirs()
+    init_db(s)
+    cache = AnswerCache()
+    cache.store(s, "¿Dónde reciclo las pilas?", MODEL, PROMPT, "En el punto limpio.")
+    cache.store(s, "¿El vidrio es reciclable?", MODEL, PROMPT, "Sí.")
+    return s, cache
+
+def test_paraphrases_hit(tmp_path, monkeypatch):
+    s, cache = _cache(tmp_path, monkeypatch)
+    for q in ("donde puedo reciclar pilas", "donde reciclo mis pilas", "Dónde reciclar pilas"):
+        assert cache.lookup(s, q, MODEL, PROMPT) == "En el punto limpio.", q
+
+def test_negation_and_other_topics_miss(tmp_path, monkeypatch):
+    s, cache = _cache(tmp_path, monkeypatch)
+    for q in ("¿El vidrio no es reciclable?", "¿Dónde reciclo el vidrio?", "¿Dónde reciclo las pilas de litio?"):
+        assert cache.lookup(s, q, MODEL, PROMPT) is None, q
+    assert cache.lookup(s, "¿Dónde reciclo las pilas?", "other-model", PROMPT) is None
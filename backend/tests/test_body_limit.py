@@ -0,0 +1,43 @@
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.testclient import TestClient
+
+from app.utils.body_limit import DETAIL, BodySizeLimit
+
+LIMIT = 1024
+
+def _client():
+    app = FastAPI()
+    app.add_middleware(BodySizeLimit, limit=lambda: LIMIT)
+
+    @app.post("/raw")
+    async def raw(request: Request):
+        return {"size": len(await request.body())}
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return TestClient(app)
+
+def _chunks(total, size=256):
+    # A generator body goes out with Transfer-Encoding: chunked and no Content-Length.
+    for start in range(0, total, size):
+        yield b"x" * min(size, total - start)
+
+def test_oversized_chunked_body_gets_413():
+    r = _client().post("/raw", content=_chunks(LIMIT * 4))
+    assert r.status_code == 413
+    assert r.json() == {"detail": DETAIL}
+
+def test_chunked_body_within_limit_passes():
+    r = _client().post("/raw", content=_chunks(LIMIT))
+    assert r.status_code == 200
+    assert r.json() == {"size": LIMIT}
+
+def test_declared_length_rejected_before_reading():
+    r = _client().post("/raw", content=b"x" * (LIMIT + 1))
+    assert r.status_code == 413
+
+def test_oversized_multipart_gets_413():
+    r = _client().post("/upload", files={"file": ("a.jpg", b"x" * LIMIT * 4, "image/jpeg")})
+    assert r.status_code == 413
@@ -0,0 +1,88 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app.db import init_db
+from app.services import geocoder
+from app.services.arcgis import geocode_single_line_async
+from app.settings import Settings
+
+ADDRESSES = ["Av. 9 de Octubre 100", "Malecón 2000", "Av. 9 de Octubre 100", "Urdesa Central"]
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    monkeypatch.setenv("KATARA_DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("ARCGIS_GEOCODE_URL", "stub")
+    monkeypatch.setenv("GEOCODE_CONCURRENCY", "2")
+    s = Settings.load()
+    s.ensure_dirs()
+    init_db(s)
+    conn = _conn(s)
+    conn.executemany(
+        "INSERT INTO points(name,address,category,updated_at) VALUES(?,?,'pilas','2024-01-01')",
+        [(f"p{i}", a) for i, a in enumerate(ADDRESSES)],
+    )
+    conn.commit()
+    conn.close()
+    return s
+
+def _conn(s):
+    conn = sqlite3.connect(s.db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _run(s, monkeypatch, calls, on_call=None):
+    async def counting(client, query, *args):
+        calls.append(query)
+        if on_call is not None:
+            on_call(query)
+        return await geocode_single_line_async(client, query, *args)
+    monkeypatch.setattr(geocoder, "geocode_single_line_async", counting)
+    job = geocoder.GeocodeJob(retry_misses=False)
+    asyncio.run(job.run(s))
+    return job
+
+def test_job_geocodes_caches_and_resumes(settings, monkeypatch):
+    calls = []
+    job = _run(settings, monkeypatch, calls)
+    assert job.status == "done" and job.error is None
+    assert (job.total, job.done, job.updated, job.from_cache, job.errors) == (3, 3, 4, 0, 0)
+    assert len(calls) == 3  # one request per distinct address
+    conn = _conn(settings)
+    assert conn.execute("SELECT count(*) FROM points WHERE lat IS NULL OR lon IS NULL").fetchone()[0] == 0
+    assert conn.execute("SELECT count(*) FROM geocode_cache WHERE lat IS NOT NULL").fetchone()[0] == 3
+
+    # Lost coordinates come back from the cache, without a request.
+    conn.execute("UPDATE points SET lat=NULL, lon=NULL WHERE name='p1'")
+    conn.commit()
+    calls.clear()
+    job = _run(settings, monkeypatch, calls)
+    assert calls == []
+    assert (job.total, job.done, job.updated, job.from_cache) == (1, 1, 1, 1)
+
+def test_each_address_commits_on_its_own(settings, monkeypatch):
+    seen = []
+
+    def check_progress(query):
+        # Every address finished so far is already committed when the next one starts.
+        conn = _conn(settings)
+        seen.append(conn.execute("SELECT count(*) FROM geocode_cache").fetchone()[0])
+        conn.close()
+
+    monkeypatch.setenv("GEOCODE_CONCURRENCY", "1")
+    s = Settings.load()
+    _run(s, monkeypatch, [], on_call=check_progress)
+    assert seen == [0, 1, 2]
+
+def test_points_edited_meanwhile_are_not_counted(settings, monkeypatch):
+    def edit_by_hand(query):
+        conn = _conn(settings)
+        conn.execute("UPDATE points SET lat=-2.1, lon=-79.9 WHERE name='p1'")
+        conn.commit()
+        conn.close()
+
+    job = _run(settings, monkeypatch, [], on_call=edit_by_hand)
+    assert job.updated == 3
+    conn = _conn(settings)
+    assert tuple(conn.execute("SELECT lat,lon FROM points WHERE name='p1'").fetchone()) == (-2.1, -79.9)
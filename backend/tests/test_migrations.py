@@ -0,0 +1,30 @@
+import sqlite3
+
+from app.migrations import HOT_QUERIES, MIGRATIONS, current_version, explain_hot_queries, migrate
+
+def _conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "katara.sqlite3"))
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def test_fresh_database_reaches_latest_version(tmp_path):
+    conn = _conn(tmp_path)
+    assert migrate(conn) == [v for v, _name, _sql in MIGRATIONS]
+    assert current_version(conn) == len(MIGRATIONS)
+
+def test_hot_queries_use_an_index(tmp_path):
+    conn = _conn(tmp_path)
+    migrate(conn)
+    plans = explain_hot_queries(conn)
+    assert len(plans) == len(HOT_QUERIES)
+    for q in plans:
+        assert not q["full_scan"], f"{q['name']}: {' | '.join(q['plan'])}"
+
+def test_migrate_is_idempotent(tmp_path):
+    conn = _conn(tmp_path)
+    migrate(conn)
+    assert migrate(conn) == []
+    assert current_version(conn) == len(MIGRATIONS)
+    conn.close()
+    # A second connection (a restart) sees the same version and applies nothing.
+    assert migrate(_conn(tmp_path)) == []
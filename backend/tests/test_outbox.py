@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app import settings as settings_module
+from app.db import db_session, init_db
+from app.services import outbox as outbox_module
+from app.services.outbox import OutboxSender, enqueue
+from app.settings import Settings
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    monkeypatch.setenv("KATARA_DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("RESEND_API_KEY", "stub")
+    monkeypatch.setenv("MAIL_MAX_ATTEMPTS", "3")
+    monkeypatch.setenv("MAIL_BACKOFF_BASE", "10")
+    s = Settings.load()
+    s.ensure_dirs()
+    init_db(s)
+    monkeypatch.setattr(settings_module, "_current", s)  # drain_once reads get_settings()
+    with db_session(s) as conn:
+        enqueue(conn, "otp-verify_email-1", "a@example.com", "Código", "<p>123456</p>")
+    return s
+
+def _row(s):
+    with db_session(s) as conn:
+        return dict(conn.execute("SELECT status,attempts,next_attempt_at,last_error FROM email_outbox").fetchone())
+
+def _make_due(s):
+    with db_session(s) as conn:
+        conn.execute("UPDATE email_outbox SET next_attempt_at='2000-01-01T00:00:00+00:00'")
+
+def _drain(sender):
+    async def go():
+        return await sender.drain_once(client=None)
+    return asyncio.run(go())
+
+def test_backoff_then_dead_letter_with_stable_key(settings, monkeypatch):
+    keys = []
+    async def failing(client, api_key, sender, to, subject, html, idempotency_key=None, endpoint=""):
+        keys.append(idempotency_key)
+        raise RuntimeError("provider down")
+    monkeypatch.setattr(outbox_module, "send_email_async", failing)
+    sender = OutboxSender()
+
+    before = datetime.now().astimezone()
+    assert _drain(sender) == 1
+    row = _row(settings)
+    assert (row["status"], row["attempts"]) == ("pending", 1)
+    assert "provider down" in row["last_error"]
+    delay = (datetime.fromisoformat(row["next_attempt_at"]) - before).total_seconds()
+    assert 4 <= delay <= 11  # full jitter over MAIL_BACKOFF_BASE
+    assert _drain(sender) == 0  # not due yet
+
+    _make_due(settings)
+    assert _drain(sender) == 1
+    row = _row(settings)
+    assert (row["status"], row["attempts"]) == ("pending", 2)
+    assert (datetime.fromisoformat(row["next_attempt_at"]) - before).total_seconds() >= 9  # doubled
+
+    _make_due(settings)
+    assert _drain(sender) == 1
+    row = _row(settings)
+    assert (row["status"], row["attempts"]) == ("dead", 3)
+    assert sender.dead == 1
+
+    _make_due(settings)
+    assert _drain(sender) == 0  # dead rows are never claimed again
+    assert len(keys) == 3 and len(set(keys)) == 1
+    assert keys[0].endswith("-otp-verify_email-1")
+
+def test_retry_after_dead_letter_keeps_key(settings, monkeypatch):
+    keys = []
+    async def flaky(client, api_key, sender, to, subject, html, idempotency_key=None, endpoint=""):
+        keys.append(idempotency_key)
+        if len(keys) <= 3:
+            raise RuntimeError("provider down")
+    monkeypatch.setattr(outbox_module, "send_email_async", flaky)
+    sender = OutboxSender()
+    for _ in range(3):
+        _make_due(settings)
+        _drain(sender)
+    assert _row(settings)["status"] == "dead"
+
+    with db_session(settings) as conn:
+        outbox_id = conn.execute("SELECT id FROM email_outbox").fetchone()["id"]
+    assert sender.retry(settings, outbox_id)
+    assert _drain(sender) == 1
+    assert _row(settings)["status"] == "sent"
+    # The provider deduplicates on this key, so a retry can never produce a second email.
+    assert len(keys) == 4 and len(set(keys)) == 1
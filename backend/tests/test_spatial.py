@@ -0,0 +1,75 @@
+import math
+import random
+
+import numpy as np
+
+from app.services.spatial import PointIndex, mercator
+
+def _rows(n: int, seed: int) -> list[dict]:
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        if i % 3 == 0:  # dense city cluster around Guayaquil
+            lat, lon = rnd.uniform(-2.4, -2.0), rnd.uniform(-80.0, -79.7)
+        else:
+            lat, lon = rnd.uniform(-89.9, 89.9), rnd.uniform(-180.0, 180.0)
+        if i % 97 == 0:
+            lon = rnd.choice([180.0, -180.0])  # on the antimeridian
+        rows.append({"id": i, "lat": lat, "lon": lon, "category": rnd.choice("ab")})
+    return rows
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = math.radians(lat2 - lat1), math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+def _brute_nearest(rows, lat, lon, k, category, max_km):
+    scored = []
+    for r in rows:
+        if r["lat"] is None or (category is not None and r["category"] != category):
+            continue
+        d = _haversine_km(lat, lon, r["lat"], r["lon"])
+        if max_km is None or d <= max_km:
+            scored.append((d, r["id"]))
+    return sorted(scored)[:k]
+
+def test_nearest_matches_brute_force():
+    rnd = random.Random(3)
+    rows = _rows(5000, seed=2)
+    for i in range(0, len(rows), 250):
+        rows[i] = dict(rows[i], lat=None, lon=None)  # not geocoded yet
+    index = PointIndex(rows)
+    located = [r for r in rows if r["lat"] is not None]
+    queries = [(-2.19, -79.89), (0.0, 179.99), (12.5, -179.99), (89.5, 10.0), (-89.9, -120.0)]
+    queries += [(p["lat"] + rnd.uniform(-0.01, 0.01), p["lon"]) for p in rnd.sample(located, 30)]
+    queries += [(rnd.uniform(-90, 90), rnd.uniform(-180, 180)) for _ in range(30)]
+    for n, (lat, lon) in enumerate(queries):
+        for k, category, max_km in ((1, None, None), (10, "a", None), (25, None, 300.0), (10, "b", 2.0)):
+            got = index.nearest(lat, lon, k, category, max_km)
+            want = _brute_nearest(rows, lat, lon, k, category, max_km)
+            located_got = [(d, r["id"]) for d, r in got if d is not None]
+            assert [i for _, i in located_got] == [i for _, i in want], (n, lat, lon, k, category, max_km)
+            assert all(abs(a - b) < 1e-6 for (a, _), (b, _) in zip(located_got, want))
+            assert len(got) == len(want)
+    # Short of k located points, the unlocated ones (rows 0 and 250) follow with no distance.
+    got = PointIndex(rows[:300]).nearest(-2.19, -79.89, 400)
+    assert [d is None for d, _ in got] == [False] * 298 + [True] * 2
+
+def test_tile_matches_full_scan():
+    rnd = random.Random(7)
+    rows = _rows(5000, seed=1)
+    index = PointIndex(rows)
+    for zoom in (0, 2, 5, 8, 12, 15):
+        n = 1 << zoom
+        tiles = {(0, 0), (n - 1, n - 1), (0, n - 1), (n - 1, 0)}
+        for p in rnd.sample(rows, 40):
+            mx, my = mercator(p["lat"], p["lon"])
+            tiles.add((int(mx * n), int(my * n)))
+        for x, y in tiles:
+            for category in (None, "a"):
+                mask = (np.floor(index.mx * n) == x) & (np.floor(index.my * n) == y)
+                if category is not None:
+                    mask &= index.category == category
+                expected = [index.rows[i]["id"] for i in np.flatnonzero(mask)]
+                assert [r["id"] for r in index.tile(zoom, x, y, False, category)] == expected, (zoom, x, y, category)
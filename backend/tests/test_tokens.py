@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+from fastapi import HTTPException
+
+from app.db import db_session, init_db
+from app.settings import Settings
+from app.utils import tokens
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    monkeypatch.setenv("KATARA_DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("TOKEN_REVOCATION", "true")
+    s = Settings.load()
+    s.ensure_dirs()
+    init_db(s)
+    # Module-level caches outlive a test's database.
+    tokens._verified.clear()
+    tokens._epochs.clear()
+    with db_session(s) as conn:
+        conn.execute(
+            "INSERT INTO users(email,username,password_hash,bio,is_verified,created_at,updated_at) "
+            "VALUES('a@example.com','alice','x','',1,'2024-01-01','2024-01-01')"
+        )
+    return s
+
+def test_cached_token_rejected_after_logout_all(settings):
+    token = tokens.make_access_token(settings, 1)
+    assert tokens.verify_access_token(settings, token) == 1
+    assert tokens.verify_access_token(settings, token) == 1
+    assert tokens._verified.hits == 1  # second check came from the cache
+
+    with db_session(settings) as conn:
+        tokens.bump_user_epoch(settings, 1, conn)
+
+    with pytest.raises(HTTPException) as exc:
+        tokens.verify_access_token(settings, token)
+    assert exc.value.status_code == 401
+    # A token issued after the bump carries the new epoch.
+    assert tokens.verify_access_token(settings, tokens.make_access_token(settings, 1)) == 1
+
+def test_bump_from_another_process_applies_after_epoch_ttl(settings, monkeypatch):
+    token = tokens.make_access_token(settings, 1)
+    assert tokens.verify_access_token(settings, token) == 1
+
+    # Another worker's logout-all: the row changes, this process's epoch cache does not.
+    conn = sqlite3.connect(settings.db_path)
+    conn.execute("UPDATE users SET token_epoch=token_epoch+1 WHERE id=1")
+    conn.commit()
+    conn.close()
+    assert tokens.verify_access_token(settings, token) == 1
+
+    monkeypatch.setattr(tokens.time, "monotonic", lambda: 1e12)  # past TOKEN_EPOCH_TTL
+    with pytest.raises(HTTPException) as exc:
+        tokens.verify_access_token(settings, token)
+    assert exc.value.status_code == 401
@@ -35,7 +35,7 @@ export async function apiFetch(path, opts={}){
   }
   const body = (!opts.body || isForm) ? opts.body : (typeof opts.body === "string" ? opts.body : JSON.stringify(opts.body));
 
-  const res = await fetch(url, { method, headers, body });
+  const res = await fetch(url, { method, headers, body, signal: opts.signal });
   if(res.status !== 401){
     return res;
   }
@@ -68,6 +68,41 @@ async function refreshAccess(refresh){
   return false;
 }
 
+// POST to a Server-Sent Events endpoint (e.g. /chats/{id}/messages/stream).
+// onEvent(event, data) is called for every "token", "done" and "error" event.
+// Resolves with the data of the final "done" event, or null. Abort with opts.signal.
+export async function apiStream(path, opts={}, onEvent=()=>{}){
+  const res = await apiFetch(path, {...opts, method: opts.method || "POST"});
+  if(!res.ok || !res.body){
+    const j = await json(res);
+    throw new Error(j.detail || "No se pudo enviar.");
+  }
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  let done = null;
+  while(true){
+    const { value, done: eof } = await reader.read();
+    if(eof) break;
+    buf += decoder.decode(value, { stream: true });
+    let sep;
+    while((sep = buf.indexOf("\n\n")) >= 0){
+      const frame = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+      let event = "message", data = "";
+      for(const line of frame.split("\n")){
+        if(line.startsWith("event:")) event = line.slice(6).trim();
+        else if(line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      let payload = null;
+      try { payload = JSON.parse(data); } catch { payload = { raw: data }; }
+      if(event === "done") done = payload;
+      onEvent(event, payload);
+    }
+  }
+  return done;
+}
+
 export async function json(res){
   const t = await res.text();
   try { return JSON.parse(t); } catch { return { raw: t }; }